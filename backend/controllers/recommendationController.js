@@ -6,6 +6,13 @@ const Transaction = require("../models/Transaction");
 
 const ML_ENGINE_URL = "http://127.0.0.1:8000";
 
+// Row -> productId lists of /api/score responses, by catalog fingerprint (a few per retailer)
+const CATALOG_IDS_MAX = 256;
+const catalogIds = new Map();
+
+// Fields of the product cards the ML engine used to render itself
+const CARD_FIELDS = "productId name category price image expiryDate stock";
+
 // Helper to safely convert string → ObjectId
 const toObjectId = (id) => {
   try {
@@ -67,15 +74,88 @@ exports.generateMBA = async (req, res, next) => {
   }
 };
 
+const fetchCatalogIds = async (userId, fingerprint) => {
+  const cached = catalogIds.get(fingerprint);
+  if (cached) return cached;
+
+  const { data } = await axios.get(`${ML_ENGINE_URL}/api/score/${userId}/catalog`);
+  if (catalogIds.size >= CATALOG_IDS_MAX) {
+    catalogIds.delete(catalogIds.keys().next().value);
+  }
+  catalogIds.set(data.catalog, data.ids);
+  // The catalog changed between the two calls: the caller scores again
+  return data.catalog === fingerprint ? data.ids : null;
+};
+
+// Rebuilds the /api/recommend feed shape from scoring arrays and product cards
+const decodeFeed = (scores, ids, cards) => {
+  const card = (row) => cards.get(ids[row]) || { productId: ids[row] };
+  const feed = [];
+  for (let i = 0; i < scores.n; i++) {
+    const rows = scores.rows.slice(scores.offsets[i], scores.offsets[i + 1]);
+    const entry = { score: scores.score[i], isUrgent: Boolean(scores.urgent[i]) };
+    if (scores.kind[i] === 1) {
+      feed.push({
+        type: "bundle",
+        items: rows.map(card),
+        reason: "Frequently bought together",
+        ...entry,
+        metadata: { lift: scores.lift[i], confidence: scores.confidence[i] },
+      });
+    } else {
+      feed.push({ type: "individual", product: card(rows[0]), reason: scores.reason, ...entry });
+    }
+  }
+  const out = { success: true, feed, near_expiry: scores.near_expiry.map(card) };
+  if (scores.fallback) out.fallback = true;
+  return out;
+};
+
 /**
  * @desc    Fetch Hybrid Recommendations from Python Fusion Engine
  * @route   GET /api/recommendations/hybrid
+ *
+ * Uses the compact scoring API (row numbers and scores, no product cards)
+ * and builds the cards from MongoDB here.
  */
 exports.getHybridRecommendations = async (req, res, next) => {
   try {
     const userId = req.user.id;
-    const mlRes = await axios.get(`${ML_ENGINE_URL}/api/recommend/${userId}`);
-    res.json({ success: true, count: mlRes.data.length, data: mlRes.data });
+    const params = {};
+    if (req.query.shopperId) params.shopper_id = req.query.shopperId;
+    if (req.query.cartItems) params.cart_items = req.query.cartItems;
+
+    let scores;
+    let ids = null;
+    for (let attempt = 0; attempt < 2 && !ids; attempt++) {
+      ({ data: scores } = await axios.get(`${ML_ENGINE_URL}/api/score/${userId}`, { params }));
+      ids = await fetchCatalogIds(userId, scores.catalog);
+    }
+    if (!ids) {
+      return res.status(503).json({ success: false, message: "Catalog is changing, retry shortly" });
+    }
+
+    const productIds = [...new Set([...scores.rows, ...scores.near_expiry].map((row) => ids[row]))];
+    const products = await Product.find({ user: userId, productId: { $in: productIds } })
+      .select(CARD_FIELDS)
+      .lean();
+    const cards = new Map(
+      products.map((p) => [
+        p.productId,
+        {
+          productId: p.productId,
+          name: p.name,
+          category: p.category || "General",
+          price: p.price,
+          image: p.image,
+          expiryDate: p.expiryDate || null,
+          stock: p.stock,
+        },
+      ])
+    );
+
+    const data = decodeFeed(scores, ids, cards);
+    res.json({ success: true, count: data.feed.length, data });
   } catch (err) {
     next(err);
   }
@@ -74,6 +74,14 @@ const productSchema = new mongoose.Schema(
       default: 0, // e.g., 20 for 20%
       min: 0,
       max: 100
+    },
+
+    // Gross margin in percent; the ML engine boosts higher-margin items slightly
+    margin: {
+      type: Number,
+      default: 0,
+      min: 0,
+      max: 100
     }
   },
   { 
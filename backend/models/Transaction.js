@@ -55,6 +55,7 @@ const transactionSchema = new mongoose.Schema({
 // Optimized for ML: Fetching all transactions for a specific retailer
 transactionSchema.index({ user: 1, timestamp: -1 });
 transactionSchema.index({ shopperId: 1 });
+transactionSchema.index({ user: 1, shopperId: 1, createdAt: -1 }); // ML engine: one shopper's history per request
 transactionSchema.index({ user: 1, totalAmount: 1 }); // For amount filtering
 transactionSchema.index({ transactionId: 1 }); // For search
 // Prevent duplicate transaction entries
@@ -25,7 +25,9 @@ class CollaborativeBasedEngine:
         # 1. Flatten transactions efficiently
         data = []
         for txn in transactions:
-            u_id = str(txn.get("userId") or txn.get("user", ""))
+            # Rows are shoppers (as in fit_counts and the serving lookups);
+            # "user" on a stored transaction is the retailer, not the buyer.
+            u_id = str(txn.get("userId") or txn.get("shopperId") or "")
             items = txn.get("items") or []
             
             for item in items:
@@ -61,6 +63,33 @@ class CollaborativeBasedEngine:
             columns=self.user_ids
         )
 
+    def fit_counts(self, user_ids: List[str], product_ids: List[str], user_item):
+        """
+        Builds the same model from a pre-aggregated (users x products) count
+        matrix, e.g. a windowed or decayed data.count_store window.
+        Empty rows and columns are dropped.
+        """
+        user_item = user_item.tocsr()
+        rows = np.flatnonzero(user_item.getnnz(axis=1))
+        cols = np.flatnonzero(user_item.getnnz(axis=0))
+        if len(rows) == 0:
+            return
+
+        self.user_item_matrix = pd.DataFrame(
+            user_item[rows][:, cols].toarray(),
+            index=[user_ids[r] for r in rows],
+            columns=[product_ids[c] for c in cols]
+        )
+        self.product_columns = self.user_item_matrix.columns.tolist()
+        self.user_ids = self.user_item_matrix.index.tolist()
+
+        user_sim = cosine_similarity(self.user_item_matrix)
+        self.user_similarity_df = pd.DataFrame(
+            user_sim, 
+            index=self.user_ids, 
+            columns=self.user_ids
+        )
+
     def get_recommendations(self, target_user_id: str, top_n: int = 10) -> Dict[str, float]:
         """
         Vectorized recommendation logic:
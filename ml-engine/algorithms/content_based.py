@@ -80,7 +80,8 @@ class ContentBasedEngine:
             return {}
 
         # 2. Create User Profile Vector (Mean of all history item vectors)
-        user_profile_vector = self.tfidf_matrix[valid_indices].mean(axis=0)
+        # Sparse .mean() returns np.matrix, which cosine_similarity rejects
+        user_profile_vector = np.asarray(self.tfidf_matrix[valid_indices].mean(axis=0))
         
         # 3. Calculate similarity between User Profile and ALL products
         # result: (1 x total_products)
@@ -1,6 +1,8 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import List, Tuple, Dict, Any
 
+import numpy as np
+
 # Configuration
 NEAR_EXPIRY_DAYS = 7 
 MAX_EXPIRY_BOOST = 2.0 
@@ -60,4 +62,21 @@ def apply_expiry_logic(
         else:
             expiry_weights[pid] = 1.0
 
-    return expired_ids, near_expiry_products, expiry_weights
\ No newline at end of file
+    return expired_ids, near_expiry_products, expiry_weights
+
+def expiry_weight_array(expiry_days: np.ndarray, today: date = None) -> np.ndarray:
+    """
+    Vectorized apply_expiry_logic weights for a column of expiry dates
+    (datetime64[D], NaT for products without one).
+    """
+    today = np.datetime64(today or datetime.now(timezone.utc).date(), "D")
+    weights = np.ones(len(expiry_days))
+    known = ~np.isnat(expiry_days)
+    delta_days = (expiry_days[known] - today).astype(np.int64)
+
+    # Linear boost: 0 days -> 2.0x, 7 days -> 1.0x; expired -> 0.0
+    boost = 1.0 + (MAX_EXPIRY_BOOST - 1.0) * (1 - np.maximum(0, delta_days) / NEAR_EXPIRY_DAYS)
+    known_weights = np.where(delta_days <= NEAR_EXPIRY_DAYS, np.round(boost, 3), 1.0)
+    known_weights[delta_days < 0] = 0.0
+    weights[known] = known_weights
+    return weights
@@ -0,0 +1,71 @@
+# ml-engine/algorithms/mba_bundles.py
+# Condensed itemset families and canonical, non-redundant bundles
+
+from itertools import combinations
+from typing import Any, Dict, List, Tuple
+
+
+ITEMSET_FAMILIES = ("all", "closed", "maximal")
+
+
+def closed_itemsets(supports: Dict[Tuple[int, ...], int]) -> Dict[Tuple[int, ...], int]:
+    """Itemsets with no frequent superset of the same support (lossless condensation)."""
+    open_sets = set()
+    for itemset, count in supports.items():
+        if len(itemset) < 2:
+            continue
+        # Checking immediate supersets is enough: support only shrinks as itemsets grow
+        for sub in combinations(itemset, len(itemset) - 1):
+            if supports.get(sub) == count:
+                open_sets.add(sub)
+    return {i: c for i, c in supports.items() if i not in open_sets}
+
+
+def maximal_itemsets(supports: Dict[Tuple[int, ...], int]) -> Dict[Tuple[int, ...], int]:
+    """Itemsets with no frequent superset at all (smallest, lossy condensation)."""
+    covered = set()
+    for itemset in supports:
+        if len(itemset) >= 2:
+            covered.update(combinations(itemset, len(itemset) - 1))
+    return {i: c for i, c in supports.items() if i not in covered}
+
+
+def condense(supports: Dict[Tuple[int, ...], int], family: str = "all") -> Dict[Tuple[int, ...], int]:
+    if family == "closed":
+        return closed_itemsets(supports)
+    if family == "maximal":
+        return maximal_itemsets(supports)
+    if family != "all":
+        raise ValueError(f"itemset family must be one of {ITEMSET_FAMILIES}, got {family!r}")
+    return supports
+
+
+def canonical_bundles(rules: List[Dict[str, Any]], metric: str = "lift", min_improvement: float = 0.0) -> List[Dict[str, Any]]:
+    """
+    Collapses a rule list to one rule per itemset (its best direction by
+    'metric') and drops bundles that a proper sub-bundle matches or beats.
+    Works on any run_mba-shaped output; the result is best-first.
+    """
+    best: Dict[frozenset, Tuple[float, Dict[str, Any]]] = {}
+    for rule in rules:
+        key = frozenset(rule.get("ants", [])) | frozenset(rule.get("cons", []))
+        if len(key) < 2:
+            continue
+        confidence, lift = float(rule.get("confidence", 0)), float(rule.get("lift", 0))
+        score = {"lift": lift, "confidence": confidence}.get(metric, confidence * lift)
+        if key not in best or score > best[key][0]:
+            best[key] = (score, rule)
+
+    margin = 1.0 + min_improvement
+    kept = []
+    for key, (score, rule) in best.items():
+        dominated = any(
+            frozenset(sub) in best and best[frozenset(sub)][0] * margin >= score
+            for size in range(2, len(key))
+            for sub in combinations(key, size)
+        )
+        if not dominated:
+            kept.append((score, rule))
+
+    kept.sort(key=lambda x: x[0], reverse=True)
+    return [rule for _, rule in kept]
@@ -1,120 +1,114 @@
 # ml-engine/algorithms/mba_optimized.py
 # 🚀 OPTIMIZED MBA FOR MILLIONS OF RECORDS
 
-import dask.dataframe as dd
+import logging
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Any
-from mlxtend.frequent_patterns import apriori, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+from algorithms.mba_partitioned import PartitionedMiner
+from algorithms.mba_topk import TopKRuleMiner, top_k_rules
+from config import MBA_WORKERS
+
+logger = logging.getLogger(__name__)
 
 class OptimizedMarketBasketEngine:
     """
-    High-performance MBA using Dask for distributed computing
-    Handles millions of transactions efficiently
+    High-performance MBA: direct top-K rule mining for small data, a
+    partitioned (SON) multi-process miner for millions of transactions.
+    Only the best top_k rules by 'metric' are ever kept; bundles=True keeps
+    one canonical, non-redundant rule per itemset.
     """
     
-    def __init__(self, min_support=0.001, min_confidence=0.1, min_lift=0.5):
+    def __init__(self, min_support=0.001, min_confidence=0.1, min_lift=0.5, n_workers=None, top_k=1000, metric="lift", bundles=False):
         self.min_support = min_support
         self.min_confidence = min_confidence
         self.min_lift = min_lift
+        self.n_workers = n_workers
+        self.top_k = top_k
+        self.metric = metric
+        self.bundles = bundles
         self.rules_df = None
         self.rule_map = {}
 
-    def train_large_dataset(self, transactions: List[Dict[str, Any]], use_dask=True):
+    def train_large_dataset(self, transactions: List[Dict[str, Any]], use_parallel=True):
         """
         Optimized training for large datasets
-        Uses Dask for parallel processing when dataset > 100K transactions
+        Uses the partitioned process-pool miner when dataset > 100K transactions
         """
-        print(f"🔍 Processing {len(transactions)} transactions...")
+        logger.info(f"🔍 Processing {len(transactions)} transactions...")
         
         # Convert to baskets
         baskets = self._preprocess_transactions(transactions)
         
         if not baskets:
-            print("⚠️  No valid baskets found")
+            logger.warning("⚠️  No valid baskets found")
             return []
         
-        print(f"📦 Created {len(baskets)} baskets")
+        logger.info(f"📦 Created {len(baskets)} baskets")
         
-        # Use Dask for large datasets
-        if use_dask and len(baskets) > 100000:
-            return self._train_with_dask(baskets)
+        # Use the partitioned miner for large datasets
+        if use_parallel and len(baskets) > 100000:
+            return self._train_partitioned(baskets)
         else:
             return self._train_standard(baskets)
     
     def _train_standard(self, baskets: List[List[str]]):
         """Standard training for smaller datasets (<100K)"""
-        print("🔧 Using standard processing...")
-        
-        # One-Hot Encoding
-        te = TransactionEncoder()
-        te_array = te.fit(baskets).transform(baskets)
-        df = pd.DataFrame(te_array, columns=te.columns_)
-        
-        # Frequent Itemsets
-        frequent_itemsets = apriori(
-            df, 
-            min_support=self.min_support, 
-            use_colnames=True, 
-            low_memory=True,
-            max_len=3  # Limit to 3-item sets for performance
+        logger.info("🔧 Using standard processing...")
+        
+        miner = TopKRuleMiner(
+            k=self.top_k,
+            metric=self.metric,
+            min_support=self.min_support,
+            min_confidence=self.min_confidence,
+            min_lift=self.min_lift,
+            max_len=3,  # Limit to 3-item sets for performance
+            bundles=self.bundles
         )
+        rules = miner.mine(baskets)
         
-        if frequent_itemsets.empty:
-            print("⚠️  No frequent itemsets found")
+        if not rules:
+            logger.warning("⚠️  No rules found")
             return []
         
-        print(f"📊 Found {len(frequent_itemsets)} frequent itemsets")
-        
-        # Generate Rules
-        rules = association_rules(
-            frequent_itemsets, 
-            metric="lift", 
-            min_threshold=self.min_lift,
-            num_itemsets=len(frequent_itemsets)
-        )
-        
-        # Filter by confidence
-        rules = rules[rules['confidence'] >= self.min_confidence].copy()
-        
-        # Convert frozensets
-        rules["ants"] = rules["antecedents"].apply(lambda x: list(x))
-        rules["cons"] = rules["consequents"].apply(lambda x: list(x))
-        
-        self.rules_df = rules
+        self.rules_df = pd.DataFrame(rules, columns=["ants", "cons", "support", "confidence", "lift"])
         self._build_rule_index()
         
-        print(f"✅ Generated {len(rules)} association rules")
+        logger.info(f"✅ Kept top {len(rules)} association rules by {self.metric}")
         return self.get_sanitized_rules()
     
-    def _train_with_dask(self, baskets: List[List[str]]):
+    def _train_partitioned(self, baskets: List[List[str]]):
         """
-        Dask-based training for massive datasets (>100K transactions)
-        Processes data in parallel chunks
+        Partitioned training for massive datasets (>100K transactions).
+        Shards baskets across a process pool: each worker mines its shard,
+        then a second pass counts the union of candidates exactly (SON).
         """
-        print("🚀 Using Dask parallel processing...")
-        
-        # Convert baskets to DataFrame for Dask
-        basket_data = []
-        for idx, basket in enumerate(baskets):
-            for item in basket:
-                basket_data.append({'transaction_id': idx, 'item': item})
-        
-        # Create Dask DataFrame
-        df = dd.from_pandas(pd.DataFrame(basket_data), npartitions=10)
-        
-        # Group by transaction and aggregate items
-        grouped = df.groupby('transaction_id')['item'].apply(
-            lambda x: list(x), 
-            meta=('item', 'object')
-        ).compute()
-        
-        # Convert back to baskets
-        processed_baskets = grouped.tolist()
-        
-        # Use standard processing on aggregated data
-        return self._train_standard(processed_baskets)
+        logger.info("🚀 Using partitioned parallel processing...")
+
+        miner = PartitionedMiner(min_support=self.min_support, max_len=3, n_workers=self.n_workers)
+        item_ids, supports, n_baskets = miner.mine(baskets)
+
+        if not supports:
+            logger.warning("⚠️  No frequent itemsets found")
+            return []
+
+        logger.info(f"📊 Found {len(supports)} frequent itemsets")
+
+        rules = top_k_rules(
+            item_ids, supports, n_baskets,
+            k=self.top_k,
+            metric=self.metric,
+            min_confidence=self.min_confidence,
+            min_lift=self.min_lift,
+            bundles=self.bundles,
+            itemsets="closed" if self.bundles else "all"
+        )
+
+        self.rules_df = pd.DataFrame(rules, columns=["ants", "cons", "support", "confidence", "lift"])
+        self._build_rule_index()
+
+        logger.info(f"✅ Kept top {len(rules)} association rules by {self.metric}")
+        return self.get_sanitized_rules()
     
     def _preprocess_transactions(self, transactions: List[Dict[str, Any]]) -> List[List[str]]:
         """Fast preprocessing with minimal memory footprint"""
@@ -176,9 +170,7 @@ class OptimizedMarketBasketEngine:
         clean_df = self.rules_df[display_cols].copy()
         clean_df = clean_df.replace([np.inf, -np.inf], np.nan).fillna(0.0)
         
-        # Limit to top 1000 rules to avoid memory issues
-        clean_df = clean_df.nlargest(1000, 'lift')
-        
+        # Already capped to top_k during mining
         return clean_df.to_dict(orient="records")
 
 
@@ -190,10 +182,14 @@ def run_mba_optimized(transactions, **kwargs):
     engine = OptimizedMarketBasketEngine(
         min_support=kwargs.get('min_support', 0.001),
         min_confidence=kwargs.get('min_confidence', 0.1),
-        min_lift=kwargs.get('min_lift', 0.5)
+        min_lift=kwargs.get('min_lift', 0.5),
+        n_workers=kwargs.get('n_workers', MBA_WORKERS),
+        top_k=kwargs.get('top_k', 1000),
+        metric=kwargs.get('metric', 'lift'),
+        bundles=kwargs.get('bundles', False)
     )
     
-    # Use Dask for datasets > 100K
-    use_dask = len(transactions) > 100000
+    # Use the partitioned miner for datasets > 100K
+    use_parallel = len(transactions) > 100000
     
-    return engine.train_large_dataset(transactions, use_dask=use_dask)
+    return engine.train_large_dataset(transactions, use_parallel=use_parallel)
@@ -0,0 +1,355 @@
+# ml-engine/algorithms/mba_partitioned.py
+# Partitioned (SON) frequent itemset mining across a process pool
+
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import MBA_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Below this many baskets the pool start-up costs more than it saves
+MIN_PARALLEL_BASKETS = 50_000
+
+
+# --- Encoding ---
+
+def encode_baskets(baskets: Sequence[Sequence[str]], vocab: Optional[Dict[str, int]] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Encodes baskets as CSR integer arrays.
+    Returns (item_ids, indptr, indices); each basket's codes are unique and sorted.
+    Pass a vocab to keep codes stable across calls (new items are appended to it).
+    """
+    vocab = {} if vocab is None else vocab
+    lengths = np.zeros(len(baskets), dtype=np.int64)
+    flat: List[int] = []
+
+    for b, basket in enumerate(baskets):
+        codes = sorted({vocab.setdefault(item, len(vocab)) for item in basket})
+        flat.extend(codes)
+        lengths[b] = len(codes)
+
+    indptr = np.zeros(len(baskets) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    item_ids = [None] * len(vocab)
+    for item, code in vocab.items():
+        item_ids[code] = item
+    return item_ids, indptr, np.asarray(flat, dtype=np.int32)
+
+
+def decode_itemset(code: int, k: int, n_items: int) -> Tuple[int, ...]:
+    """Inverse of the base-n_items packing used for k-itemset codes."""
+    out = []
+    for _ in range(k):
+        code, item = divmod(int(code), n_items)
+        out.append(item)
+    return tuple(reversed(out))
+
+
+def safe_max_len(max_len: int, n_items: int) -> int:
+    """Longest itemset whose base-n_items packed code still fits in int64."""
+    safe = max_len
+    while safe > 1 and n_items ** safe >= 2 ** 62:
+        safe -= 1
+    if safe != max_len:
+        logger.warning(f"[MBA] {n_items} items: limiting itemsets to length {safe}")
+    return safe
+
+
+# --- Counting kernels (run inside workers) ---
+
+def _combination_counts(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    start: int,
+    end: int,
+    k: int,
+    keep: np.ndarray,
+    n_items: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts every k-combination of 'keep' items in baskets [start, end).
+    Baskets are grouped by (filtered) length so each column combination is
+    one vectorized pass. Returns (packed codes, counts).
+    """
+    lo, hi = indptr[start], indptr[end]
+    items = indices[lo:hi]
+    owner = np.repeat(np.arange(end - start), np.diff(indptr[start:end + 1]))
+
+    # Items coded after 'keep' was built (e.g. unseen in a sample) are never kept
+    mask = np.zeros(len(items), dtype=bool)
+    known = items < len(keep)
+    mask[known] = keep[items[known]]
+    items = items[mask].astype(np.int64)
+    owner = owner[mask]
+
+    lengths = np.bincount(owner, minlength=end - start)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    all_codes, all_counts = [], []
+    for length in np.unique(lengths):
+        if length < k:
+            continue
+        rows = np.nonzero(lengths == length)[0]
+        matrix = items[offsets[rows][:, None] + np.arange(length)]
+
+        group_codes = []
+        for combo in combinations(range(length), k):
+            code = matrix[:, combo[0]].copy()
+            for col in combo[1:]:
+                code *= n_items
+                code += matrix[:, col]
+            group_codes.append(code)
+
+        codes, counts = np.unique(np.concatenate(group_codes), return_counts=True)
+        all_codes.append(codes)
+        all_counts.append(counts)
+
+    if not all_codes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return _merge_counts(all_codes, all_counts)
+
+
+def _merge_counts(codes: List[np.ndarray], counts: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    codes_cat = np.concatenate(codes)
+    counts_cat = np.concatenate(counts)
+    merged, inverse = np.unique(codes_cat, return_inverse=True)
+    return merged, np.bincount(inverse, weights=counts_cat, minlength=len(merged)).astype(np.int64)
+
+
+def _items_in(codes: np.ndarray, k: int, n_items: int) -> np.ndarray:
+    """Boolean mask over item codes: True for items appearing in any of the k-itemset codes."""
+    keep = np.zeros(n_items, dtype=bool)
+    rest = codes.copy()
+    for _ in range(k):
+        rest, item = np.divmod(rest, n_items)
+        keep[item] = True
+    return keep
+
+
+def _load_arrays(paths: Tuple[str, str]) -> Tuple[np.ndarray, np.ndarray]:
+    # Memory-mapped, read-only: every worker shares the parent's pages
+    return np.load(paths[0], mmap_mode="r"), np.load(paths[1], mmap_mode="r")
+
+
+def mine_frequent(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    start: int,
+    end: int,
+    min_support: float,
+    max_len: int,
+    n_items: int
+) -> Dict[int, np.ndarray]:
+    """Level-wise frequent itemsets of baskets [start, end), as {k: sorted packed codes}."""
+    threshold = max(1, int(np.ceil(min_support * (end - start))))
+
+    local: Dict[int, np.ndarray] = {}
+    singles = np.bincount(indices[indptr[start]:indptr[end]], minlength=n_items)
+    frequent = np.nonzero(singles >= threshold)[0].astype(np.int64)
+    local[1] = frequent
+    keep = np.zeros(n_items, dtype=bool)
+    keep[frequent] = True
+
+    for k in range(2, max_len + 1):
+        if keep.sum() < k:
+            break
+        codes, counts = _combination_counts(indptr, indices, start, end, k, keep, n_items)
+        frequent = codes[counts >= threshold]
+        if len(frequent) == 0:
+            break
+        local[k] = frequent
+        keep = _items_in(frequent, k, n_items)
+
+    return local
+
+
+def count_candidates(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    start: int,
+    end: int,
+    candidates: Dict[int, np.ndarray],
+    n_items: int
+) -> Dict[int, np.ndarray]:
+    """Exact counts of sorted packed candidate codes within baskets [start, end)."""
+    out: Dict[int, np.ndarray] = {}
+
+    for k, cand in candidates.items():
+        if k == 1:
+            singles = np.bincount(indices[indptr[start]:indptr[end]], minlength=n_items)
+            out[1] = singles[cand]
+            continue
+        if len(cand) == 0:
+            out[k] = np.zeros(0, dtype=np.int64)
+            continue
+
+        keep = _items_in(cand, k, n_items)
+        codes, counts = _combination_counts(indptr, indices, start, end, k, keep, n_items)
+        pos = np.searchsorted(cand, codes)
+        pos_clipped = np.minimum(pos, len(cand) - 1)
+        hit = cand[pos_clipped] == codes
+        totals = np.zeros(len(cand), dtype=np.int64)
+        np.add.at(totals, pos_clipped[hit], counts[hit])
+        out[k] = totals
+
+    return out
+
+
+def _mine_shard(paths, start: int, end: int, min_support: float, max_len: int, n_items: int) -> Dict[int, np.ndarray]:
+    """Phase 1: locally frequent itemsets of one shard (threshold scaled to the shard size)."""
+    indptr, indices = _load_arrays(paths)
+    return mine_frequent(indptr, indices, start, end, min_support, max_len, n_items)
+
+
+def _count_shard(paths, start: int, end: int, candidates: Dict[int, np.ndarray], n_items: int) -> Dict[int, np.ndarray]:
+    """Phase 2: exact counts of the global candidate itemsets within one shard."""
+    indptr, indices = _load_arrays(paths)
+    return count_candidates(indptr, indices, start, end, candidates, n_items)
+
+
+# --- Miner ---
+
+class PartitionedMiner:
+    """
+    SON-style frequent itemset miner.
+
+    Baskets are encoded once into CSR integer arrays and written to a
+    memory-mapped scratch directory (tmpfs when available). Pass 1 mines each
+    shard with the support threshold scaled to the shard size; the union of
+    locally frequent itemsets is a superset of the globally frequent ones.
+    Pass 2 counts exactly those candidates in every shard and sums them.
+    """
+
+    def __init__(self, min_support: float = 0.001, max_len: int = 3, n_workers: Optional[int] = None, n_shards: Optional[int] = None):
+        self.min_support = min_support
+        self.max_len = max_len
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.n_shards = n_shards
+
+    def mine(self, baskets: Sequence[Sequence[str]]) -> Tuple[List[str], Dict[Tuple[int, ...], int], int]:
+        """Returns (item_ids, {itemset codes: support count}, n_baskets)."""
+        item_ids, indptr, indices = encode_baskets(baskets)
+        n_baskets, n_items = len(baskets), len(item_ids)
+        if n_baskets == 0:
+            return item_ids, {}, 0
+
+        max_len = safe_max_len(self.max_len, n_items)
+
+        n_shards = self.n_shards or max(1, self.n_workers)
+        bounds = np.linspace(0, n_baskets, n_shards + 1, dtype=np.int64)
+        shards = [(int(bounds[i]), int(bounds[i + 1])) for i in range(n_shards) if bounds[i + 1] > bounds[i]]
+
+        scratch = tempfile.mkdtemp(prefix="shopfusion-mba-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        try:
+            paths = (os.path.join(scratch, "indptr.npy"), os.path.join(scratch, "indices.npy"))
+            np.save(paths[0], indptr)
+            np.save(paths[1], indices)
+            del indptr, indices
+
+            use_pool = self.n_workers > 1 and len(shards) > 1 and n_baskets >= MIN_PARALLEL_BASKETS
+            pool = ProcessPoolExecutor(max_workers=min(self.n_workers, len(shards))) if use_pool else None
+            try:
+                candidates = self._phase_one(pool, paths, shards, max_len, n_items)
+                totals = self._phase_two(pool, paths, shards, candidates, n_items)
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        threshold = self.min_support * n_baskets
+        supports: Dict[Tuple[int, ...], int] = {}
+        for k, cand in candidates.items():
+            for code, count in zip(cand.tolist(), totals[k].tolist()):
+                if count >= threshold:
+                    supports[(code,) if k == 1 else decode_itemset(code, k, n_items)] = count
+
+        logger.info(
+            f"[MBA] Partitioned mining: {n_baskets} baskets, {len(shards)} shards, "
+            f"{sum(len(c) for c in candidates.values())} candidates, {len(supports)} frequent itemsets"
+        )
+        return item_ids, supports, n_baskets
+
+    def _map(self, pool, fn, *iterables):
+        if pool is None:
+            return list(map(fn, *iterables))
+        return list(pool.map(fn, *iterables))
+
+    def _phase_one(self, pool, paths, shards, max_len: int, n_items: int) -> Dict[int, np.ndarray]:
+        n = len(shards)
+        local = self._map(
+            pool, _mine_shard,
+            [paths] * n, [s for s, _ in shards], [e for _, e in shards],
+            [self.min_support] * n, [max_len] * n, [n_items] * n
+        )
+        candidates: Dict[int, np.ndarray] = {}
+        for k in range(1, max_len + 1):
+            parts = [l[k] for l in local if k in l]
+            if parts:
+                candidates[k] = np.unique(np.concatenate(parts))
+        return candidates
+
+    def _phase_two(self, pool, paths, shards, candidates, n_items: int) -> Dict[int, np.ndarray]:
+        n = len(shards)
+        partial = self._map(
+            pool, _count_shard,
+            [paths] * n, [s for s, _ in shards], [e for _, e in shards],
+            [candidates] * n, [n_items] * n
+        )
+        return {k: sum(p[k] for p in partial) for k in candidates}
+
+
+def generate_rules(
+    item_ids: List[str],
+    supports: Dict[Tuple[int, ...], int],
+    n_baskets: int,
+    min_confidence: float = 0.0,
+    min_lift: float = 0.0
+) -> List[Dict[str, Any]]:
+    """Association rules from itemset support counts, in the same shape as mlxtend-based run_mba output."""
+    rules = []
+    for itemset, count in supports.items():
+        if len(itemset) < 2:
+            continue
+        support = count / n_baskets
+        for r in range(1, len(itemset)):
+            for ants in combinations(itemset, r):
+                cons = tuple(i for i in itemset if i not in ants)
+                ant_count = supports.get(ants)
+                con_count = supports.get(cons)
+                if not ant_count or not con_count:
+                    continue
+                confidence = count / ant_count
+                lift = confidence / (con_count / n_baskets)
+                if confidence >= min_confidence and lift >= min_lift:
+                    rules.append({
+                        "ants": [item_ids[i] for i in ants],
+                        "cons": [item_ids[i] for i in cons],
+                        "support": support,
+                        "confidence": confidence,
+                        "lift": lift
+                    })
+    return rules
+
+
+def run_mba_partitioned(baskets: Sequence[Sequence[str]], **kwargs) -> List[Dict[str, Any]]:
+    miner = PartitionedMiner(
+        min_support=kwargs.get("min_support", 0.001),
+        max_len=kwargs.get("max_len", 3),
+        n_workers=kwargs.get("n_workers", MBA_WORKERS)
+    )
+    item_ids, supports, n_baskets = miner.mine(baskets)
+    return generate_rules(
+        item_ids, supports, n_baskets,
+        min_confidence=kwargs.get("min_confidence", 0.1),
+        min_lift=kwargs.get("min_lift", 0.5)
+    )
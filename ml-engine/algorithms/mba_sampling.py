@@ -0,0 +1,261 @@
+# ml-engine/algorithms/mba_sampling.py
+# Approximate (Toivonen sampling) frequent itemset mining for very large retailers
+
+import logging
+import math
+import random
+import time
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from algorithms.mba_partitioned import (
+    PartitionedMiner,
+    count_candidates,
+    decode_itemset,
+    encode_baskets,
+    generate_rules,
+    mine_frequent,
+    safe_max_len,
+)
+from algorithms.mba_topk import top_k_rules
+from algorithms.preprocess import preprocess_transactions
+
+logger = logging.getLogger(__name__)
+
+# Baskets encoded and counted per step of the verification pass
+CHUNK_SIZE = 100_000
+
+
+def required_sample_size(min_support: float, epsilon: float, delta: float) -> int:
+    """
+    Sample size for which an itemset with true support >= min_support falls
+    below the lowered threshold (1 - epsilon) * min_support with probability
+    at most delta (multiplicative Chernoff bound).
+    """
+    return int(math.ceil(2.0 * math.log(1.0 / delta) / (epsilon ** 2 * min_support)))
+
+
+def _pack(itemset: Tuple[int, ...], n_items: int) -> int:
+    code = 0
+    for item in itemset:
+        code = code * n_items + item
+    return code
+
+
+def negative_border(candidates: Dict[int, np.ndarray], max_len: int, n_items: int) -> Dict[int, np.ndarray]:
+    """
+    Itemsets of size 2..max_len that are not candidates but whose every
+    (k-1)-subset is. If none of them is frequent in the full data, the
+    sampled result equals exact mining (Toivonen's guarantee).
+    Size 1 is handled by counting every item in the verification pass.
+    """
+    border: Dict[int, np.ndarray] = {}
+    for k in range(2, max_len + 1):
+        prev = candidates.get(k - 1)
+        if prev is None or len(prev) < k:
+            break
+
+        if k == 2:
+            i, j = np.triu_indices(len(prev), 1)
+            generated = prev[i] * n_items + prev[j]
+        else:
+            prev_sets = {decode_itemset(c, k - 1, n_items) for c in prev.tolist()}
+            by_prefix: Dict[Tuple[int, ...], List[int]] = {}
+            for itemset in prev_sets:
+                by_prefix.setdefault(itemset[:-1], []).append(itemset[-1])
+
+            codes = []
+            for prefix, lasts in by_prefix.items():
+                for a, b in combinations(sorted(lasts), 2):
+                    itemset = prefix + (a, b)
+                    if all(sub in prev_sets for sub in combinations(itemset, k - 1)):
+                        codes.append(_pack(itemset, n_items))
+            generated = np.asarray(codes, dtype=np.int64)
+
+        border[k] = np.setdiff1d(generated, candidates.get(k, np.empty(0, dtype=np.int64)))
+    return border
+
+
+class SampledMiner:
+    """
+    Toivonen-style approximate miner.
+
+    1. Mines a uniform random sample at a lowered threshold (1 - epsilon) * min_support.
+    2. Adds the negative border of the sampled itemsets.
+    3. Counts candidates and border exactly in one chunked pass over all baskets.
+
+    epsilon and delta trade quality for speed (smaller epsilon: bigger sample,
+    fewer misses). time_budget (seconds) caps the verification pass; when it
+    runs out, supports are extrapolated from the randomly ordered chunks
+    already counted and the report carries the resulting error bound.
+    """
+
+    def __init__(
+        self,
+        min_support: float = 0.001,
+        max_len: int = 3,
+        epsilon: float = 0.25,
+        delta: float = 0.05,
+        time_budget: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        self.min_support = min_support
+        self.max_len = max_len
+        self.epsilon = epsilon
+        self.delta = delta
+        self.time_budget = time_budget
+        self.seed = seed
+        self.report: Dict[str, Any] = {}
+
+    def mine(self, baskets: Sequence[Sequence[str]]) -> Tuple[List[str], Dict[Tuple[int, ...], int], int]:
+        """Returns (item_ids, {itemset codes: support count}, n_baskets), like PartitionedMiner.mine."""
+        started = time.perf_counter()
+        n_baskets = len(baskets)
+        sample_size = required_sample_size(self.min_support, self.epsilon, self.delta)
+
+        if n_baskets == 0 or sample_size * 2 >= n_baskets:
+            # Sampling would not save enough to be worth the approximation
+            item_ids, supports, n = PartitionedMiner(self.min_support, self.max_len).mine(baskets)
+            self.report = {
+                "mode": "exact",
+                "n_baskets": n_baskets,
+                "sample_size": n_baskets,
+                "exact": True,
+                "frequent_itemsets": len(supports),
+                "elapsed_seconds": round(time.perf_counter() - started, 3),
+            }
+            return item_ids, supports, n
+
+        rng = random.Random(self.seed)
+
+        # 1. Mine the sample at the lowered threshold
+        vocab: Dict[str, int] = {}
+        sample = [baskets[i] for i in sorted(rng.sample(range(n_baskets), sample_size))]
+        _, s_indptr, s_indices = encode_baskets(sample, vocab)
+        del sample
+        n_sampled_items = len(vocab)
+        max_len = safe_max_len(self.max_len, n_sampled_items)
+        lowered = (1.0 - self.epsilon) * self.min_support
+        candidates = mine_frequent(s_indptr, s_indices, 0, sample_size, lowered, max_len, n_sampled_items)
+        del s_indptr, s_indices
+
+        # 2. Negative border (itemsets just outside the sampled family)
+        border = negative_border(candidates, max_len, n_sampled_items)
+        to_count = {
+            k: np.union1d(candidates.get(k, np.empty(0, dtype=np.int64)), border.get(k, np.empty(0, dtype=np.int64)))
+            for k in range(2, max_len + 1)
+            if k in candidates or k in border
+        }
+
+        # 3. One pass over all baskets, in random chunk order so a budget cut-off is still a random sample
+        chunk_starts = list(range(0, n_baskets, CHUNK_SIZE))
+        rng.shuffle(chunk_starts)
+        singles = np.zeros(n_sampled_items, dtype=np.int64)
+        totals = {k: np.zeros(len(c), dtype=np.int64) for k, c in to_count.items()}
+        verified = 0
+
+        for start in chunk_starts:
+            if self.time_budget is not None and verified and time.perf_counter() - started > self.time_budget:
+                break
+            chunk = baskets[start:start + CHUNK_SIZE]
+            _, indptr, indices = encode_baskets(chunk, vocab)
+
+            counts = np.bincount(indices, minlength=len(vocab))
+            if len(counts) > len(singles):
+                singles = np.concatenate([singles, np.zeros(len(counts) - len(singles), dtype=np.int64)])
+            singles += counts
+
+            for k, partial in count_candidates(indptr, indices, 0, len(chunk), to_count, n_sampled_items).items():
+                totals[k] += partial
+            verified += len(chunk)
+
+        scale = n_baskets / verified
+        threshold = self.min_support * n_baskets
+        item_ids = [None] * len(vocab)
+        for item, code in vocab.items():
+            item_ids[code] = item
+
+        # Supports are rounded to whole baskets after extrapolation
+        supports: Dict[Tuple[int, ...], int] = {}
+        sampled_singles = set(candidates.get(1, np.empty(0)).tolist())
+        border_misses = 0
+        for code in np.nonzero(singles * scale >= threshold)[0].tolist():
+            supports[(code,)] = int(round(singles[code] * scale))
+            if code not in sampled_singles:
+                border_misses += 1
+
+        for k, codes in to_count.items():
+            in_border = np.isin(codes, border.get(k, np.empty(0, dtype=np.int64)))
+            frequent = totals[k] * scale >= threshold
+            border_misses += int(np.count_nonzero(frequent & in_border))
+            for code, count in zip(codes[frequent].tolist(), totals[k][frequent].tolist()):
+                supports[decode_itemset(code, k, n_sampled_items)] = int(round(count * scale))
+
+        complete = verified == n_baskets
+        self.report = {
+            "mode": "sampled",
+            "n_baskets": n_baskets,
+            "sample_size": sample_size,
+            "lowered_support": lowered,
+            "epsilon": self.epsilon,
+            "delta": self.delta,
+            # Chance that any single truly frequent itemset was absent from the sampled family
+            "miss_probability_per_itemset": self.delta,
+            "candidates": int(sum(len(c) for c in candidates.values())),
+            "negative_border": int(sum(len(b) for b in border.values()) + len(vocab) - len(sampled_singles)),
+            "border_misses": border_misses,
+            "verified_fraction": round(verified / n_baskets, 4),
+            # Relative error of extrapolated supports at min_support, with probability 1 - delta
+            "support_relative_error": 0.0 if complete else round(
+                math.sqrt(3.0 * math.log(2.0 / self.delta) / (self.min_support * verified)), 4
+            ),
+            "exact": complete and border_misses == 0,
+            "frequent_itemsets": len(supports),
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+
+        if border_misses:
+            # Supersets of these itemsets were never counted; a full re-run would be needed for exactness
+            logger.warning(f"[MBA] Sampling missed {border_misses} frequent border itemsets (added, supersets unexplored)")
+        logger.info(
+            f"[MBA] Sampled mining: {sample_size}/{n_baskets} baskets sampled, "
+            f"{self.report['verified_fraction']:.0%} verified, {len(supports)} frequent itemsets"
+        )
+        return item_ids, supports, n_baskets
+
+
+def run_mba_sampled(transactions, **kwargs) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Approximate counterpart of run_mba for very large retailers.
+    Returns (rules, report); the report holds the sample size and error bounds.
+    Pass k (and optionally metric, bundles, itemsets) to keep only the best k rules.
+    """
+    baskets = preprocess_transactions(transactions, use_id=True)
+    miner = SampledMiner(
+        min_support=kwargs.get("min_support", 0.001),
+        max_len=kwargs.get("max_len", 3),
+        epsilon=kwargs.get("epsilon", 0.25),
+        delta=kwargs.get("delta", 0.05),
+        time_budget=kwargs.get("time_budget"),
+        seed=kwargs.get("seed")
+    )
+    item_ids, supports, n_baskets = miner.mine(baskets)
+    if kwargs.get("k"):
+        rules = top_k_rules(
+            item_ids, supports, n_baskets,
+            k=kwargs["k"],
+            metric=kwargs.get("metric", "lift"),
+            min_confidence=kwargs.get("min_confidence", 0.1),
+            min_lift=kwargs.get("min_lift", 0.5),
+            bundles=kwargs.get("bundles", False),
+            itemsets=kwargs.get("itemsets", "all")
+        )
+        return rules, miner.report
+    rules = generate_rules(
+        item_ids, supports, n_baskets,
+        min_confidence=kwargs.get("min_confidence", 0.1),
+        min_lift=kwargs.get("min_lift", 0.5)
+    )
+    return rules, miner.report
@@ -0,0 +1,384 @@
+# ml-engine/algorithms/mba_topk.py
+# Top-K association rule mining: a bounded heap plus a rising pruning threshold
+
+import heapq
+import logging
+import math
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from algorithms.mba_partitioned import _combination_counts, count_candidates, encode_baskets
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("lift", "confidence", "confidence_lift")
+
+# First batch of last-level candidates counted is BATCH_FACTOR * k; batches double afterwards
+BATCH_FACTOR = 4
+
+
+def rule_score(metric: str, support: Any, ant_support: Any, con_support: Any) -> Any:
+    """Ranking score of X -> Y from fractional supports s(XY), s(X), s(Y); works on numpy arrays too."""
+    confidence = support / ant_support
+    if metric == "confidence":
+        return confidence
+    lift = confidence / con_support
+    if metric == "lift":
+        return lift
+    return confidence * lift
+
+
+class TopKRules:
+    """
+    Min-heap of the best k rules seen so far.
+    threshold is the score a new rule must beat, which only ever rises.
+
+    With bundles=True, entries are canonical bundles: one rule per itemset
+    (its best-scoring direction), and a bundle is dropped while a proper
+    sub-bundle already held scores at least as well (x (1 + min_improvement)).
+    """
+
+    def __init__(
+        self,
+        k: int,
+        metric: str = "lift",
+        min_confidence: float = 0.0,
+        min_lift: float = 0.0,
+        bundles: bool = False,
+        min_improvement: float = 0.0
+    ):
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}, got {metric!r}")
+        self.k = k
+        self.metric = metric
+        self.min_confidence = min_confidence
+        self.min_lift = min_lift
+        self.bundles = bundles
+        self.min_improvement = min_improvement
+        self._floor = {"lift": min_lift, "confidence": min_confidence}.get(metric, min_confidence * min_lift)
+        self._heap: List[Tuple[float, int, Tuple[int, ...], Tuple[int, ...], float, float, float]] = []
+        self._seq = 0
+        # Bundle mode: itemset -> live heap entry (replaced entries stay in the heap as stale)
+        self._live: Dict[frozenset, tuple] = {}
+
+    @property
+    def threshold(self) -> float:
+        if self.bundles:
+            self._drop_stale()
+        return self._heap[0][0] if len(self) >= self.k else self._floor
+
+    def push(self, ants: Tuple[int, ...], cons: Tuple[int, ...], support: float, confidence: float, lift: float) -> None:
+        if confidence < self.min_confidence or lift < self.min_lift:
+            return
+        score = {"lift": lift, "confidence": confidence}.get(self.metric, confidence * lift)
+        if score < self.threshold:
+            return
+        self._seq += 1
+        entry = (score, self._seq, ants, cons, support, confidence, lift)
+        if self.bundles:
+            self._push_bundle(entry)
+        elif len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heappushpop(self._heap, entry)
+
+    def _push_bundle(self, entry: tuple) -> None:
+        score = entry[0]
+        key = frozenset(entry[2] + entry[3])
+        current = self._live.get(key)
+        if current is not None and current[0] >= score:
+            return
+        margin = 1.0 + self.min_improvement
+        for size in range(2, len(key)):
+            for sub in combinations(sorted(key), size):
+                held = self._live.get(frozenset(sub))
+                if held is not None and held[0] * margin >= score:
+                    return
+
+        # Supersets that no longer add anything over this bundle
+        for other in [o for o in self._live if key < o and score * margin >= self._live[o][0]]:
+            del self._live[other]
+
+        self._live[key] = entry
+        heapq.heappush(self._heap, entry)
+        while len(self._live) > self.k:
+            self._drop_stale()
+            evicted = heapq.heappop(self._heap)
+            del self._live[frozenset(evicted[2] + evicted[3])]
+
+    def _drop_stale(self) -> None:
+        while self._heap and self._live.get(frozenset(self._heap[0][2] + self._heap[0][3])) is not self._heap[0]:
+            heapq.heappop(self._heap)
+
+    def push_many(self, ants: np.ndarray, cons: np.ndarray, support: np.ndarray, ant_support: np.ndarray, con_support: np.ndarray) -> None:
+        """Vectorized push of rules given as rows of item-code arrays (ants/cons are 2-D), best first."""
+        if len(support) == 0:
+            return
+        confidence = support / ant_support
+        lift = confidence / con_support
+        score = rule_score(self.metric, support, ant_support, con_support)
+        ok = (confidence >= self.min_confidence) & (lift >= self.min_lift) & (score >= self.threshold)
+        rows = np.nonzero(ok)[0]
+        if not self.bundles and len(rows) > self.k:
+            # Duplicate or dominated bundles may not take a slot, so only plain mode can cap here
+            rows = rows[np.argpartition(-score[rows], self.k - 1)[:self.k]]
+        for r in rows[np.argsort(-score[rows], kind="stable")].tolist():
+            if score[r] < self.threshold:
+                break
+            self.push(tuple(ants[r].tolist()), tuple(cons[r].tolist()), float(support[r]), float(confidence[r]), float(lift[r]))
+
+    def __len__(self) -> int:
+        return len(self._live) if self.bundles else len(self._heap)
+
+    def rules(self, item_ids: List[str]) -> List[Dict[str, Any]]:
+        """Best-first rules in the same shape as run_mba output."""
+        entries = self._live.values() if self.bundles else self._heap
+        return [
+            {
+                "ants": [item_ids[i] for i in ants],
+                "cons": [item_ids[i] for i in cons],
+                "support": support,
+                "confidence": confidence,
+                "lift": lift
+            }
+            for _, _, ants, cons, support, confidence, lift in sorted(entries, reverse=True)
+        ]
+
+
+def top_k_rules(
+    item_ids: List[str],
+    supports: Dict[Tuple[int, ...], int],
+    n_baskets: int,
+    k: int = 500,
+    metric: str = "lift",
+    min_confidence: float = 0.0,
+    min_lift: float = 0.0,
+    bundles: bool = False,
+    itemsets: str = "all",
+    min_improvement: float = 0.0
+) -> List[Dict[str, Any]]:
+    """
+    Best k rules from already-counted itemset supports (e.g. PartitionedMiner
+    or SampledMiner output). Never holds more than k rules; for lift, an
+    itemset is skipped without enumerating its splits once 1 / s(Z) cannot
+    beat the threshold.
+
+    itemsets="closed" or "maximal" only builds rules from that condensed
+    family (subset supports are still used for scoring).
+    """
+    from algorithms.mba_bundles import condense
+
+    top = TopKRules(k, metric, min_confidence, min_lift, bundles, min_improvement)
+    sources = condense(supports, itemsets)
+
+    # Smaller itemsets first, so simpler bundles are in place before their supersets
+    for itemset in sorted(sources, key=len):
+        if len(itemset) < 2:
+            continue
+        count = supports[itemset]
+        if metric == "lift" and n_baskets / count < top.threshold:
+            # s(X), s(Y) >= s(Z), so no split of Z can have lift above 1 / s(Z)
+            continue
+        support = count / n_baskets
+        for r in range(1, len(itemset)):
+            for ants in combinations(itemset, r):
+                cons = tuple(i for i in itemset if i not in ants)
+                ant_count = supports.get(ants)
+                con_count = supports.get(cons)
+                if not ant_count or not con_count:
+                    continue
+                confidence = count / ant_count
+                top.push(ants, cons, support, confidence, confidence / (con_count / n_baskets))
+
+    return top.rules(item_ids)
+
+
+class TopKRuleMiner:
+    """
+    Mines the k best rules by lift, confidence or confidence x lift directly from baskets.
+
+    Itemsets below the last level (max_len) are counted in full, since their
+    supports are needed to score rules. Last-level candidates are never all
+    counted: each gets an upper bound on its best rule score from its known
+    subsets (s(Z) <= min subset support, so lift(X -> Y) <= s_min(Z) / (s(X) s(Y))
+    <= 1 / max(s(X), s(Y))). They are counted in best-bound-first batches,
+    and mining stops once the next bound falls below the heap threshold.
+
+    bundles=True returns one canonical rule per itemset and drops bundles
+    that add nothing over a simpler one (see TopKRules).
+    """
+
+    def __init__(
+        self,
+        k: int = 500,
+        metric: str = "lift",
+        min_support: float = 0.001,
+        min_confidence: float = 0.0,
+        min_lift: float = 0.0,
+        max_len: int = 3,
+        bundles: bool = False,
+        min_improvement: float = 0.0
+    ):
+        self.k = k
+        self.metric = metric
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.min_lift = min_lift
+        self.bundles = bundles
+        self.min_improvement = min_improvement
+        # Pairs and triples only: the bound and candidate code below are written for k <= 3
+        self.max_len = max(2, min(max_len, 3))
+        self.stats: Dict[str, int] = {}
+
+    def mine(self, baskets: Sequence[Sequence[str]], n_baskets: Optional[int] = None) -> List[Dict[str, Any]]:
+        """n_baskets overrides len(baskets) when baskets were pre-filtered (e.g. by load_frequent_baskets)."""
+        item_ids, indptr, indices = encode_baskets(baskets)
+        n, n_items = n_baskets or len(baskets), len(item_ids)
+        top = TopKRules(self.k, self.metric, self.min_confidence, self.min_lift, self.bundles, self.min_improvement)
+        if n == 0:
+            return []
+
+        min_count = max(1, int(math.ceil(self.min_support * n)))
+        singles = np.bincount(indices, minlength=n_items)
+        keep = singles >= min_count
+        s1 = singles / n
+
+        # Level 2: all frequent pairs (their supports feed level-3 scoring)
+        pair_codes, pair_counts = _combination_counts(indptr, indices, 0, len(baskets), 2, keep, n_items)
+        frequent = pair_counts >= min_count
+        pair_codes, pair_counts = pair_codes[frequent], pair_counts[frequent]
+        a, b = np.divmod(pair_codes, n_items)
+        s_ab = pair_counts / n
+        top.push_many(a[:, None], b[:, None], s_ab, s1[a], s1[b])
+        top.push_many(b[:, None], a[:, None], s_ab, s1[b], s1[a])
+
+        self.stats = {"frequent_pairs": len(pair_codes), "triple_candidates": 0, "triples_counted": 0}
+        if self.max_len >= 3 and len(pair_codes):
+            self._mine_triples(top, indptr, indices, n, n_items, s1, pair_codes, s_ab, min_count)
+
+        logger.info(
+            f"[MBA] Top-{self.k} by {self.metric}: {self.stats['frequent_pairs']} pairs, "
+            f"{self.stats['triples_counted']}/{self.stats['triple_candidates']} triple candidates counted, "
+            f"threshold {top.threshold:.4f}"
+        )
+        return top.rules(item_ids)
+
+    def _mine_triples(self, top: TopKRules, indptr, indices, n: int, n_items: int, s1: np.ndarray, pair_codes: np.ndarray, s_ab: np.ndarray, min_count: int) -> None:
+        triples = _triple_candidates(pair_codes, n_items)
+        self.stats["triple_candidates"] = len(triples)
+        if len(triples) == 0:
+            return
+
+        a, b, c = triples.T
+        s_pair = lambda x, y: s_ab[np.searchsorted(pair_codes, x * n_items + y)]  # noqa: E731
+        sab, sac, sbc = s_pair(a, b), s_pair(a, c), s_pair(b, c)
+        ceiling = np.minimum(np.minimum(sab, sac), sbc)
+
+        # (ants support, cons support) for the six splits of {a, b, c}
+        splits = [(s1[a], sbc), (s1[b], sac), (s1[c], sab), (sbc, s1[a]), (sac, s1[b]), (sab, s1[c])]
+        bound = np.full(len(triples), -np.inf)
+        for s_x, s_y in splits:
+            ok = (ceiling / s_x >= self.min_confidence) & (ceiling / (s_x * s_y) >= self.min_lift)
+            bound = np.where(ok, np.maximum(bound, rule_score(self.metric, ceiling, s_x, s_y)), bound)
+
+        order = np.argsort(-bound, kind="stable")
+        triples, bound = triples[order], bound[order]
+        sab, sac, sbc = sab[order], sac[order], sbc[order]
+
+        pos, batch = 0, BATCH_FACTOR * self.k
+        while pos < len(triples) and bound[pos] >= top.threshold:
+            end = min(len(triples), pos + batch)
+            end = pos + int(np.count_nonzero(bound[pos:end] >= top.threshold))
+            rows = np.arange(pos, end)
+
+            codes = (triples[rows, 0] * n_items + triples[rows, 1]) * n_items + triples[rows, 2]
+            sort = np.argsort(codes)
+            counts = np.empty(len(rows), dtype=np.int64)
+            counts[sort] = count_candidates(indptr, indices, 0, len(indptr) - 1, {3: codes[sort]}, n_items)[3]
+            self.stats["triples_counted"] += len(rows)
+
+            hit = rows[counts >= min_count]
+            s_z = counts[counts >= min_count] / n
+            ta, tb, tc = triples[hit, 0], triples[hit, 1], triples[hit, 2]
+            pairs = {"ab": sab[hit], "ac": sac[hit], "bc": sbc[hit]}
+            for single, rest, s_rest in ((ta, (tb, tc), pairs["bc"]), (tb, (ta, tc), pairs["ac"]), (tc, (ta, tb), pairs["ab"])):
+                rest_rows = np.stack(rest, axis=1)
+                top.push_many(single[:, None], rest_rows, s_z, s1[single], s_rest)
+                top.push_many(rest_rows, single[:, None], s_z, s_rest, s1[single])
+
+            pos, batch = end, batch * 2
+
+
+def _triple_candidates(pair_codes: np.ndarray, n_items: int) -> np.ndarray:
+    """Rows (a, b, c), a < b < c, whose three sub-pairs are all frequent (pair_codes must be sorted)."""
+    first, second = np.divmod(pair_codes, n_items)
+    bounds = np.searchsorted(first, np.arange(n_items + 1))
+    out = []
+    for item in np.unique(first).tolist():
+        partners = second[bounds[item]:bounds[item + 1]]
+        if len(partners) < 2:
+            continue
+        i, j = np.triu_indices(len(partners), 1)
+        b, c = partners[i], partners[j]
+        bc = b * n_items + c
+        pos = np.minimum(np.searchsorted(pair_codes, bc), len(pair_codes) - 1)
+        ok = pair_codes[pos] == bc
+        out.append(np.stack([np.full(int(ok.sum()), item), b[ok], c[ok]], axis=1))
+    if not out:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.concatenate(out).astype(np.int64)
+
+
+def rules_from_pair_counts(
+    item_ids: List[str],
+    item_counts: np.ndarray,
+    pair_a: np.ndarray,
+    pair_b: np.ndarray,
+    pair_counts: np.ndarray,
+    n_baskets: float,
+    k: int = 500,
+    metric: str = "lift",
+    min_support: float = 0.001,
+    min_confidence: float = 0.0,
+    min_lift: float = 0.0,
+    bundles: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Top-k pair rules from pre-aggregated (possibly time-weighted) counts,
+    e.g. a data.count_store window. Counts may be fractional.
+    """
+    top = TopKRules(k, metric, min_confidence, min_lift, bundles)
+    if n_baskets <= 0 or len(pair_counts) == 0:
+        return []
+    frequent = pair_counts >= min_support * n_baskets
+    a, b = pair_a[frequent], pair_b[frequent]
+    s_ab = pair_counts[frequent] / n_baskets
+    s1 = item_counts / n_baskets
+    top.push_many(a[:, None], b[:, None], s_ab, s1[a], s1[b])
+    top.push_many(b[:, None], a[:, None], s_ab, s1[b], s1[a])
+    return top.rules(item_ids)
+
+
+def run_mba_topk(baskets_or_transactions, **kwargs) -> List[Dict[str, Any]]:
+    """
+    Top-K counterpart of run_mba: returns at most k rules, best first.
+    Accepts raw transaction documents or preprocessed baskets; pass n_baskets
+    when the baskets were pre-filtered so supports keep the full denominator.
+    """
+    from algorithms.preprocess import preprocess_transactions
+
+    data = baskets_or_transactions
+    baskets = preprocess_transactions(data, use_id=True) if data and isinstance(data[0], dict) else data
+    miner = TopKRuleMiner(
+        k=kwargs.get("k", 500),
+        metric=kwargs.get("metric", "lift"),
+        min_support=kwargs.get("min_support", 0.001),
+        min_confidence=kwargs.get("min_confidence", 0.0),
+        min_lift=kwargs.get("min_lift", 0.0),
+        max_len=kwargs.get("max_len", 3),
+        bundles=kwargs.get("bundles", False),
+        min_improvement=kwargs.get("min_improvement", 0.0)
+    )
+    return miner.mine(baskets, n_baskets=kwargs.get("n_baskets"))
@@ -0,0 +1,132 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import POPULARITY_HALF_LIFE_DAYS, POPULARITY_TOP_N, TRENDING_HALF_LIFE_DAYS, TRENDING_PER_CATEGORY
+
+
+def _tx_time(tx: Dict[str, Any]) -> Optional[datetime]:
+    ts = tx.get("createdAt") or tx.get("timestamp")
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(ts, datetime):
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class PopularityModel:
+    """
+    Cold-start feed for shoppers nobody knows yet: retailer-wide popularity
+    and per-category trending lists, both recency-weighted and precomputed at
+    training time.
+
+    Popularity counts baskets per product with weight 0.5 ** (age / half_life).
+    Trending uses a shorter half-life and ranks products within their
+    category. Ages are measured from the retailer's newest transaction, so a
+    retailer that has been quiet for a month still has a trend. The blended
+    top list is stored as two small arrays, and serving it never touches MongoDB.
+    """
+
+    def __init__(
+        self,
+        half_life_days: float = POPULARITY_HALF_LIFE_DAYS,
+        trending_half_life_days: float = TRENDING_HALF_LIFE_DAYS,
+        top_n: int = POPULARITY_TOP_N,
+        per_category: int = TRENDING_PER_CATEGORY
+    ):
+        self.half_life_days = half_life_days
+        self.trending_half_life_days = trending_half_life_days
+        self.top_n = top_n
+        self.per_category = per_category
+        self.product_ids: List[str] = []
+        self.scores = np.zeros(0, dtype=np.float32)
+        # Per-category trending lists: category i is trending_ids[trending_offsets[i]:trending_offsets[i + 1]]
+        self.categories: List[str] = []
+        self.trending_offsets = np.zeros(1, dtype=np.int32)
+        self.trending_ids: List[str] = []
+        self.trending_scores = np.zeros(0, dtype=np.float32)
+
+    def fit(self, transactions: List[Dict[str, Any]], products: List[Dict[str, Any]]):
+        """Recency-weighted basket counts from raw transactions (full training)."""
+        codes: Dict[str, int] = {}
+        item_codes, item_times = [], []
+        for tx in transactions:
+            ts = _tx_time(tx)
+            seconds = ts.timestamp() if ts else np.nan
+            for pid in {str(i.get("productId")) for i in (tx.get("items") or []) if i.get("productId")}:
+                item_codes.append(codes.setdefault(pid, len(codes)))
+                item_times.append(seconds)
+        if not codes:
+            return self
+
+        times = np.array(item_times, dtype=np.float64)
+        known = ~np.isnan(times)
+        newest = times[known].max() if known.any() else 0.0
+        # Undated baskets count as the oldest dated ones, never as recent activity
+        ages = np.where(known, (newest - times) / 86400.0, (newest - times[known].min()) / 86400.0 if known.any() else 0.0)
+        item_codes = np.array(item_codes, dtype=np.int64)
+        popularity = np.bincount(item_codes, weights=0.5 ** (ages / self.half_life_days), minlength=len(codes))
+        trending = np.bincount(item_codes, weights=0.5 ** (ages / self.trending_half_life_days), minlength=len(codes))
+        return self.fit_counts(list(codes), popularity, trending, products)
+
+    def fit_counts(self, item_ids: List[str], popularity: np.ndarray, trending: np.ndarray, products: List[Dict[str, Any]]):
+        """Builds the lists from per-item weighted counts (e.g. decayed count-store windows)."""
+        n = min(len(item_ids), len(popularity), len(trending))
+        item_ids = [str(i) for i in item_ids[:n]]
+        popularity = np.asarray(popularity[:n], dtype=np.float64)
+        trending = np.asarray(trending[:n], dtype=np.float64)
+        if not n or popularity.max(initial=0.0) <= 0:
+            return self
+
+        category_of = {str(p.get("productId") or p.get("_id", "")): p.get("category") or "General" for p in products}
+        in_catalog = np.array([pid in category_of for pid in item_ids])
+        category_codes: Dict[str, int] = {}
+        cats = np.array([category_codes.setdefault(category_of[pid], len(category_codes)) if ok else -1
+                         for pid, ok in zip(item_ids, in_catalog)], dtype=np.int64)
+
+        # Trending: best per_category items of each category, normalized within the category
+        self.categories = list(category_codes)
+        trend_norm = np.zeros(n)
+        offsets, ids, scores, trending_rows = [0], [], [], []
+        for code in range(len(self.categories)):
+            members = np.flatnonzero((cats == code) & (trending > 0))
+            top = members[np.argsort(-trending[members], kind="stable")[:self.per_category]]
+            if len(top):
+                trend_norm[members] = trending[members] / trending[top[0]]
+            trending_rows.extend(top)
+            ids.extend(item_ids[i] for i in top)
+            scores.extend(trend_norm[top])
+            offsets.append(len(ids))
+        self.trending_offsets = np.array(offsets, dtype=np.int32)
+        self.trending_ids = ids
+        self.trending_scores = np.array(scores, dtype=np.float32)
+
+        # Cold-start list: global top_n plus every category's trending items, half popularity half trend
+        pop_norm = popularity / popularity.max()
+        candidates = np.flatnonzero(in_catalog & (popularity > 0))
+        candidates = candidates[np.argsort(-pop_norm[candidates], kind="stable")[:self.top_n]]
+        candidates = np.union1d(candidates, np.array(trending_rows, dtype=np.int64))
+        blended = 0.5 * pop_norm[candidates] + 0.5 * trend_norm[candidates]
+        order = np.argsort(-blended, kind="stable")
+        self.product_ids = [item_ids[int(i)] for i in candidates[order]]
+        self.scores = blended[order].astype(np.float32)
+        return self
+
+    def cold_start_scores(self) -> Dict[str, float]:
+        """{productId: score} for a shopper with no history and no CF profile."""
+        return {pid: float(s) for pid, s in zip(self.product_ids, self.scores)}
+
+    def trending(self, category: str) -> List[str]:
+        """Trending productIds of one category, best first."""
+        try:
+            i = self.categories.index(category)
+        except ValueError:
+            return []
+        return self.trending_ids[self.trending_offsets[i]:self.trending_offsets[i + 1]]
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
@@ -1,6 +1,8 @@
 import numpy as np
 from typing import Dict, Any, List
 
+from config import DISCOUNT_BOOST_FACTOR, MARGIN_BOOST_FACTOR
+
 class ScoringUtils:
     """
     Advanced Utility for Hybrid Recommendation Fusion.
@@ -67,6 +69,22 @@ class ScoringUtils:
         boost = 1.0 + (np.log1p(discount_percentage / 100) * 0.4)
         return round(float(boost), 3)
 
+    @staticmethod
+    def discount_boost_array(discount_percentage: np.ndarray, factor: float = DISCOUNT_BOOST_FACTOR) -> np.ndarray:
+        """
+        calculate_discount_boost for a whole column of discount percentages.
+        """
+        pct = np.clip(np.nan_to_num(discount_percentage), 0.0, 100.0)
+        return np.round(1.0 + np.log1p(pct / 100) * factor, 3)
+
+    @staticmethod
+    def margin_boost_array(margin_percentage: np.ndarray, factor: float = MARGIN_BOOST_FACTOR) -> np.ndarray:
+        """
+        Linear margin boost: 1 + margin/100 * factor (0.2 -> 1.0x - 1.2x); 0 or unknown margin stays 1.0.
+        """
+        pct = np.clip(np.nan_to_num(margin_percentage), 0.0, 100.0)
+        return np.round(1.0 + pct / 100 * factor, 3)
+
     @staticmethod
     def normalize_scores(scores: Dict[str, float]) -> Dict[str, float]:
         """
@@ -1,25 +1,238 @@
-import uvicorn
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
 
-from db import get_db
+# NOTE: keep module-level imports light. pandas / scikit-learn / mlxtend are
+# imported inside the handlers that need them so cold start (including the
+# Vercel shim in api/index.py) stays in the milliseconds.
+from db import SERVING, get_db, database_status, start_readiness_probe
 from data.loader import (
-    load_products,
     load_transactions,
-    get_product_map,
+    data_stamp,
+    load_frequent_baskets,
     save_association_rules,
     mark_products_expired,
+    load_training_runs,
     ASSOCIATION_RULES_COL
 )
 from algorithms.expiry import apply_expiry_logic
-from algorithms.mba import run_mba
-from algorithms.content_based import ContentBasedEngine
-from algorithms.collaborative_based import CollaborativeBasedEngine
-from fusion.recommender import ShopFusionRecommender
+from data.catalog_sync import CatalogSync
+from serving.model_registry import ModelRegistry
+from serving.artifact_store import ArtifactStore
+from serving.response_cache import ResponseCache
+from serving.admission import DEGRADED_HEADER, AdmissionLimiter, remaining_budget
+from serving.affinity import FORWARDED_HEADER, SERVED_BY_HEADER, PeerUnreachable, TenantAffinity
+from serving.codec import binary_response, catalog_payload, json_response, score_payload, wants_msgpack
+from monitoring.metrics import (
+    REGISTRY,
+    MODEL_VERSION,
+    MODEL_SIZE,
+    MODEL_BYTES,
+    CACHE_EVENTS,
+    CACHE_HIT_RATIO,
+    AFFINITY_REQUESTS,
+    ADMISSION_DECISIONS,
+    ADMISSION_SLOTS,
+    DEGRADED_RESPONSES,
+    stage_timer
+)
+from monitoring.profiling import parse_mode, profiled, recent_profiles
+from monitoring.training_runs import note_inputs, note_outputs, training_run
+from config import (
+    RECOMMEND_CACHE_SIZE, RECOMMEND_CACHE_TTL, LOG_LEVEL, WARM_LOAD_MODELS, MODEL_MMAP, MODEL_SYNC_INTERVAL,
+    MBA_APPROX_MIN_TRANSACTIONS, MBA_APPROX_EPSILON, MBA_APPROX_TIME_BUDGET,
+    MBA_TOP_K, MBA_RANK_METRIC, MBA_BUNDLES, MBA_PUSHDOWN, CATALOG_CHANGE_STREAM, ONLINE_COMPACT_INTERVAL,
+    ADMISSION_SERVE_CONCURRENCY, ADMISSION_SERVE_QUEUE, ADMISSION_SERVE_WAIT_MS,
+    ADMISSION_TRAIN_CONCURRENCY, ADMISSION_TRAIN_QUEUE, ADMISSION_TRAIN_WAIT_S, ADMISSION_RETRY_AFTER,
+    AFFINITY_PEERS_API
+)
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger("shopfusion.ml")
+
+model_registry = ModelRegistry()
+artifact_store = ArtifactStore()
+response_cache = ResponseCache(max_entries=RECOMMEND_CACHE_SIZE, ttl_seconds=RECOMMEND_CACHE_TTL)
+catalog = CatalogSync()
+affinity = TenantAffinity()
+serve_admission = AdmissionLimiter("serve", ADMISSION_SERVE_CONCURRENCY, ADMISSION_SERVE_QUEUE, ADMISSION_SERVE_WAIT_MS / 1000.0)
+train_admission = AdmissionLimiter("train", ADMISSION_TRAIN_CONCURRENCY, ADMISSION_TRAIN_QUEUE, ADMISSION_TRAIN_WAIT_S)
+# Trainings run on their own threads, never on the event loop or the request thread pool
+_train_executor = ThreadPoolExecutor(max_workers=max(ADMISSION_TRAIN_CONCURRENCY, 1), thread_name_prefix="shopfusion-train")
+
+# A new model version makes every cached feed for that retailer stale
+model_registry.subscribe(lambda user_id, version: response_cache.invalidate_retailer(user_id))
+
+_warm_state = {"state": "idle", "loaded": 0, "total": 0}
+_store_checked: Dict[str, float] = {}
+_hybrid_recommender = None
+_count_store = None
+_online_store = None
+
+
+def _get_count_store():
+    global _count_store
+    if _count_store is None:
+        from data.count_store import CountStore
+        _count_store = CountStore()
+    return _count_store
+
+
+def _get_online_store():
+    global _online_store
+    if _online_store is None:
+        from serving.online_state import OnlineStore
+        _online_store = OnlineStore()
+        # Freshly trained models already cover persisted purchases; online state is seeded again
+        # (by the training run on this worker, else on the next event, from the count store only)
+        model_registry.subscribe(lambda user_id, version: _online_store.drop(user_id))
+        _online_store.start_compaction(ONLINE_COMPACT_INTERVAL)
+    return _online_store
+
+
+def _online_state(user_id: str):
+    """The retailer's online state if any events were ingested (never creates one)."""
+    return _online_store.get(user_id) if _online_store is not None else None
+
+
+def _seed_online_state(user_id: str):
+    """
+    Starts online state from the daily count store (all history), falling back to empty.
+    Never reads MongoDB: training brings the count store up to date (_refresh_online_state).
+    """
+    from serving.online_state import OnlineState
+    try:
+        counts = _get_count_store().window(user_id)
+        return OnlineState(
+            item_ids=counts.item_ids,
+            item_counts=counts.item_counts,
+            pair_counts=counts.pair_counts,
+            shopper_ids=counts.shopper_ids,
+            user_item=counts.user_item,
+            n_baskets=counts.n_baskets
+        )
+    except Exception as e:
+        logger.warning(f"[WARN] Could not seed online state for {user_id}: {e}")
+        return OnlineState()
+
+
+def _refresh_online_state(user_id: str, had_online: bool, transactions: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    Training-time part of online serving: ingests new transactions into the count store
+    (from the already loaded ones when given) and, when the retailer receives events on
+    this worker, seeds its online state again so no event request has to.
+    """
+    try:
+        with stage_timer("train", "counts_refresh"):
+            _get_count_store().refresh(user_id, loaded=transactions)
+        if had_online:
+            with stage_timer("train", "online_seed"):
+                _get_online_store().get_or_create(user_id, lambda: _seed_online_state(user_id))
+    except Exception as e:
+        logger.warning(f"[WARN] Could not refresh online state for {user_id}: {e}")
+
+
+def _get_recommender():
+    global _hybrid_recommender
+    if _hybrid_recommender is None:
+        from fusion.recommender import ShopFusionRecommender
+        _hybrid_recommender = ShopFusionRecommender()
+    return _hybrid_recommender
 
-app = FastAPI(title="ShopFusion ML Engine")
-db = get_db()
+
+def _install_from_store(user_id: str) -> bool:
+    """Loads a retailer's latest persisted models into the registry."""
+    artifacts = artifact_store.load(user_id)
+    if not artifacts:
+        return False
+    return model_registry.install(
+        user_id,
+        artifacts["version"],
+        artifacts.get("content_engine"),
+        artifacts.get("collab_engine"),
+        artifacts.get("popularity")
+    )
+
+
+def _sync_from_store(user_id: str) -> None:
+    """
+    Installs a newer version published by another worker (remapping its
+    arrays); checks the LATEST pointer at most every MODEL_SYNC_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    if now - _store_checked.get(user_id, float("-inf")) < MODEL_SYNC_INTERVAL:
+        return
+    _store_checked[user_id] = now
+    latest = artifact_store.latest_version(user_id)
+    if latest and latest > model_registry.version(user_id):
+        if _install_from_store(user_id):
+            logger.info(f"[MODELS] {user_id}: switched to version {latest} published by another worker")
+
+
+def _persist_models(user_id: str, version: str, content_engine, collab_engine, popularity=None, meta: Optional[Dict[str, Any]] = None) -> None:
+    """Saves a freshly published version; with MODEL_MMAP, serves the mapped copy so this worker shares it too."""
+    with stage_timer("train", "persist"):
+        saved = artifact_store.save(user_id, version, {
+            "content_engine": content_engine,
+            "collab_engine": collab_engine,
+            "popularity": popularity
+        }, meta=meta)
+        if saved:
+            note_outputs(artifact_mb=round(sum(
+                os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(saved) for name in names
+            ) / (1024 * 1024), 3))
+        if saved and MODEL_MMAP:
+            artifacts = artifact_store.load(user_id, version)
+            if artifacts:
+                model_registry.remap(
+                    user_id, version, artifacts.get("content_engine"), artifacts.get("collab_engine"), artifacts.get("popularity")
+                )
+
+
+def _warm_load_models():
+    """Background warm-up: imports the algorithm stack and loads persisted models."""
+    _warm_state["state"] = "loading"
+    try:
+        # Pay the numpy / pandas / scikit-learn import cost here, off the request path
+        from algorithms import mba_topk, content_based, collaborative_based  # noqa: F401
+
+        # With tenant affinity only this pod's share of retailers is held in memory
+        retailers = [r for r in artifact_store.retailers() if affinity.owns(r)]
+        _warm_state["total"] = len(retailers)
+        for user_id in retailers:
+            if model_registry.get(user_id) is None and _install_from_store(user_id):
+                _warm_state["loaded"] += 1
+        _get_recommender()
+        _warm_state["state"] = "ready"
+        logger.info(f"[WARM] Loaded models for {_warm_state['loaded']}/{_warm_state['total']} retailers")
+    except Exception as e:
+        _warm_state["state"] = "failed"
+        logger.exception(f"[WARM] Model warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_readiness_probe()
+    affinity.start_discovery()
+    if CATALOG_CHANGE_STREAM:
+        catalog.start_change_stream()
+    if WARM_LOAD_MODELS:
+        threading.Thread(target=_warm_load_models, name="shopfusion-warm-load", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="ShopFusion ML Engine", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,9 +241,225 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-hybrid_recommender = ShopFusionRecommender()
-content_engine = ContentBasedEngine()
-collab_engine = CollaborativeBasedEngine()
+# Storefront routes under admission control; group 1 is recommend / score, group 2 the retailer id
+_SERVE_PATH = re.compile(r"^/api/(recommend|score)/([^/]+)$")
+_TRAIN_PATH = re.compile(r"^/api/train/[^/]+$")
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """
+    Separate concurrency limits and wait queues for storefront and training
+    requests (see serving/admission.py). Runs inside tenant affinity, so only
+    the pod serving a retailer counts its requests. Storefront requests that
+    cannot be admitted get a degraded feed instead of waiting.
+    """
+    path = request.url.path
+    serve = _SERVE_PATH.match(path) if request.method == "GET" else None
+    if serve is not None:
+        limiter = serve_admission
+    elif request.method == "POST" and _TRAIN_PATH.match(path):
+        limiter = train_admission
+    else:
+        return await call_next(request)
+
+    outcome = await limiter.admit(remaining_budget(request.headers))
+    ADMISSION_DECISIONS.inc(pipeline=limiter.name, outcome=outcome or "admitted")
+    if outcome is None:
+        start = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+    if serve is not None:
+        # Building and serialising the feed is CPU work: off the loop, the thread pool has headroom above the serve limit
+        response = await run_in_threadpool(_degraded_response, serve.group(1), serve.group(2), request)
+        if response is not None:
+            return response
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Overloaded ({outcome}), retry later"},
+        headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+    )
+
+
+def _degraded_response(kind: str, user_id: str, request: Request) -> Optional[Response]:
+    """
+    Answer for a shed storefront request without running the pipeline or
+    touching MongoDB: the cached feed, else the popularity feed; None when neither exists.
+    Runs in the thread pool, never on the event loop it is relieving.
+    """
+    params = request.query_params
+    shopper_id = params.get("shopper_id", "")
+    cart = [c for c in params.get("cart_items", "").split(",") if c.strip()]
+    version = _feed_version(user_id, shopper_id)
+    key = ResponseCache.make_key(user_id, shopper_id, cart, version)
+    cached = response_cache.get(key + ("score",) if kind == "score" else key)
+    if cached is not None:
+        payload = score_payload(cached, version) if kind == "score" else cached
+    else:
+        payload = _fallback_payload(kind, user_id)
+    source = "cached" if cached is not None else "popularity" if payload is not None else "none"
+    DEGRADED_RESPONSES.inc(pipeline=kind, source=source)
+    if source == "none":
+        return None
+
+    if kind == "score":
+        response = binary_response(payload, wants_msgpack(request, params.get("format", "")))
+    else:
+        response = json_response(payload)
+    response.headers[DEGRADED_HEADER] = source
+    return response
+
+
+def _fallback_payload(kind: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    The popularity feed rendered for recommend or score, built once per model and
+    catalog version (it does not depend on the shopper) and then reused by every shed request.
+    """
+    model_version = model_registry.version(user_id)
+    key = (str(user_id), "", "", f"{model_version}.c{catalog.version(user_id)}", "fallback", kind)
+    payload = response_cache.get(key)
+    if payload is None:
+        ranked = _fallback_feed(user_id, install=False)
+        if ranked is None:
+            return None
+        payload = score_payload(ranked, f"{model_version}.fallback") if kind == "score" else ranked.render()
+        response_cache.put(key, payload)
+    return payload
+
+
+# Retailer-scoped routes; group 1 is the retailer id
+_TENANT_PATH = re.compile(r"^/api/(?:recommend|score|train|events)/([^/]+)")
+
+
+@app.middleware("http")
+async def tenant_affinity(request: Request, call_next):
+    """Sends retailer requests to the pod owning the retailer (see serving/affinity.py)."""
+    match = _TENANT_PATH.match(request.url.path)
+    if match is None or not affinity.enabled:
+        return await call_next(request)
+    # Only a peer's forward is served here as is; clients setting the header are routed like any request
+    forwarded = request.headers.get(FORWARDED_HEADER) and affinity.from_peer(request.headers, request.client.host if request.client else None)
+    owner = None if forwarded else affinity.owner(match.group(1))
+    if owner is None:
+        AFFINITY_REQUESTS.inc(route="local")
+        return await call_next(request)
+
+    path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    if affinity.mode == "redirect":
+        AFFINITY_REQUESTS.inc(route="redirected")
+        return RedirectResponse(owner + path, status_code=307)
+
+    body = await request.body()
+    # Training runs as long as it takes; everything else is bounded by AFFINITY_TIMEOUT
+    timeout = None if request.url.path.startswith("/api/train/") else affinity.timeout
+    try:
+        status, headers, content = await run_in_threadpool(
+            affinity.forward, owner, request.method, path, request.headers.items(), body, timeout
+        )
+    except PeerUnreachable:
+        affinity.mark_down(owner)
+        AFFINITY_REQUESTS.inc(route="fallback")
+        return await call_next(request)
+    except OSError as e:
+        # Sent but no answer (timeout / reset): not retried locally, events must not apply twice
+        logger.warning(f"[AFFINITY] Forward to {owner} failed: {e}")
+        AFFINITY_REQUESTS.inc(route="forward_error")
+        return JSONResponse(status_code=504, content={"detail": f"Owner pod {owner} did not answer"})
+
+    AFFINITY_REQUESTS.inc(route="forwarded")
+    response = Response(content=content, status_code=status)
+    for k, v in headers:
+        response.headers.append(k, v)
+    response.headers[SERVED_BY_HEADER] = owner
+    return response
+
+
+def _release_moved_tenants() -> None:
+    """After a peer change, frees models, catalogs and caches of retailers now owned elsewhere."""
+    moved = [r for r in set(model_registry.retailers()) | set(catalog.retailers()) if not affinity.owns(r)]
+    for user_id in moved:
+        model_registry.drop(user_id)
+        catalog.invalidate(user_id)
+        response_cache.invalidate_retailer(user_id)
+        _store_checked.pop(user_id, None)
+        if _online_store is not None:
+            _online_store.drop(user_id)
+    if moved:
+        logger.info(f"[AFFINITY] Released {len(moved)} retailers now owned by other pods")
+
+
+affinity.subscribe(_release_moved_tenants)
+
+
+@app.get("/api/affinity")
+def affinity_status(user_id: str = ""):
+    """This pod's view of the ring; with user_id, which pod owns that retailer."""
+    body = {**affinity.describe(), "served": len(model_registry.retailers())}
+    if user_id:
+        body["owner"] = affinity.owner(user_id) or affinity.self_url or "local"
+    return body
+
+
+class PeerList(BaseModel):
+    peers: List[str]
+
+
+def set_affinity_peers(body: PeerList, request: Request):
+    """Replaces the peer list (static deployments / local tests); DNS discovery does this by itself."""
+    if not affinity.from_peer(request.headers, request.client.host if request.client else None):
+        raise HTTPException(status_code=403, detail="Peer list changes need the peer token")
+    changed = affinity.set_peers(body.peers)
+    return {"success": True, "changed": changed, **affinity.describe()}
+
+
+if AFFINITY_PEERS_API:
+    # Off by default: whoever can change the ring decides where storefront traffic is forwarded
+    app.put("/api/affinity/peers")(set_affinity_peers)
+
+
+def _collect_cache_metrics():
+    stats = response_cache.stats()
+    for result in ("hits", "misses", "coalesced"):
+        CACHE_EVENTS.set_total(stats[result], cache="recommend", result=result)
+    CACHE_HIT_RATIO.set(stats["hit_ratio"], cache="recommend")
+
+
+REGISTRY.add_collector(_collect_cache_metrics)
+
+
+def _collect_admission_metrics():
+    for limiter in (serve_admission, train_admission):
+        ADMISSION_SLOTS.set(limiter.active, pipeline=limiter.name, state="running")
+        ADMISSION_SLOTS.set(limiter.waiting, pipeline=limiter.name, state="waiting")
+
+
+REGISTRY.add_collector(_collect_admission_metrics)
+
+
+def _record_model_metrics(user_id: str, version: str, rules_count: int, content_engine, collab_engine):
+    """Publishes per-retailer model version and size gauges (also the active training run's outputs)."""
+    MODEL_VERSION.remove(retailer=user_id)
+    MODEL_VERSION.set(time.time(), retailer=user_id, version=version)
+    sizes, nbytes = {"mba_rules": rules_count}, {}
+
+    tfidf = content_engine.tfidf_matrix
+    if tfidf is not None:
+        sizes["content_products"] = tfidf.shape[0]
+        nbytes["content_tfidf"] = tfidf.data.nbytes + tfidf.indices.nbytes + tfidf.indptr.nbytes
+
+    if collab_engine.user_item_matrix is not None:
+        sizes["collab_users"] = len(collab_engine.user_ids)
+        sizes["collab_items"] = len(collab_engine.product_columns)
+        nbytes["collab_matrices"] = collab_engine.user_item_matrix.values.nbytes + collab_engine.user_similarity_df.values.nbytes
+
+    for component, value in sizes.items():
+        MODEL_SIZE.set(value, retailer=user_id, component=component)
+    for component, value in nbytes.items():
+        MODEL_BYTES.set(value, retailer=user_id, component=component)
+    note_outputs(**sizes, **{f"{component}_bytes": value for component, value in nbytes.items()})
 
 
 @app.get("/")
@@ -40,28 +469,99 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """Liveness: answers immediately from cached probe state, before models or the DB are ready."""
+    db_status = database_status()
+    body = {
+        "status": "healthy" if db_status["state"] in ("connected", "unknown") else "unhealthy",
+        "engine": "ShopFusion ML Engine",
+        "database": db_status["state"],
+        "models": {**_warm_state, "served": len(model_registry.retailers())},
+        "version": "1.0.0"
+    }
+    if db_status["error"]:
+        body["error"] = db_status["error"]
+    return body
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once the database answers and the warm-up has finished."""
+    ready = database_status()["state"] == "connected" and _warm_state["state"] in ("ready", "failed", "idle")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "database": database_status()["state"], "models": _warm_state}
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of stage latencies, model, cache and Mongo metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def _profile_mode(request: Request, profile: str) -> str:
+    """Profiling is opt-in per request via ?profile=<mode> or the X-Profile header."""
+    return parse_mode(profile or request.headers.get("x-profile"))
+
+
+@app.get("/api/profiles")
+def list_profiles(user_id: str = "", limit: int = 20):
+    """Most recent per-request profiling reports (newest first)."""
+    return {"success": True, "profiles": recent_profiles(user_id, limit)}
+
+
+@app.get("/api/train/{user_id}/runs")
+def list_training_runs(user_id: str, limit: int = 20):
+    """Stored training run reports for a retailer (newest first): per-stage wall / CPU time and peak memory."""
     try:
-        db.command("ping")
-        return {
-            "status": "healthy",
-            "engine": "ShopFusion ML Engine",
-            "database": "connected",
-            "version": "1.0.0"
-        }
+        return {"success": True, "runs": load_training_runs(user_id, limit)}
     except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}
+        logger.exception(f"[ERROR] Training run lookup error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/train/{user_id}")
-async def train_models(user_id: str):
-    """Triggers the full training pipeline."""
+async def train_models(user_id: str, request: Request, profile: str = "", window_days: int = 0, half_life_days: float = 0):
+    """
+    Triggers the full training pipeline.
+    With window_days and/or half_life_days, MBA and CF are rebuilt from the
+    daily count store for that window / decay instead of the full history.
+    """
+    mode = _profile_mode(request, profile)
+    return await asyncio.get_running_loop().run_in_executor(
+        _train_executor, _train_request, user_id, mode, window_days, half_life_days
+    )
+
+
+def _train_request(user_id: str, mode: str, window_days: int, half_life_days: float) -> Dict[str, Any]:
+    with profiled(mode, "train", user_id) as session:
+        if window_days or half_life_days:
+            result = _train_windowed(user_id, window_days or None, half_life_days or None)
+        else:
+            result = _train_models(user_id)
+    if session is not None:
+        result = {**result, "profile": session.report()}
+    return result
+
+
+def _train_models(user_id: str) -> Dict[str, Any]:
+    """Full training pipeline, recorded as a training run report."""
+    with training_run(user_id, "full") as run:
+        result = _run_full_training(user_id)
+        run.finish(result)
+    return result
+
+
+def _run_full_training(user_id: str) -> Dict[str, Any]:
     try:
-        print(f"\n[START] Starting training for user: {user_id}")
+        logger.info(f"[START] Starting training for user: {user_id}")
 
         # 1. Load data
-        products = load_products(user_id)
-        transactions = load_transactions(user_id)
-        print(f"[DATA] Loaded {len(products)} products and {len(transactions)} transactions")
+        with stage_timer("train", "load"):
+            products = catalog.products(user_id)
+            transactions = load_transactions(user_id)
+        logger.info(f"[DATA] Loaded {len(products)} products and {len(transactions)} transactions")
+        note_inputs(products=len(products), transactions=len(transactions))
 
         if not products or not transactions:
             return {
@@ -71,108 +571,424 @@ async def train_models(user_id: str):
             }
 
         # 2. Expiry logic
-        expired_ids, _, _ = apply_expiry_logic(products)
-        mark_products_expired(expired_ids)
-        print(f"[EXPIRY] Marked {len(expired_ids)} products as expired")
+        with stage_timer("train", "expiry"):
+            expired_ids, _, _ = apply_expiry_logic(products)
+            newly_expired = mark_products_expired(expired_ids, user_id)
+        logger.info(f"[EXPIRY] Marked {newly_expired} of {len(expired_ids)} expired products")
 
         # 3. Market Basket Analysis
-        print("[MBA] Running Market Basket Analysis...")
+        logger.info("[MBA] Running Market Basket Analysis...")
         rules = []
         try:
-            rules = run_mba(
-                transactions,
-                min_support=0.0005,
-                min_confidence=0.05,
-                min_lift=0.3
-            )
-            print(f"[MBA] Generated {len(rules)} association rules")
-
-            # Cap to top 500 by lift to avoid insert timeout
-            if len(rules) > 500:
-                rules = sorted(rules, key=lambda x: x.get("lift", 0), reverse=True)[:500]
-                print(f"[MBA] Trimmed to top 500 rules by lift score")
+            with stage_timer("train", "mba"):
+                if MBA_APPROX_MIN_TRANSACTIONS and len(transactions) >= MBA_APPROX_MIN_TRANSACTIONS:
+                    from algorithms.mba_sampling import run_mba_sampled
+                    rules, mba_report = run_mba_sampled(
+                        transactions,
+                        min_support=0.0005,
+                        min_confidence=0.05,
+                        min_lift=0.3,
+                        epsilon=MBA_APPROX_EPSILON,
+                        time_budget=MBA_APPROX_TIME_BUDGET,
+                        k=MBA_TOP_K,
+                        metric=MBA_RANK_METRIC,
+                        bundles=MBA_BUNDLES,
+                        itemsets="closed" if MBA_BUNDLES else "all"
+                    )
+                    logger.info(f"[MBA] Approximate mining report: {mba_report}")
+                else:
+                    # Keeps only the best MBA_TOP_K rules (capped to avoid insert timeouts),
+                    # one per bundle when MBA_BUNDLES is on
+                    from algorithms.mba_topk import run_mba_topk
+                    baskets, n_baskets = transactions, None
+                    if MBA_PUSHDOWN:
+                        # Infrequent items are dropped by MongoDB before they are transferred
+                        baskets, n_baskets = load_frequent_baskets(user_id, min_support=0.0005)
+                        logger.info(f"[MBA] Pushdown: {len(baskets)}/{n_baskets} baskets hold frequent items")
+                        if not n_baskets:
+                            baskets, n_baskets = transactions, None
+                    rules = run_mba_topk(
+                        baskets,
+                        n_baskets=n_baskets,
+                        k=MBA_TOP_K,
+                        metric=MBA_RANK_METRIC,
+                        bundles=MBA_BUNDLES,
+                        min_support=0.0005,
+                        min_confidence=0.05,
+                        min_lift=0.3
+                    )
+            logger.info(f"[MBA] Kept top {len(rules)} association rules by {MBA_RANK_METRIC}")
 
         except Exception as mba_error:
-            print(f"[MBA] Error: {str(mba_error)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"[MBA] Error: {str(mba_error)}")
 
         if rules:
-            save_association_rules(user_id, rules)
-            print(f"[SAVE] Saved {len(rules)} rules to database")
+            with stage_timer("train", "save_rules"):
+                save_association_rules(user_id, rules)
+            logger.info(f"[SAVE] Saved {len(rules)} rules to database")
         else:
-            print("[WARN] No rules generated - data may be too sparse")
+            logger.warning("[WARN] No rules generated - data may be too sparse")
 
-        # 4. Fit ML models
-        content_engine.fit(products)
-        collab_engine.fit(transactions)
-        print(f"[OK] Training complete for retailer: {user_id}")
+        # 4. Fit ML models (fresh engines per retailer, swapped in atomically)
+        from algorithms.content_based import ContentBasedEngine
+        from algorithms.collaborative_based import CollaborativeBasedEngine
+        content_engine = ContentBasedEngine()
+        collab_engine = CollaborativeBasedEngine()
+        with stage_timer("train", "content"):
+            content_engine.fit(products)
+        with stage_timer("train", "collab"):
+            collab_engine.fit(transactions)
+        from algorithms.popularity import PopularityModel
+        with stage_timer("train", "popularity"):
+            popularity = PopularityModel().fit(transactions, products)
+        had_online = _online_state(user_id) is not None
+        model_version = model_registry.publish(user_id, content_engine, collab_engine, popularity)
+        _refresh_online_state(user_id, had_online, transactions)
+        # The data stamp lets the batch scheduler skip this retailer until its data changes;
+        # products just marked expired carry a new updatedAt, so re-read them first
+        stamp = data_stamp(catalog.products(user_id) if newly_expired else products, transactions)
+        _persist_models(user_id, model_version, content_engine, collab_engine, popularity, meta={"data": stamp})
+        _record_model_metrics(user_id, model_version, len(rules), content_engine, collab_engine)
+        logger.info(f"[OK] Training complete for retailer: {user_id} (model version {model_version})")
 
         return {
             "message": "Training completed",
             "user_id": user_id,
             "products_count": len(products),
             "transactions_count": len(transactions),
-            "rules_generated": len(rules)
+            "rules_generated": len(rules),
+            "model_version": model_version
+        }
+
+    except Exception as e:
+        logger.exception(f"[ERROR] Training Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _train_windowed(user_id: str, window_days: int = None, half_life_days: float = None) -> Dict[str, Any]:
+    """Windowed / decayed retrain, recorded as a training run report."""
+    with training_run(user_id, "windowed") as run:
+        note_inputs(window_days=window_days, half_life_days=half_life_days)
+        result = _run_windowed_training(user_id, window_days, half_life_days)
+        run.finish(result)
+    return result
+
+
+def _run_windowed_training(user_id: str, window_days: int = None, half_life_days: float = None) -> Dict[str, Any]:
+    """Rebuilds MBA rules and CF from summed daily count buckets; no full transaction rescan."""
+    try:
+        logger.info(f"[START] Windowed training for {user_id} (window={window_days}d, half-life={half_life_days}d)")
+        count_store = _get_count_store()
+
+        with stage_timer("train", "counts_refresh"):
+            ingested = count_store.refresh(user_id)
+        with stage_timer("train", "counts_window"):
+            counts = count_store.window(user_id, days=window_days, half_life_days=half_life_days)
+        logger.info(f"[COUNTS] {ingested} new transactions; window covers {counts.days} days, {counts.n_baskets:.1f} weighted baskets")
+        note_inputs(
+            transactions_ingested=ingested, window_buckets=counts.days, weighted_baskets=round(counts.n_baskets, 2),
+            items=len(counts.item_ids), shoppers=len(counts.shopper_ids)
+        )
+
+        if counts.n_baskets <= 0:
+            return {"error": "Insufficient data", "window_days": window_days, "half_life_days": half_life_days}
+
+        # Pair rules only: triples are not kept in the daily buckets
+        from algorithms.mba_topk import rules_from_pair_counts
+        with stage_timer("train", "mba"):
+            pairs = counts.pair_counts.tocoo()
+            rules = rules_from_pair_counts(
+                counts.item_ids, counts.item_counts, pairs.row, pairs.col, pairs.data, counts.n_baskets,
+                k=MBA_TOP_K,
+                metric=MBA_RANK_METRIC,
+                min_support=0.0005,
+                min_confidence=0.05,
+                min_lift=0.3,
+                bundles=MBA_BUNDLES
+            )
+        with stage_timer("train", "save_rules"):
+            save_association_rules(user_id, rules)
+        logger.info(f"[SAVE] Saved {len(rules)} windowed rules to database")
+
+        # Full documents are read on demand (the catalog keeps only its serving table)
+        with stage_timer("train", "load"):
+            products = catalog.products(user_id)
+
+        # Content features do not depend on the window: reuse the served engine when there is one
+        from algorithms.collaborative_based import CollaborativeBasedEngine
+        current = model_registry.get(user_id)
+        content_engine = current.content_engine if current else None
+        if content_engine is None:
+            from algorithms.content_based import ContentBasedEngine
+            content_engine = ContentBasedEngine()
+            with stage_timer("train", "content"):
+                content_engine.fit(products)
+
+        collab_engine = CollaborativeBasedEngine()
+        with stage_timer("train", "collab"):
+            collab_engine.fit_counts(counts.shopper_ids, counts.item_ids, counts.user_item)
+
+        # Popularity / trending decay on their own half-lives within the same window
+        from algorithms.popularity import PopularityModel
+        with stage_timer("train", "popularity"):
+            popularity = PopularityModel()
+            item_ids, (popular, trending) = count_store.decayed_item_counts(
+                user_id, [popularity.half_life_days, popularity.trending_half_life_days], days=window_days
+            )
+            popularity.fit_counts(item_ids, popular, trending, products)
+
+        had_online = _online_state(user_id) is not None
+        model_version = model_registry.publish(user_id, content_engine, collab_engine, popularity)
+        _refresh_online_state(user_id, had_online)
+        _persist_models(user_id, model_version, content_engine, collab_engine, popularity)
+        _record_model_metrics(user_id, model_version, len(rules), content_engine, collab_engine)
+        logger.info(f"[OK] Windowed training complete for retailer: {user_id} (model version {model_version})")
+
+        return {
+            "message": "Training completed",
+            "user_id": user_id,
+            "window_days": window_days,
+            "half_life_days": half_life_days,
+            "window_buckets": counts.days,
+            "weighted_baskets": round(counts.n_baskets, 2),
+            "transactions_ingested": ingested,
+            "rules_generated": len(rules),
+            "model_version": model_version
         }
 
     except Exception as e:
-        print(f"[ERROR] Training Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"[ERROR] Windowed training error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class BasketEvent(BaseModel):
+    shopperId: str
+    items: List[str]
+    timestamp: Optional[str] = None
+
+
+class EventBatch(BaseModel):
+    baskets: List[BasketEvent]
+
+
+@app.post("/api/events/{user_id}")
+def ingest_events(user_id: str, batch: EventBatch):
+    """
+    Applies completed baskets to the retailer's online state so the shopper's
+    next page view reflects them without a batch retrain.
+    """
+    try:
+        state = _get_online_store().get_or_create(user_id, lambda: _seed_online_state(user_id))
+        with stage_timer("events", "apply"):
+            for basket in batch.baskets:
+                state.add_basket(basket.shopperId, basket.items)
+        # Only these shoppers' cached feeds are stale; their cache keys carry the online version
+        return {"success": True, "accepted": len(batch.baskets), "online": state.stats()}
+    except Exception as e:
+        logger.exception(f"[ERROR] Event ingestion error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _feed_version(user_id: str, shopper_id: str) -> str:
+    """Everything a cached feed depends on besides the request itself."""
+    # Catalog edits (prices, stock, expiry) make cached feeds stale as well
+    version = f"{model_registry.version(user_id)}.c{catalog.version(user_id)}"
+    online = _online_state(user_id)
+    if online is not None:
+        version = f"{version}+{online.version(shopper_id or user_id)}"
+    return version
+
+
 @app.get("/api/recommend/{user_id}")
-async def get_recommendations(user_id: str, cart_items: str = ""):
-    """Fetches the Hybrid Feed."""
+def get_recommendations(request: Request, user_id: str, cart_items: str = "", shopper_id: str = "", profile: str = ""):
+    """Fetches the Hybrid Feed (served from the response cache when possible)."""
     try:
-        print(f"\n[RECOMMEND] Generating recommendations for user: {user_id}")
+        _sync_from_store(user_id)
+        mode = _profile_mode(request, profile)
+        if mode:
+            # Profiled requests always run the pipeline so the breakdown is meaningful
+            with profiled(mode, "recommend", user_id) as session:
+                with stage_timer("recommend", "total"):
+                    result = _build_recommendations(user_id, shopper_id or user_id)
+            return json_response({**result, "profile": session.report()})
+
+        with stage_timer("recommend", "total"):
+            cart = [c for c in cart_items.split(",") if c.strip()]
+            cache_key = ResponseCache.make_key(user_id, shopper_id, cart, _feed_version(user_id, shopper_id))
+            result = response_cache.get_or_compute(
+                cache_key,
+                lambda: _build_recommendations(user_id, shopper_id or user_id)
+            )
+        with stage_timer("recommend", "serialize"):
+            return json_response(result)
+
+    except Exception as e:
+        logger.exception(f"[ERROR] Recommendation error: {str(e)}")
+        ranked = _fallback_feed(user_id)
+        if ranked is None:
+            raise HTTPException(status_code=500, detail=str(e))
+        logger.warning(f"[FALLBACK] Serving popularity feed for {user_id}")
+        return json_response(ranked.render())
+
 
-        product_map = get_product_map(user_id)
-        if not product_map:
-            print("[WARN] Product map is empty")
-            return {"success": True, "count": 0, "data": {"feed": [], "near_expiry": []}}
+@app.get("/api/score/{user_id}")
+def get_scores(request: Request, user_id: str, cart_items: str = "", shopper_id: str = "", format: str = ""):
+    """
+    Internal scoring API for the Node backend: the ranked feed as catalog row
+    numbers and scores (see serving/codec.py SCORE_ARRAYS), no product cards.
+    msgpack with ?format=msgpack or Accept: application/x-msgpack, JSON otherwise.
+    Rows index the ids list of /api/score/{user_id}/catalog with the same fingerprint.
+    """
+    try:
+        _sync_from_store(user_id)
+        with stage_timer("score", "total"):
+            cart = [c for c in cart_items.split(",") if c.strip()]
+            version = _feed_version(user_id, shopper_id)
+            # Suffix keeps k[0] == retailer, so invalidate_retailer still drops these entries
+            cache_key = ResponseCache.make_key(user_id, shopper_id, cart, version) + ("score",)
+            ranked = response_cache.get_or_compute(
+                cache_key,
+                lambda: _rank_recommendations(user_id, shopper_id or user_id)
+            )
+        with stage_timer("score", "serialize"):
+            return binary_response(score_payload(ranked, version), wants_msgpack(request, format))
+
+    except Exception as e:
+        logger.exception(f"[ERROR] Scoring error: {str(e)}")
+        ranked = _fallback_feed(user_id)
+        if ranked is None:
+            raise HTTPException(status_code=500, detail=str(e))
+        logger.warning(f"[FALLBACK] Serving popularity scores for {user_id}")
+        return binary_response(score_payload(ranked, f"{model_registry.version(user_id)}.fallback"), wants_msgpack(request, format))
+
+
+@app.get("/api/score/{user_id}/catalog")
+def get_score_catalog(request: Request, user_id: str, format: str = ""):
+    """Row number -> productId list for decoding /api/score responses; cache it by fingerprint."""
+    products = catalog.product_table(user_id)
+    return binary_response(catalog_payload(products), wants_msgpack(request, format))
+
+
+def _build_recommendations(user_id: str, shopper_id: str) -> Dict[str, Any]:
+    """Runs the full recommendation pipeline for one retailer and renders the public feed."""
+    ranked = _rank_recommendations(user_id, shopper_id)
+    if not len(ranked.products):
+        logger.warning("[WARN] Product catalog is empty")
+        return {"success": True, "count": 0, "data": {"feed": [], "near_expiry": []}}
+    with stage_timer("recommend", "render"):
+        return ranked.render()
+
+
+def _fallback_feed(user_id: str, install: bool = True):
+    """
+    Popularity feed from the last loaded catalog and the served models, without
+    touching MongoDB; None when either is missing. Used when the live pipeline
+    fails or the request was shed (install=False: no artifact store read either).
+    """
+    models = model_registry.get(user_id)
+    if models is None and install and _install_from_store(user_id):
+        models = model_registry.get(user_id)
+    products = catalog.cached_table(user_id)
+    if models is None or models.popularity is None or not len(models.popularity) or products is None or not len(products):
+        return None
+    with stage_timer("recommend", "fallback"):
+        ranked = _get_recommender().rank(
+            mba_rules=[],
+            content_scores={},
+            collab_scores=models.popularity.cold_start_scores(),
+            expiry_weights=products.expiry_weights(),
+            product_map=products,
+            business_boosts=products.business_boosts()
+        )
+    ranked.reason = "Popular right now"
+    ranked.fallback = True
+    return ranked
 
-        print(f"[DATA] Loaded {len(product_map)} products")
-        products = list(product_map.values())
-        _, _, expiry_weights = apply_expiry_logic(products)
-        print(f"[EXPIRY] Calculated expiry weights for {len(expiry_weights)} products")
 
-        user_tx = load_transactions(user_id)
+def _rank_recommendations(user_id: str, shopper_id: str):
+    """Scores and ranks the feed as catalog rows (fusion.recommender.RankedFeed); no product cards."""
+    import numpy as np
+    from fusion.recommender import RankedFeed
+
+    logger.debug(f"[RECOMMEND] Generating recommendations for user: {user_id}")
+
+    with stage_timer("recommend", "load"):
+        # In-memory catalog; only products edited since the last sync are read from MongoDB
+        products = catalog.product_table(user_id)
+    if not len(products):
+        return RankedFeed(products, [], np.empty(0, dtype=np.int32))
+
+    with stage_timer("recommend", "expiry"):
+        # Cached on the table per catalog version and day; normally no work at all
+        expiry_weights = products.expiry_weights()
+        business_boosts = products.business_boosts()
+
+    with stage_timer("recommend", "history"):
+        # This shopper's baskets only (indexed on user + shopperId); no shopper id means no history
+        user_tx = load_transactions(user_id, profile=SERVING, shopper_id=shopper_id) if shopper_id else []
         history_ids = []
         for tx in user_tx:
             for item in tx.get("items", []):
                 pid = str(item.get("productId"))
                 if pid:
                     history_ids.append(pid)
-        print(f"[HISTORY] {len(history_ids)} items from {len(user_tx)} transactions")
+    logger.debug(f"[HISTORY] {len(history_ids)} items from {len(user_tx)} transactions")
 
-        content_scores = {}
-        collab_scores = {}
+    content_scores = {}
+    collab_scores = {}
+    models = model_registry.get(user_id)
+    if models is None and _install_from_store(user_id):
+        models = model_registry.get(user_id)
 
-        try:
-            if history_ids:
-                content_scores = content_engine.predict_for_user(list(set(history_ids)))
-                print(f"[CONTENT] {len(content_scores)} products")
-        except Exception as e:
-            print(f"[WARN] Content engine error: {str(e)}")
+    online = _online_state(user_id)
+    if online is not None:
+        # Purchases ingested through /api/events since the last retrain
+        history_ids.extend(online.recent_items(shopper_id))
 
-        try:
-            collab_scores = collab_engine.get_recommendations(user_id)
-            print(f"[COLLAB] {len(collab_scores)} products")
-        except Exception as e:
-            print(f"[WARN] Collaborative engine error: {str(e)}")
+    try:
+        if history_ids and models and models.content_engine:
+            with stage_timer("recommend", "content"):
+                content_scores = models.content_engine.predict_for_user(list(set(history_ids)))
+    except Exception as e:
+        logger.warning(f"[WARN] Content engine error: {str(e)}")
 
-        from bson import ObjectId
-        try:
-            user_oid = ObjectId(user_id)
-        except Exception:
-            user_oid = user_id
+    try:
+        if models and models.collab_engine:
+            with stage_timer("recommend", "collab"):
+                collab_scores = models.collab_engine.get_recommendations(shopper_id)
+    except Exception as e:
+        logger.warning(f"[WARN] Collaborative engine error: {str(e)}")
+
+    if online is not None:
+        with stage_timer("recommend", "online"):
+            owned = online.shopper_items(shopper_id)
+            collab_scores = {pid: s for pid, s in collab_scores.items() if pid not in owned}
+            online_scores = online.recommend(shopper_id)
+            # Bring item-to-item scores onto the CF engine's scale before blending
+            scale = max(collab_scores.values(), default=1.0) / max(online_scores.values(), default=1.0)
+            for pid, score in online_scores.items():
+                collab_scores[pid] = collab_scores.get(pid, 0.0) + score * scale
 
-        rules = list(db[ASSOCIATION_RULES_COL].find({"userId": user_oid}))
-        print(f"[MBA] Found {len(rules)} MBA rules")
+    cold_start = not history_ids and not collab_scores and models is not None and models.popularity is not None
+    if cold_start:
+        with stage_timer("recommend", "cold_start"):
+            # Unknown shopper: precomputed popularity / trending lists stand in for CF
+            collab_scores = models.popularity.cold_start_scores()
 
+    from bson import ObjectId
+    try:
+        user_oid = ObjectId(user_id)
+    except Exception:
+        user_oid = user_id
+
+    with stage_timer("recommend", "mba"):
+        try:
+            rules = list(get_db()[ASSOCIATION_RULES_COL].find({"userId": user_oid}))
+        except Exception as e:
+            logger.warning(f"[WARN] Association rules unavailable: {str(e)}")
+            rules = []
+
+    with stage_timer("recommend", "rules_format"):
         formatted_rules = [
             {
                 "ants": r.get("antecedents", []),
@@ -184,23 +1000,25 @@ async def get_recommendations(user_id: str, cart_items: str = ""):
             for r in rules
         ]
 
-        result = hybrid_recommender.generate_hybrid_recommendations(
+    with stage_timer("recommend", "fusion"):
+        ranked = _get_recommender().rank(
             mba_rules=formatted_rules,
             content_scores=content_scores,
             collab_scores=collab_scores,
             expiry_weights=expiry_weights,
-            product_map=product_map
+            product_map=products,
+            business_boosts=business_boosts
         )
+    if cold_start:
+        ranked.reason = "Popular right now"
 
-        print(f"[OK] Generated {len(result.get('feed', []))} recommendations")
-        return result
-
-    except Exception as e:
-        print(f"[ERROR] Recommendation error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    logger.debug(
+        f"[OK] {len(ranked)} recommendations from {len(products)} products, "
+        f"{len(content_scores)} content, {len(collab_scores)} collab, {len(rules)} MBA rules"
+    )
+    return ranked
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,331 @@
+"""
+Offline evaluation: ranking quality next to fit time, serve latency and memory.
+
+    cd ml-engine
+    python -m benchmarks.evaluate --size medium --k 5 10 20 --output eval.json
+    python -m benchmarks.evaluate --retailer <id> --weights 0.6:0.4 0.8:0.2 0.4:0.6
+
+Transactions are split by time: the oldest (1 - test_fraction) train every
+engine, and each shopper's purchases after the cutoff are the relevant items.
+Products the shopper already bought before the cutoff do not count. Every
+configuration (engines plus fusion weights) ranks its feed through
+ShopFusionRecommender.rank, as /api/recommend does. The flattened feed (bundle
+items in place) is scored with precision@k, recall@k, NDCG@k, hit rate and
+catalog coverage. Configurations that no other one beats on both NDCG and
+p50 serve latency are marked as the frontier.
+"""
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run_benchmarks import _cf_transactions, _git_commit  # noqa: E402
+from benchmarks.synthetic import SIZES, generate_dataset  # noqa: E402
+
+# Engine sets evaluated by default; hybrids are repeated for every --weights pair
+CONFIGS = {
+    "popularity": ("popularity",),
+    "content": ("content",),
+    "collab": ("collab",),
+    "mba": ("mba_topk",),
+    "hybrid": ("content", "collab", "mba_topk", "popularity"),
+    "hybrid_no_mba": ("content", "collab", "popularity"),
+    "hybrid_sampled_mba": ("content", "collab", "mba_sampled", "popularity"),
+}
+
+# Same thresholds as /api/train
+MBA_PARAMS = {"min_support": 0.0005, "min_confidence": 0.05, "min_lift": 0.3}
+
+
+def time_split(transactions: List[Dict[str, Any]], test_fraction: float) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(train, test) at the time quantile 1 - test_fraction; undated transactions train."""
+    from algorithms.popularity import _tx_time
+
+    times = np.array([(_tx_time(t).timestamp() if _tx_time(t) else np.nan) for t in transactions])
+    dated = times[~np.isnan(times)]
+    if not len(dated):
+        raise ValueError("No dated transactions to split")
+    cutoff = np.quantile(dated, 1.0 - test_fraction)
+    test_mask = times > cutoff
+    train = [t for t, is_test in zip(transactions, test_mask) if not is_test]
+    test = [t for t, is_test in zip(transactions, test_mask) if is_test]
+    return train, test
+
+
+def _baskets_by_shopper(transactions: List[Dict[str, Any]]) -> Dict[str, set]:
+    out: Dict[str, set] = {}
+    for t in transactions:
+        shopper = str(t.get("shopperId") or "")
+        if shopper:
+            out.setdefault(shopper, set()).update(str(i.get("productId")) for i in (t.get("items") or []) if i.get("productId"))
+    return out
+
+
+def ranking_metrics(recommended: np.ndarray, relevant_users: np.ndarray, relevant_items: np.ndarray, n_items: int, ks: Sequence[int]) -> Dict[str, float]:
+    """
+    recommended: (shoppers, depth) item codes best first, -1 padded.
+    relevant_users / relevant_items: one (shopper row, item code) pair per relevant item.
+    Every shopper row must have at least one relevant item.
+    """
+    n_users, depth = recommended.shape
+    n_relevant = np.bincount(relevant_users, minlength=n_users)
+    valid = recommended >= 0
+    keys = np.arange(n_users, dtype=np.int64)[:, None] * n_items + recommended
+    hits = valid & np.isin(keys, relevant_users.astype(np.int64) * n_items + relevant_items)
+
+    discounts = 1.0 / np.log2(np.arange(2, depth + 2))
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])
+    out = {}
+    for k in ks:
+        top = hits[:, :k]
+        n_hits = top.sum(axis=1)
+        dcg = (top * discounts[:k]).sum(axis=1)
+        shown = recommended[:, :k][valid[:, :k]]
+        out[f"precision@{k}"] = float(np.mean(n_hits / k))
+        out[f"recall@{k}"] = float(np.mean(n_hits / n_relevant))
+        out[f"ndcg@{k}"] = float(np.mean(dcg / ideal[np.minimum(n_relevant, k)]))
+        out[f"hit_rate@{k}"] = float(np.mean(n_hits > 0))
+        out[f"coverage@{k}"] = len(np.unique(shown)) / n_items if n_items else 0.0
+    return out
+
+
+def _fit(component: str, products: List[Dict[str, Any]], train: List[Dict[str, Any]]) -> Any:
+    if component == "content":
+        from algorithms.content_based import ContentBasedEngine
+        engine = ContentBasedEngine()
+        engine.fit(products)
+        return engine
+    if component == "collab":
+        from algorithms.collaborative_based import CollaborativeBasedEngine
+        engine = CollaborativeBasedEngine()
+        engine.fit(_cf_transactions(train))
+        return engine
+    if component == "popularity":
+        from algorithms.popularity import PopularityModel
+        return PopularityModel().fit(train, products)
+    if component in ("mba_topk", "mba_sampled"):
+        from config import MBA_APPROX_EPSILON, MBA_BUNDLES, MBA_RANK_METRIC, MBA_TOP_K
+        if component == "mba_topk":
+            from algorithms.mba_topk import run_mba_topk
+            rules = run_mba_topk(train, k=MBA_TOP_K, metric=MBA_RANK_METRIC, bundles=MBA_BUNDLES, **MBA_PARAMS)
+        else:
+            from algorithms.mba_sampling import run_mba_sampled
+            rules, _ = run_mba_sampled(
+                train, epsilon=MBA_APPROX_EPSILON, k=MBA_TOP_K, metric=MBA_RANK_METRIC,
+                bundles=MBA_BUNDLES, itemsets="closed" if MBA_BUNDLES else "all", **MBA_PARAMS
+            )
+        # Already in the {ants, cons, confidence, lift} shape the fusion reads
+        return rules
+    raise ValueError(f"Unknown component {component}")
+
+
+def fit_components(components: Sequence[str], products: List[Dict[str, Any]], train: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Fits each component once (timed), again under tracemalloc for its peak, and sizes the pickled model."""
+    fitted = {}
+    for component in components:
+        start = time.perf_counter()
+        model = _fit(component, products, train)
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            _fit(component, products, train)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        fitted[component] = {
+            "model": model,
+            "fit_seconds": seconds,
+            "fit_peak_mb": peak / (1024 * 1024),
+            "model_mb": len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / (1024 * 1024),
+        }
+        print(f"  fit {component:<12} {seconds:>8.3f}s  peak {fitted[component]['fit_peak_mb']:>8.2f} MB")
+    return fitted
+
+
+def _feed_codes(weights: Tuple[float, float], models: Dict[str, Any], shopper: str, history: List[str],
+                table, expiry_weights: np.ndarray, business_boosts: np.ndarray, depth: int, recommender) -> np.ndarray:
+    """One shopper's feed as catalog rows, best first, bundle items in place and duplicates dropped."""
+    content_scores = models["content"].predict_for_user(history, top_n=depth) if "content" in models and history else {}
+    collab_scores = models["collab"].get_recommendations(shopper, top_n=depth) if "collab" in models else {}
+    if "popularity" in models and not content_scores and not collab_scores:
+        # Like the serving path: nobody knows the shopper, so popularity stands in for CF
+        collab_scores = models["popularity"].cold_start_scores()
+    rules = models.get("mba_topk") or models.get("mba_sampled") or []
+
+    feed = recommender.rank(
+        mba_rules=rules,
+        content_scores=content_scores,
+        collab_scores=collab_scores,
+        expiry_weights=expiry_weights,
+        product_map=table,
+        max_recommendations=depth,
+        collab_weight=weights[0],
+        content_weight=weights[1],
+        business_boosts=business_boosts
+    )
+    _, first = np.unique(feed.rows, return_index=True)
+    return feed.rows[np.sort(first)][:depth]
+
+
+def evaluate(products: List[Dict[str, Any]], transactions: List[Dict[str, Any]], ks: Sequence[int],
+             weights: Sequence[Tuple[float, float]], configs: Sequence[str], test_fraction: float,
+             max_shoppers: int, seed: int) -> Dict[str, Any]:
+    from data.product_table import ProductTable
+    from fusion.recommender import ShopFusionRecommender
+
+    train, test = time_split(transactions, test_fraction)
+    table = ProductTable.from_products(products)
+    expiry_weights = table.expiry_weights()
+    business_boosts = table.business_boosts()
+    depth = max(ks)
+
+    # Relevant: items bought after the cutoff that the shopper had not bought before it
+    history = _baskets_by_shopper(train)
+    shoppers, relevant = [], []
+    for shopper, items in sorted(_baskets_by_shopper(test).items()):
+        codes = table.codes(items - history.get(shopper, set()))
+        codes = codes[codes >= 0]
+        if len(codes):
+            shoppers.append(shopper)
+            relevant.append(codes)
+    if max_shoppers and len(shoppers) > max_shoppers:
+        keep = np.sort(np.random.default_rng(seed).choice(len(shoppers), max_shoppers, replace=False))
+        shoppers, relevant = [shoppers[i] for i in keep], [relevant[i] for i in keep]
+    if not shoppers:
+        raise ValueError("No shopper bought anything new after the cutoff")
+    relevant_users = np.repeat(np.arange(len(shoppers)), [len(r) for r in relevant])
+    relevant_items = np.concatenate(relevant)
+    cold = sum(1 for s in shoppers if s not in history)
+    print(f"[EVAL] {len(train)} train / {len(test)} test transactions, {len(shoppers)} shoppers ({cold} without history)")
+
+    components = sorted({c for name in configs for c in CONFIGS[name]})
+    fitted = fit_components(components, products, train)
+    recommender = ShopFusionRecommender()
+
+    results = []
+    for name in configs:
+        engines = CONFIGS[name]
+        hybrid = "content" in engines and "collab" in engines
+        # Single-engine configs rank on that engine alone: its weight 1, the other 0
+        variants = weights if hybrid else [(1.0, 0.0) if "content" not in engines else (0.0, 1.0)]
+        models = {c: fitted[c]["model"] for c in engines}
+        for w in variants:
+            label = f"{name}[{w[0]:g}/{w[1]:g}]" if hybrid and len(weights) > 1 else name
+            recommended = np.full((len(shoppers), depth), -1, dtype=np.int64)
+            latencies = np.empty(len(shoppers))
+            for i, shopper in enumerate(shoppers):
+                start = time.perf_counter()
+                rows = _feed_codes(w, models, shopper, sorted(history.get(shopper, ())), table, expiry_weights, business_boosts, depth, recommender)
+                latencies[i] = time.perf_counter() - start
+                recommended[i, :len(rows)] = rows
+
+            result = {
+                "config": label,
+                "engines": list(engines),
+                "collab_weight": w[0],
+                "content_weight": w[1],
+                **{m: round(v, 4) for m, v in ranking_metrics(recommended, relevant_users, relevant_items, len(table), ks).items()},
+                "fit_seconds": round(sum(fitted[c]["fit_seconds"] for c in engines), 4),
+                "fit_peak_mb": round(max(fitted[c]["fit_peak_mb"] for c in engines), 3),
+                "model_mb": round(sum(fitted[c]["model_mb"] for c in engines), 3),
+                "serve_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                "serve_ms_p95": round(float(np.percentile(latencies, 95)) * 1000, 3),
+            }
+            results.append(result)
+
+    # Quality / speed frontier: not beaten on NDCG at the largest k and p50 latency at once
+    quality = f"ndcg@{depth}"
+    for r in results:
+        r["frontier"] = not any(
+            o[quality] >= r[quality] and o["serve_ms_p50"] <= r["serve_ms_p50"]
+            and (o[quality] > r[quality] or o["serve_ms_p50"] < r["serve_ms_p50"])
+            for o in results
+        )
+
+    return {
+        "split": {
+            "test_fraction": test_fraction,
+            "train_transactions": len(train),
+            "test_transactions": len(test),
+            "shoppers": len(shoppers),
+            "shoppers_without_history": cold,
+            "relevant_items": int(len(relevant_items)),
+            "catalog": len(table),
+        },
+        "results": results,
+    }
+
+
+def _print(report: Dict[str, Any], ks: Sequence[int]) -> None:
+    k = max(ks)
+    print(f"\n{'config':<28} {'P@' + str(k):>7} {'R@' + str(k):>7} {'NDCG@' + str(k):>8} {'cov':>6} {'fit s':>8} {'model MB':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in report["results"]:
+        print(
+            f"{r['config']:<28} {r[f'precision@{k}']:>7.4f} {r[f'recall@{k}']:>7.4f} {r[f'ndcg@{k}']:>8.4f} "
+            f"{r[f'coverage@{k}']:>6.3f} {r['fit_seconds']:>8.3f} {r['model_mb']:>9.3f} {r['serve_ms_p50']:>8.3f} "
+            f"{r['serve_ms_p95']:>8.3f}{'  *' if r['frontier'] else ''}"
+        )
+    print("  * quality / latency frontier")
+
+
+def _weight_pair(value: str) -> Tuple[float, float]:
+    collab, content = value.split(":")
+    return float(collab), float(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=sorted(SIZES), default="small", help="synthetic dataset preset")
+    parser.add_argument("--retailer", help="evaluate this retailer's MongoDB data instead of synthetic data")
+    parser.add_argument("--configs", nargs="+", choices=sorted(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--weights", nargs="+", type=_weight_pair, default=[(0.6, 0.4)], help="collab:content fusion weights for hybrids")
+    parser.add_argument("--k", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="newest share of transactions held out")
+    parser.add_argument("--max-shoppers", type=int, default=1000, help="evaluated shoppers (sampled); 0 = all")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    if args.retailer:
+        from data.loader import load_products, load_transactions
+        from db import TRAINING
+        products, transactions = load_products(args.retailer, profile=TRAINING), load_transactions(args.retailer)
+        source = {"retailer": args.retailer}
+    else:
+        products, transactions = generate_dataset(args.size, seed=args.seed)
+        source = {"size": args.size, **SIZES[args.size]}
+    print(f"[EVAL] {len(products)} products, {len(transactions)} transactions")
+
+    report = evaluate(products, transactions, sorted(args.k), args.weights, args.configs, args.test_fraction, args.max_shoppers, args.seed)
+    report["meta"] = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "source": source,
+        "k": sorted(args.k),
+    }
+    _print(report, args.k)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[EVAL] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Algorithm micro-benchmarks on synthetic retail data.
+
+    cd ml-engine
+    python -m benchmarks.run_benchmarks --sizes small medium --output bench.json
+    python -m benchmarks.run_benchmarks --sizes small --compare bench.json
+
+Each benchmark records wall time (min/median over --repeat runs) and the
+tracemalloc peak of one extra run, so results can be diffed between commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SIZES, generate_dataset  # noqa: E402
+
+# Confidence/lift match /api/train. Its min_support=0.0005 makes every itemset
+# seen twice frequent on small synthetic sets, so the default here is higher;
+# pass --min-support 0.0005 to reproduce the production setting.
+MBA_PARAMS = {"min_support": 0.005, "min_confidence": 0.05, "min_lift": 0.3}
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    timings = []
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds_min": round(min(timings), 6),
+        "seconds_median": round(statistics.median(timings), 6),
+        "peak_mb": round(peak / (1024 * 1024), 3),
+        "output_size": len(output) if hasattr(output, "__len__") else None,
+    }
+
+
+def _cf_transactions(transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # The CF engine groups by "userId"; key synthetic baskets by shopper so the
+    # user-item matrix has realistic shape.
+    return [{"userId": t["shopperId"], "items": t["items"]} for t in transactions]
+
+
+def _uncached(table):
+    """Drops the table's per-day boost cache so a case measures the computation itself."""
+    table._boosts = None
+    return table
+
+
+def build_cases(products, transactions) -> Dict[str, Callable[[], Any]]:
+    """Returns {benchmark name: zero-arg callable}. Fitted engines are reused by predict cases."""
+    from algorithms.mba import run_mba
+    from algorithms.mba_topk import run_mba_topk
+    from algorithms.content_based import ContentBasedEngine
+    from algorithms.collaborative_based import CollaborativeBasedEngine
+    from algorithms.expiry import apply_expiry_logic
+    from data.product_table import ProductTable
+    from fusion.recommender import ShopFusionRecommender
+
+    cases: Dict[str, Callable[[], Any]] = {}
+    cases["run_mba"] = lambda: run_mba(transactions, **MBA_PARAMS)
+    cases["run_mba_topk"] = lambda: run_mba_topk(transactions, k=500, **MBA_PARAMS)
+
+    try:
+        from algorithms.mba_optimized import run_mba_optimized
+        cases["run_mba_optimized"] = lambda: run_mba_optimized(transactions, **MBA_PARAMS)
+    except ImportError as e:
+        print(f"[SKIP] run_mba_optimized: {e}")
+
+    cf_txns = _cf_transactions(transactions)
+    shopper = cf_txns[0]["userId"]
+    history = list({i["productId"] for t in cf_txns if t["userId"] == shopper for i in t["items"]})
+
+    content = ContentBasedEngine()
+    collab = CollaborativeBasedEngine()
+    content.fit(products)
+    collab.fit(cf_txns)
+
+    cases["content.fit"] = lambda: ContentBasedEngine().fit(products)
+    cases["content.predict_for_user"] = lambda: content.predict_for_user(history)
+    cases["collab.fit"] = lambda: CollaborativeBasedEngine().fit(cf_txns)
+    cases["collab.get_recommendations"] = lambda: collab.get_recommendations(shopper)
+
+    product_table = ProductTable.from_products(products)
+    expiry_weights = product_table.expiry_weights()
+    business_boosts = product_table.business_boosts()
+    rules = run_mba_topk(transactions, k=500, **MBA_PARAMS)
+    content_scores = content.predict_for_user(history)
+    collab_scores = collab.get_recommendations(shopper)
+    recommender = ShopFusionRecommender()
+
+    cases["expiry"] = lambda: apply_expiry_logic(products)[2]
+    cases["product_table"] = lambda: ProductTable.from_products(products)
+    cases["expiry_weights"] = lambda: _uncached(product_table).expiry_weights()
+    # Paid once per catalog version and day; requests reuse the table's cached arrays
+    cases["business_boosts"] = lambda: _uncached(product_table).business_boosts()
+    cases["fusion"] = lambda: recommender.generate_hybrid_recommendations(
+        mba_rules=rules,
+        content_scores=content_scores,
+        collab_scores=collab_scores,
+        expiry_weights=expiry_weights,
+        product_map=product_table,
+        business_boosts=business_boosts
+    )["feed"]
+    return cases
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(sizes: List[str], repeat: int, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    import numpy as np
+    import pandas as pd
+
+    results = []
+    for size in sizes:
+        products, transactions = generate_dataset(size)
+        print(f"[BENCH] {size}: {len(products)} products, {len(transactions)} transactions")
+        for name, fn in build_cases(products, transactions).items():
+            if only and name not in only:
+                continue
+            stats = _measure(fn, repeat)
+            results.append({"benchmark": name, "size": size, **SIZES[size], **stats})
+            print(f"  {name:<28} median {stats['seconds_median']:>9.4f}s  peak {stats['peak_mb']:>8.2f} MB")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "mba_params": dict(MBA_PARAMS),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> int:
+    """Prints time/memory ratios vs a baseline file. Returns the number of regressions."""
+    base = {(r["benchmark"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = 0
+    print(f"\n{'benchmark':<28} {'size':<7} {'time x':>8} {'mem x':>8}")
+    for r in current["results"]:
+        b = base.get((r["benchmark"], r["size"]))
+        if not b:
+            continue
+        t_ratio = r["seconds_median"] / b["seconds_median"] if b["seconds_median"] else float("inf")
+        m_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] else 1.0
+        flag = ""
+        if t_ratio > threshold or m_ratio > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{r['benchmark']:<28} {r['size']:<7} {t_ratio:>8.2f} {m_ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ShopFusion ML algorithms on synthetic data.")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["small"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    parser.add_argument("--min-support", type=float, default=MBA_PARAMS["min_support"], help="MBA min_support")
+    parser.add_argument("--output", help="write JSON results to this path")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="ratio above which a result counts as a regression")
+    args = parser.parse_args()
+
+    MBA_PARAMS["min_support"] = args.min_support
+    current = run(args.sizes, args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"[BENCH] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
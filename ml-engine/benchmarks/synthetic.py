@@ -0,0 +1,189 @@
+"""
+Synthetic retail data shaped like the products / transactions collections
+(and the products_dataset.xlsx / transactions_dataset.xlsx imports).
+
+Item popularity follows a Zipf law, shoppers lean towards a few favourite
+categories, and a fraction of items have a complementary "partner" item so
+market basket analysis has real co-purchase structure to find.
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+CATEGORIES = [
+    "Dairy", "Bakery", "Beverages", "Snacks", "Produce", "Frozen",
+    "Meat", "Household", "Personal Care", "Pantry", "Baby", "Pet"
+]
+ADJECTIVES = ["Fresh", "Organic", "Classic", "Premium", "Daily", "Family", "Lite", "Spicy", "Sweet", "Whole"]
+NOUNS = ["Milk", "Bread", "Juice", "Chips", "Apples", "Pizza", "Chicken", "Soap", "Shampoo", "Rice",
+         "Paneer", "Butter", "Cookies", "Tea", "Coffee", "Yogurt", "Cheese", "Pasta", "Diapers", "Kibble"]
+
+# Presets used by the benchmark runner (skus, shoppers, transactions)
+SIZES = {
+    "small": {"n_products": 200, "n_shoppers": 300, "n_transactions": 2_000},
+    "medium": {"n_products": 1_000, "n_shoppers": 2_000, "n_transactions": 20_000},
+    "large": {"n_products": 5_000, "n_shoppers": 20_000, "n_transactions": 200_000},
+}
+
+
+def zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    """Normalized Zipf popularity for ranks 1..n."""
+    weights = 1.0 / np.power(np.arange(1, n + 1, dtype=np.float64), exponent)
+    return weights / weights.sum()
+
+
+def generate_products(n_products: int, retailer_id: str = "000000000000000000000001", seed: int = 7) -> List[Dict[str, Any]]:
+    """Catalog documents with the fields the Product model stores."""
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    products = []
+
+    for i in range(n_products):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        name = f"{ADJECTIVES[rng.integers(len(ADJECTIVES))]} {NOUNS[rng.integers(len(NOUNS))]} {i}"
+        perishable = category in ("Dairy", "Bakery", "Produce", "Meat")
+        expiry = now + timedelta(days=int(rng.integers(-3, 60))) if perishable else None
+
+        products.append({
+            "_id": f"{i:024x}",
+            "user": retailer_id,
+            "productId": f"SKU{i:06d}",
+            "name": name,
+            "category": category,
+            "price": round(float(rng.uniform(0.5, 50.0)), 2),
+            "description": f"{name} from our {category.lower()} range, great value {ADJECTIVES[i % len(ADJECTIVES)].lower()} choice",
+            "image": f"https://cdn.example.com/img/SKU{i:06d}.jpg",
+            "stock": int(rng.integers(0, 500)),
+            "features": [category.lower(), "synthetic"],
+            "expiryDate": expiry,
+            "status": "ACTIVE",
+            "discount": int(rng.choice([0, 0, 0, 5, 10, 20, 30])),
+            "margin": (0, 15, 25, 40)[i % 4],
+            "createdAt": now - timedelta(days=90),
+            "updatedAt": now - timedelta(days=int(rng.integers(0, 90))),
+        })
+
+    return products
+
+
+def generate_transactions(
+    products: List[Dict[str, Any]],
+    n_shoppers: int,
+    n_transactions: int,
+    mean_basket_size: float = 4.0,
+    zipf_exponent: float = 1.1,
+    complement_rate: float = 0.35,
+    days: int = 90,
+    retailer_id: str = "000000000000000000000001",
+    seed: int = 11
+) -> List[Dict[str, Any]]:
+    """Transaction documents (one per basket) with the fields the Transaction model stores."""
+    rng = np.random.default_rng(seed)
+    n_products = len(products)
+    now = datetime.now(timezone.utc)
+
+    popularity = zipf_weights(n_products, zipf_exponent)
+    # Shuffle so popular items are spread across categories
+    order = rng.permutation(n_products)
+    popularity = popularity[np.argsort(order)]
+
+    categories = np.array([CATEGORIES.index(p["category"]) for p in products])
+    partners = rng.permutation(n_products)
+    favourite = rng.integers(0, len(CATEGORIES), size=n_shoppers)
+
+    basket_sizes = np.maximum(1, rng.poisson(mean_basket_size - 1, size=n_transactions) + 1)
+    shoppers = rng.choice(n_shoppers, size=n_transactions, p=zipf_weights(n_shoppers, 0.8))
+    offsets = rng.uniform(0, days * 86400, size=n_transactions)
+
+    # One cumulative distribution per favourite category (shoppers weight it 4x)
+    cdfs = []
+    for c in range(len(CATEGORIES)):
+        weights = popularity * np.where(categories == c, 4.0, 1.0)
+        cdfs.append(np.cumsum(weights / weights.sum()))
+
+    transactions = []
+
+    for t in range(n_transactions):
+        shopper = int(shoppers[t])
+        size = min(int(basket_sizes[t]), n_products)
+        draws = np.searchsorted(cdfs[favourite[shopper]], rng.random(size * 2))
+        chosen = set()
+        for idx in draws.tolist():
+            chosen.add(min(idx, n_products - 1))
+            if len(chosen) >= size:
+                break
+        for idx in list(chosen):
+            if rng.random() < complement_rate:
+                chosen.add(int(partners[idx]))
+
+        items = []
+        total = 0.0
+        for idx in chosen:
+            p = products[idx]
+            qty = int(rng.integers(1, 4))
+            items.append({
+                "productId": p["productId"],
+                "productRef": p["_id"],
+                "productName": p["name"],
+                "quantity": qty,
+                "price": p["price"],
+            })
+            total += qty * p["price"]
+
+        ts = now - timedelta(seconds=float(offsets[t]))
+        transactions.append({
+            "_id": f"{t:024x}",
+            "transactionId": f"TXN{t:08d}",
+            "shopperId": f"SHOP{shopper:06d}",
+            "items": items,
+            "totalAmount": round(total, 2),
+            "timestamp": ts,
+            "user": retailer_id,
+            "createdAt": ts,
+        })
+
+    return transactions
+
+
+def generate_dataset(size: str = "small", seed: int = 7, **overrides) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Convenience wrapper: (products, transactions) for a named size preset."""
+    params = {**SIZES[size], **overrides}
+    products = generate_products(params.pop("n_products"), seed=seed)
+    transactions = generate_transactions(products, seed=seed + 1, **params)
+    return products, transactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic ShopFusion retail dataset as JSON lines.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--products", type=int, help="override number of SKUs")
+    parser.add_argument("--shoppers", type=int, help="override number of shoppers")
+    parser.add_argument("--transactions", type=int, help="override number of baskets")
+    parser.add_argument("--basket-size", type=float, default=4.0, help="mean basket size")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for item popularity")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out-prefix", default="synthetic", help="writes <prefix>_products.jsonl and <prefix>_transactions.jsonl")
+    args = parser.parse_args()
+
+    overrides = {"mean_basket_size": args.basket_size, "zipf_exponent": args.zipf}
+    if args.products:
+        overrides["n_products"] = args.products
+    if args.shoppers:
+        overrides["n_shoppers"] = args.shoppers
+    if args.transactions:
+        overrides["n_transactions"] = args.transactions
+
+    products, transactions = generate_dataset(args.size, seed=args.seed, **overrides)
+    for name, docs in (("products", products), ("transactions", transactions)):
+        with open(f"{args.out_prefix}_{name}.jsonl", "w") as f:
+            for doc in docs:
+                f.write(json.dumps(doc, default=str) + "\n")
+    print(f"Wrote {len(products)} products and {len(transactions)} transactions")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,111 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("DB_NAME", "shopfusion")
\ No newline at end of file
+DB_NAME = os.getenv("DB_NAME", "shopfusion")
+
+# MongoDB client profiles: request-path lookups and training scans use separate pools
+MONGO_SERVING_POOL_SIZE = int(os.getenv("MONGO_SERVING_POOL_SIZE", "50"))
+MONGO_SERVING_TIMEOUT_MS = int(os.getenv("MONGO_SERVING_TIMEOUT_MS", "2000"))  # socket / server selection / wait-queue timeout
+MONGO_TRAINING_POOL_SIZE = int(os.getenv("MONGO_TRAINING_POOL_SIZE", "8"))
+# Full-history scans go to secondaries when the cluster has them, keeping load off the primary
+MONGO_TRAINING_READ_PREFERENCE = os.getenv("MONGO_TRAINING_READ_PREFERENCE", "secondaryPreferred")
+# Wire compression for training reads, in preference order (zstd / snappy need the python-zstandard / python-snappy packages)
+MONGO_TRAINING_COMPRESSORS = os.getenv("MONGO_TRAINING_COMPRESSORS", "zlib")
+MONGO_TRAINING_BATCH_SIZE = int(os.getenv("MONGO_TRAINING_BATCH_SIZE", "10000"))
+# Long scans keep their cursor past the server's 10-minute idle timeout (closed explicitly when done)
+MONGO_TRAINING_NO_CURSOR_TIMEOUT = os.getenv("MONGO_TRAINING_NO_CURSOR_TIMEOUT", "true").lower() in ("1", "true", "yes")
+
+# Recommendation response cache (LRU + TTL, invalidated on model publish)
+RECOMMEND_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", "2048"))
+RECOMMEND_CACHE_TTL = float(os.getenv("RECOMMEND_CACHE_TTL", "300"))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Where fitted models are persisted for warm starts (use /tmp on read-only hosts such as Vercel)
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_store"))
+WARM_LOAD_MODELS = os.getenv("WARM_LOAD_MODELS", "true").lower() in ("1", "true", "yes")
+# Map persisted model arrays read-only (shared by all workers) instead of copying them into each process
+MODEL_MMAP = os.getenv("MODEL_MMAP", "true").lower() in ("1", "true", "yes")
+MODEL_MMAP_MIN_BYTES = int(os.getenv("MODEL_MMAP_MIN_BYTES", "65536"))
+# Seconds between checks for a newer version published by another worker
+MODEL_SYNC_INTERVAL = float(os.getenv("MODEL_SYNC_INTERVAL", "10"))
+
+# Batch training scheduler (python -m training.scheduler): one process per concurrent retailer
+TRAIN_SCHEDULER_WORKERS = int(os.getenv("TRAIN_SCHEDULER_WORKERS", "0")) or None  # defaults to all cores
+TRAIN_SCHEDULER_MEMORY_MB = float(os.getenv("TRAIN_SCHEDULER_MEMORY_MB", "4096"))  # estimated peak memory of concurrent jobs
+
+# Training run reports (GET /api/train/{user_id}/runs): kept per retailer; tracemalloc adds Python allocation peaks but slows training
+TRAIN_REPORTS_KEEP = int(os.getenv("TRAIN_REPORTS_KEEP", "50"))
+TRAIN_REPORT_TRACEMALLOC = os.getenv("TRAIN_REPORT_TRACEMALLOC", "false").lower() == "true"
+
+# Worker processes for partitioned MBA mining (defaults to all cores)
+MBA_WORKERS = int(os.getenv("MBA_WORKERS", "0")) or None
+
+# Approximate (sampled) MBA for very large retailers; 0 disables
+MBA_APPROX_MIN_TRANSACTIONS = int(os.getenv("MBA_APPROX_MIN_TRANSACTIONS", "1000000"))
+MBA_APPROX_EPSILON = float(os.getenv("MBA_APPROX_EPSILON", "0.25"))   # relative support slack: smaller = bigger sample
+MBA_APPROX_TIME_BUDGET = float(os.getenv("MBA_APPROX_TIME_BUDGET", "0")) or None  # seconds; 0 = always verify fully
+
+# Rules (bundles) kept per retailer, ranked by lift | confidence | confidence_lift
+MBA_TOP_K = int(os.getenv("MBA_TOP_K", "200"))
+MBA_RANK_METRIC = os.getenv("MBA_RANK_METRIC", "lift")
+# One canonical rule per itemset, dropping bundles with no gain over a simpler one
+MBA_BUNDLES = os.getenv("MBA_BUNDLES", "true").lower() in ("1", "true", "yes")
+# Count item supports in MongoDB and fetch MBA baskets already restricted to frequent items
+MBA_PUSHDOWN = os.getenv("MBA_PUSHDOWN", "true").lower() in ("1", "true", "yes")
+
+# Cold-start feed: recency-weighted popularity (long half-life) and per-category trending (short half-life)
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "30"))
+TRENDING_HALF_LIFE_DAYS = float(os.getenv("TRENDING_HALF_LIFE_DAYS", "7"))
+POPULARITY_TOP_N = int(os.getenv("POPULARITY_TOP_N", "100"))
+TRENDING_PER_CATEGORY = int(os.getenv("TRENDING_PER_CATEGORY", "10"))
+
+# Business boosts multiplied into fusion scores with expiry: 1 + log1p(discount / 100) * DISCOUNT_BOOST_FACTOR
+# and 1 + margin / 100 * MARGIN_BOOST_FACTOR (product "discount" / "margin", in percent); 0 turns one off
+DISCOUNT_BOOST_FACTOR = float(os.getenv("DISCOUNT_BOOST_FACTOR", "0.4"))
+MARGIN_BOOST_FACTOR = float(os.getenv("MARGIN_BOOST_FACTOR", "0.2"))
+
+# Daily item / pair / shopper-item count buckets for windowed and decayed retrains
+COUNT_STORE_DIR = os.getenv("COUNT_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "count_store"))
+
+# Catalog delta sync: seconds between updatedAt polls, between full _id reconciles (deletes);
+# a change stream replaces the polls where the deployment supports it (replica sets)
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "5"))
+CATALOG_RECONCILE_INTERVAL = float(os.getenv("CATALOG_RECONCILE_INTERVAL", "300"))
+CATALOG_CHANGE_STREAM = os.getenv("CATALOG_CHANGE_STREAM", "true").lower() in ("1", "true", "yes")
+
+# Online event ingestion: neighbours kept per item, events between compactions
+ONLINE_NEIGHBOURS = int(os.getenv("ONLINE_NEIGHBOURS", "20"))
+ONLINE_COMPACT_EVERY = int(os.getenv("ONLINE_COMPACT_EVERY", "1000"))
+# Seconds between background compactions of every retailer's pending events (0 disables)
+ONLINE_COMPACT_INTERVAL = float(os.getenv("ONLINE_COMPACT_INTERVAL", "60"))
+
+# Admission control: concurrent requests, wait-queue length and longest queueing time per class.
+# Storefront requests (/api/recommend, /api/score) that cannot be admitted get a cached or popularity
+# feed instead; rejected trainings get 503. A limit of 0 turns the class's admission control off.
+ADMISSION_SERVE_CONCURRENCY = int(os.getenv("ADMISSION_SERVE_CONCURRENCY", "32"))  # stays under the 40-thread worker pool
+ADMISSION_SERVE_QUEUE = int(os.getenv("ADMISSION_SERVE_QUEUE", "64"))
+ADMISSION_SERVE_WAIT_MS = float(os.getenv("ADMISSION_SERVE_WAIT_MS", "200"))
+ADMISSION_TRAIN_CONCURRENCY = int(os.getenv("ADMISSION_TRAIN_CONCURRENCY", "1"))  # also the training thread count
+ADMISSION_TRAIN_QUEUE = int(os.getenv("ADMISSION_TRAIN_QUEUE", "8"))
+ADMISSION_TRAIN_WAIT_S = float(os.getenv("ADMISSION_TRAIN_WAIT_S", "120"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # Retry-After seconds on 503
+
+# Tenant affinity: each retailer is owned by one pod (consistent hash over the peer list).
+# Peers come from AFFINITY_PEERS (comma-separated base URLs) or, when AFFINITY_PEERS_DNS names a
+# headless Service, from its pod IPs (re-resolved every AFFINITY_REFRESH_INTERVAL seconds).
+# AFFINITY_SELF is this pod's own entry (defaults to http://$POD_IP:$PORT). Non-owners
+# forward the request (or redirect with AFFINITY_MODE=redirect); "off" serves every retailer locally.
+AFFINITY_MODE = os.getenv("AFFINITY_MODE", "forward").lower()
+AFFINITY_PEERS = [p.strip().rstrip("/") for p in os.getenv("AFFINITY_PEERS", "").split(",") if p.strip()]
+AFFINITY_PEERS_DNS = os.getenv("AFFINITY_PEERS_DNS", "")
+AFFINITY_PORT = int(os.getenv("PORT", "8000"))
+AFFINITY_SELF = os.getenv("AFFINITY_SELF", f"http://{os.getenv('POD_IP')}:{AFFINITY_PORT}" if os.getenv("POD_IP") else "").rstrip("/")
+AFFINITY_VNODES = int(os.getenv("AFFINITY_VNODES", "128"))
+AFFINITY_REFRESH_INTERVAL = float(os.getenv("AFFINITY_REFRESH_INTERVAL", "15"))
+AFFINITY_TIMEOUT = float(os.getenv("AFFINITY_TIMEOUT", "10"))      # seconds per forwarded request (training waits)
+AFFINITY_RETRY_AFTER = float(os.getenv("AFFINITY_RETRY_AFTER", "10"))  # seconds an unreachable owner is served locally
+# Forwarded requests are only trusted with the peers' shared AFFINITY_SECRET or, without one, from a peer's
+# address; otherwise any client could skip routing. PUT /api/affinity/peers exists only with AFFINITY_PEERS_API.
+AFFINITY_SECRET = os.getenv("AFFINITY_SECRET", "")
+AFFINITY_PEERS_API = os.getenv("AFFINITY_PEERS_API", "false").lower() in ("1", "true", "yes")  # local tests only
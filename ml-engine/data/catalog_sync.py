@@ -0,0 +1,266 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import CATALOG_RECONCILE_INTERVAL, CATALOG_SYNC_INTERVAL
+from db import SERVING, TRAINING
+from data.loader import PRODUCTS_COL, _normalize_product, load_product_ids, load_products
+from data.product_table import FIELDS, ProductTable
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogTable:
+    """
+    One retailer's serving table plus its sync watermark.
+
+    Product documents are not kept: the ProductTable holds the fields serving
+    reads, and "seen" maps each Mongo _id to its updatedAt and a signature of
+    those fields, for change detection and reconcile. Changes wait in
+    "pending" / "removed" until the next product_table() rebuilds the table
+    from its own rows (ProductTable.documents()) plus the changed documents.
+    """
+
+    def __init__(self):
+        self.seen: Dict[str, Tuple[Optional[datetime], int]] = {}
+        self.watermark: Optional[datetime] = None
+        self.version = 0
+        self.loaded = False
+        self.synced_at = 0.0
+        self.reconciled_at = 0.0
+        self.lock = threading.Lock()
+        self._table: Optional[ProductTable] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._removed: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.seen)
+
+    def apply(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """Upserts product documents; returns how many changed a field the table reads."""
+        changed = 0
+        for doc in docs:
+            updated = doc.get("updatedAt")
+            if not isinstance(updated, datetime):
+                updated = None
+            if updated is not None and (self.watermark is None or updated > self.watermark):
+                self.watermark = updated
+            oid = doc["_id"]
+            current = self.seen.get(oid)
+            if current is not None and updated is not None and current[0] is not None and updated < current[0]:
+                continue  # already holds a newer version (e.g. from the change stream)
+            signature = hash(repr(tuple(doc.get(f) for f in FIELDS)))
+            self.seen[oid] = (updated, signature)
+            if current is None or current[1] != signature:
+                self._pending[oid] = {"_id": oid, **{f: doc[f] for f in FIELDS if f in doc}}
+                self._removed.discard(oid)
+                changed += 1
+        if changed:
+            self.version += 1
+        return changed
+
+    def remove(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for oid in ids:
+            if self.seen.pop(oid, None) is not None:
+                self._pending.pop(oid, None)
+                self._removed.add(oid)
+                removed += 1
+        if removed:
+            self.version += 1
+        return removed
+
+    def product_table(self) -> ProductTable:
+        """Compact serving view, rebuilt only after the catalog changed."""
+        table = self._table
+        if table is None or self._pending or self._removed:
+            docs = {doc["_id"]: doc for doc in table.documents()} if table is not None else {}
+            for oid in self._removed:
+                docs.pop(oid, None)
+            docs.update(self._pending)
+            table = ProductTable.from_products(docs.values())
+            self._table = table
+            self._pending, self._removed = {}, set()
+        return table
+
+
+class CatalogSync:
+    """
+    In-memory per-retailer product tables kept current with deltas.
+
+    The first read of a retailer loads its whole catalog. After that, reads at
+    most every sync_interval seconds fetch only products whose updatedAt is at
+    or after the watermark. When a change stream is running, those polls are
+    skipped. Deletes leave no updatedAt trace, so every reconcile_interval the
+    retailer's _id list is compared with the table. That also picks up
+    products inserted without an updatedAt. In-place edits that leave
+    updatedAt alone are only seen through the change stream.
+    """
+
+    def __init__(self, sync_interval: float = CATALOG_SYNC_INTERVAL, reconcile_interval: float = CATALOG_RECONCILE_INTERVAL):
+        self.sync_interval = sync_interval
+        self.reconcile_interval = reconcile_interval
+        self.streaming = False
+        self._tables: Dict[str, CatalogTable] = {}
+        self._guard = threading.Lock()
+        self._stream_thread: Optional[threading.Thread] = None
+
+    def _table(self, user_id: str) -> CatalogTable:
+        with self._guard:
+            return self._tables.setdefault(str(user_id), CatalogTable())
+
+    def version(self, user_id: str) -> int:
+        """Catalog version for cache keys; never touches the database."""
+        table = self._tables.get(str(user_id))
+        return table.version if table is not None else 0
+
+    def sync(self, user_id: str, force: bool = False, profile: str = SERVING) -> CatalogTable:
+        """Loads or refreshes one retailer's table; 'profile' is the Mongo client the reads go through."""
+        table = self._table(user_id)
+        with table.lock:
+            now = time.monotonic()
+            if not table.loaded:
+                try:
+                    products = load_products(user_id, profile=profile, strict=True)
+                except Exception as e:
+                    # Not marked loaded: the next read retries
+                    logger.warning(f"[CATALOG] {user_id}: could not load products: {e}")
+                    return table
+                table.apply(products)
+                # An empty catalog is loaded too; its first products arrive through the polls below
+                table.loaded = True
+                table.reconciled_at = now
+                logger.info(f"[CATALOG] {user_id}: loaded {len(products)} products")
+            elif force or (not self.streaming and now - table.synced_at >= self.sync_interval):
+                # $gte on the watermark re-reads same-instant edits; unchanged docs do not bump the version.
+                # Without a watermark only an empty catalog is re-read (cheap); the rest waits for reconcile.
+                if table.watermark is not None:
+                    changed = table.apply(load_products(user_id, since=table.watermark, profile=profile))
+                elif not len(table):
+                    changed = table.apply(load_products(user_id, profile=profile))
+                else:
+                    changed = 0
+                if changed:
+                    logger.info(f"[CATALOG] {user_id}: {changed} products changed")
+
+            if table.loaded and now - table.reconciled_at >= self.reconcile_interval:
+                self._reconcile(user_id, table, profile)
+                table.reconciled_at = now
+            table.synced_at = now
+        return table
+
+    def _reconcile(self, user_id: str, table: CatalogTable, profile: str = SERVING) -> None:
+        ids = load_product_ids(user_id, profile)
+        if ids is None:
+            return
+        live = set(ids)
+        removed = table.remove([i for i in table.seen if i not in live])
+        missing = [i for i in live if i not in table.seen]
+        added = table.apply(load_products(user_id, ids=missing, profile=profile)) if missing else 0
+        if removed or added:
+            logger.info(f"[CATALOG] {user_id}: reconcile removed {removed}, added {added} products")
+
+    def product_table(self, user_id: str) -> ProductTable:
+        table = self.sync(user_id)
+        with table.lock:
+            return table.product_table()
+
+    def cached_table(self, user_id: str) -> Optional[ProductTable]:
+        """The last loaded product table as is, without syncing; None when never loaded."""
+        table = self._tables.get(str(user_id))
+        if table is None or not table.loaded:
+            return None
+        with table.lock:
+            return table.product_table()
+
+    def products(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Full product documents for training, read through the training client
+        (only the serving table is kept in memory). The read also refreshes the
+        table; deletes are still left to reconcile.
+        """
+        try:
+            products = load_products(user_id, profile=TRAINING, strict=True)
+        except Exception as e:
+            logger.warning(f"[CATALOG] {user_id}: could not load products: {e}")
+            return []
+        table = self._table(user_id)
+        with table.lock:
+            changed = table.apply(products)
+            if not table.loaded:
+                table.loaded = True
+                table.reconciled_at = time.monotonic()
+            elif changed:
+                logger.info(f"[CATALOG] {user_id}: {changed} products changed")
+            table.synced_at = time.monotonic()
+        return products
+
+    def retailers(self) -> List[str]:
+        return list(self._tables)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._guard:
+            self._tables.pop(str(user_id), None)
+
+    # --- change stream ---
+
+    def start_change_stream(self) -> None:
+        """Follows the products collection in a daemon thread; falls back to polling when unsupported."""
+        if self._stream_thread is not None:
+            return
+        self._stream_thread = threading.Thread(target=self._follow, name="shopfusion-catalog-stream", daemon=True)
+        self._stream_thread.start()
+
+    def _follow(self) -> None:
+        from db import get_db
+
+        resume_token = None
+        while True:
+            try:
+                # Long-lived background read: the training client has no short socket timeout
+                collection = get_db(TRAINING)[PRODUCTS_COL]
+                with collection.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.streaming = True
+                    logger.info("[CATALOG] Following product changes via change stream")
+                    for change in stream:
+                        self._on_change(change)
+                        resume_token = stream.resume_token
+            except (AttributeError, NotImplementedError) as e:
+                logger.info(f"[CATALOG] Change streams unavailable ({e}); polling updatedAt instead")
+                self.streaming = False
+                return
+            except Exception as e:
+                if getattr(e, "code", None) == 40573:
+                    # Standalone mongod: $changeStream needs a replica set, retrying cannot help
+                    logger.info("[CATALOG] Change streams need a replica set; polling updatedAt instead")
+                    self.streaming = False
+                    return
+                # Transient errors resume from the last token
+                logger.warning(f"[CATALOG] Change stream stopped: {e}; polling updatedAt until it resumes")
+                self.streaming = False
+                time.sleep(60)
+
+    def _on_change(self, change: Dict[str, Any]) -> None:
+        operation = change.get("operationType")
+        if operation == "delete":
+            product_id = str(change.get("documentKey", {}).get("_id"))
+            for table in list(self._tables.values()):
+                with table.lock:
+                    table.remove([product_id])
+            return
+
+        doc = change.get("fullDocument")
+        if operation not in ("insert", "update", "replace") or not doc:
+            return
+        table = self._tables.get(str(doc.get("user")))
+        if table is None:
+            return  # loaded in full on first read
+        # The initial load holds the lock: a change arriving meanwhile waits for it and is applied
+        # afterwards. Not loaded under the lock means the next load starts after this change.
+        with table.lock:
+            if not table.loaded:
+                return
+            # apply() skips it when the table already read a newer version
+            table.apply([_normalize_product(doc)])
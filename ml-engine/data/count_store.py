@@ -0,0 +1,340 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import COUNT_STORE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _tx_day(tx: Dict[str, Any]) -> Optional[date]:
+    ts = tx.get("timestamp") or tx.get("createdAt")
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(ts, datetime):
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.date()
+
+
+def _tx_time(tx: Dict[str, Any]) -> Optional[datetime]:
+    ts = tx.get("createdAt") or tx.get("timestamp")
+    return ts if isinstance(ts, datetime) else None
+
+
+class WindowCounts:
+    """Item, pair and shopper-item counts combined over a window of daily buckets (weights may be fractional)."""
+
+    def __init__(self, item_ids: List[str], shopper_ids: List[str], n_baskets: float,
+                 item_counts: np.ndarray, pair_counts: sparse.csr_matrix, user_item: sparse.csr_matrix, days: int):
+        self.item_ids = item_ids
+        self.shopper_ids = shopper_ids
+        self.n_baskets = n_baskets
+        self.item_counts = item_counts
+        self.pair_counts = pair_counts  # upper triangle: [a, b] with a < b
+        self.user_item = user_item
+        self.days = days
+
+
+class CountStore:
+    """
+    Per-retailer daily count buckets, so windowed or decayed models are built
+    by summing arrays instead of re-reading the transaction history.
+
+    Layout: <root>/<user_id>/vocab.json (append-only item / shopper codes and
+    the ingestion watermark), plus buckets/<YYYY-MM-DD>.npz per day holding
+    item counts, pair counts (a < b) and shopper-item counts.
+
+    Writers and readers hold a per-tenant thread lock and an flock on <user_id>/.lock,
+    since every uvicorn worker and scheduler process shares the directory.
+    """
+
+    def __init__(self, root: str = COUNT_STORE_DIR):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(str(user_id), threading.Lock())
+
+    def _tenant_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, str(user_id))
+
+    @contextmanager
+    def _writing(self, user_id: str):
+        """Exclusive access to one tenant's files, across threads and processes."""
+        with self._lock(user_id):
+            os.makedirs(self._tenant_dir(user_id), exist_ok=True)
+            with open(os.path.join(self._tenant_dir(user_id), ".lock"), "a") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _bucket_path(self, user_id: str, day: date) -> str:
+        return os.path.join(self._tenant_dir(user_id), "buckets", f"{day.isoformat()}.npz")
+
+    # --- vocabulary ---
+
+    def _load_vocab(self, user_id: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self._tenant_dir(user_id), "vocab.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"items": [], "shoppers": [], "watermark": None}
+
+    def _save_vocab(self, user_id: str, vocab: Dict[str, Any]) -> None:
+        path = os.path.join(self._tenant_dir(user_id), "vocab.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(vocab, f)
+        os.replace(path + ".tmp", path)
+
+    def watermark(self, user_id: str) -> Optional[datetime]:
+        value = self._load_vocab(user_id).get("watermark")
+        return datetime.fromisoformat(value) if value else None
+
+    def days(self, user_id: str) -> List[date]:
+        try:
+            names = os.listdir(os.path.join(self._tenant_dir(user_id), "buckets"))
+        except OSError:
+            return []
+        return sorted(date.fromisoformat(n[:-4]) for n in names if n.endswith(".npz"))
+
+    # --- ingestion ---
+
+    def refresh(self, user_id: str, loaded: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        Ingests transactions newer than the watermark (everything on first use). Returns how many.
+        loaded is the retailer's full history when the caller already read it (full training);
+        it is filtered in memory instead of querying MongoDB again.
+        """
+        from data.loader import load_transactions
+
+        # Watermark read, load and ingest under one lock: concurrent refreshes must not count a basket twice
+        with self._writing(user_id):
+            vocab = self._load_vocab(user_id)
+            since = datetime.fromisoformat(vocab["watermark"]) if vocab.get("watermark") else None
+            # Inclusive: transactions created at the watermark instant after the last refresh are kept,
+            # the ones already counted are recognised by _id
+            if loaded is None:
+                transactions = load_transactions(user_id, since=since, inclusive=True)
+            elif since is None:
+                transactions = loaded
+            else:
+                transactions = [tx for tx in loaded if isinstance(tx.get("createdAt"), datetime) and tx["createdAt"] >= since]
+            counted = set(vocab.get("watermark_ids") or ())
+            if counted:
+                transactions = [tx for tx in transactions if str(tx.get("_id")) not in counted]
+            return self._ingest(user_id, vocab, transactions)
+
+    def ingest(self, user_id: str, transactions: List[Dict[str, Any]]) -> int:
+        """Adds transactions to their daily buckets. Callers must not ingest the same transaction twice."""
+        with self._writing(user_id):
+            return self._ingest(user_id, self._load_vocab(user_id), transactions)
+
+    def _ingest(self, user_id: str, vocab: Dict[str, Any], transactions: List[Dict[str, Any]]) -> int:
+        """ingest() body; the caller holds _writing(user_id) and passes the vocab it read under it."""
+        by_day: Dict[date, List[Dict[str, Any]]] = {}
+        latest, latest_ids = None, set()
+        for tx in transactions:
+            day = _tx_day(tx)
+            if day is None:
+                continue
+            by_day.setdefault(day, []).append(tx)
+            ts = _tx_time(tx)
+            if ts is not None and (latest is None or ts >= latest):
+                if latest is None or ts > latest:
+                    latest, latest_ids = ts, set()
+                if tx.get("_id") is not None:
+                    latest_ids.add(str(tx["_id"]))
+        if not by_day:
+            return 0
+
+        item_codes = {item: i for i, item in enumerate(vocab["items"])}
+        shopper_codes = {s: i for i, s in enumerate(vocab["shoppers"])}
+        os.makedirs(os.path.join(self._tenant_dir(user_id), "buckets"), exist_ok=True)
+
+        for day, txs in by_day.items():
+            bucket = self._count_day(txs, item_codes, shopper_codes)
+            path = self._bucket_path(user_id, day)
+            if os.path.exists(path):
+                bucket = self._merge(self._read(path), bucket)
+            # np.savez appends .npz to names without it, so write to "<day>.tmp.npz"
+            tmp = path[:-4] + ".tmp.npz"
+            np.savez(tmp, **bucket)
+            os.replace(tmp, path)
+
+        vocab["items"] = list(item_codes)
+        vocab["shoppers"] = list(shopper_codes)
+        if latest is not None:
+            previous = vocab.get("watermark")
+            previous = datetime.fromisoformat(previous) if previous else None
+            if previous is None or latest > previous:
+                vocab["watermark"] = latest.isoformat()
+                vocab["watermark_ids"] = sorted(latest_ids)
+            elif latest == previous:
+                vocab["watermark_ids"] = sorted(set(vocab.get("watermark_ids") or ()) | latest_ids)
+        self._save_vocab(user_id, vocab)
+
+        logger.info(f"[COUNTS] {user_id}: ingested {sum(len(t) for t in by_day.values())} transactions into {len(by_day)} daily buckets")
+        return sum(len(t) for t in by_day.values())
+
+    @staticmethod
+    def _count_day(txs: List[Dict[str, Any]], item_codes: Dict[str, int], shopper_codes: Dict[str, int]) -> Dict[str, np.ndarray]:
+        from algorithms.mba_partitioned import _combination_counts, encode_baskets
+
+        baskets, shoppers = [], []
+        for tx in txs:
+            items = {str(i.get("productId")).strip() for i in (tx.get("items") or []) if i.get("productId")}
+            if items:
+                baskets.append(list(items))
+                shoppers.append(str(tx.get("shopperId") or ""))
+
+        empty = np.zeros(0, dtype=np.int64)
+        if not baskets:
+            return {
+                "n_baskets": np.array(0, dtype=np.int64), "items": empty, "item_counts": empty.astype(np.float64),
+                "pair_a": empty, "pair_b": empty, "pair_counts": empty.astype(np.float64),
+                "ui_user": empty, "ui_item": empty, "ui_counts": empty.astype(np.float64),
+            }
+
+        _, indptr, indices = encode_baskets(baskets, item_codes)
+        n_items = len(item_codes)
+        items, item_counts = np.unique(indices, return_counts=True)
+
+        pair_codes, pair_counts = _combination_counts(indptr, indices, 0, len(baskets), 2, np.ones(n_items, dtype=bool), n_items)
+        pair_a, pair_b = np.divmod(pair_codes, n_items)
+
+        owner = np.array([shopper_codes.setdefault(s, len(shopper_codes)) if s else -1 for s in shoppers], dtype=np.int64)
+        ui_user = np.repeat(owner, np.diff(indptr))
+        known = ui_user >= 0
+        ui_codes, ui_counts = np.unique(ui_user[known] * n_items + indices[known], return_counts=True)
+        ui_user, ui_item = np.divmod(ui_codes, n_items)
+
+        return {
+            "n_baskets": np.array(len(baskets), dtype=np.int64),
+            "items": items.astype(np.int64), "item_counts": item_counts.astype(np.float64),
+            "pair_a": pair_a, "pair_b": pair_b, "pair_counts": pair_counts.astype(np.float64),
+            "ui_user": ui_user, "ui_item": ui_item, "ui_counts": ui_counts.astype(np.float64),
+        }
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, np.ndarray]:
+        with np.load(path) as data:
+            return {k: data[k] for k in data.files}
+
+    @staticmethod
+    def _merge(old: Dict[str, np.ndarray], new: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        out = {"n_baskets": old["n_baskets"] + new["n_baskets"]}
+        for key_cols, value in ((("items",), "item_counts"), (("pair_a", "pair_b"), "pair_counts"), (("ui_user", "ui_item"), "ui_counts")):
+            cols = [np.concatenate([old[c], new[c]]) for c in key_cols]
+            values = np.concatenate([old[value], new[value]])
+            keys, inverse = np.unique(np.stack(cols, axis=1), axis=0, return_inverse=True)
+            for i, c in enumerate(key_cols):
+                out[c] = keys[:, i]
+            out[value] = np.bincount(inverse.ravel(), weights=values, minlength=len(keys))
+        return out
+
+    # --- assembly ---
+
+    def window(
+        self,
+        user_id: str,
+        days: Optional[int] = None,
+        half_life_days: Optional[float] = None,
+        as_of: Optional[date] = None
+    ) -> WindowCounts:
+        """
+        Sums daily buckets: only the last 'days' days when given, each weighted
+        0.5 ** (age / half_life_days) when a half-life is given.
+        """
+        as_of = as_of or datetime.now(timezone.utc).date()
+        # Under the tenant lock: a concurrent ingest may be between writing a bucket
+        # (with new item / shopper codes) and the vocab that defines them
+        with self._writing(user_id):
+            vocab = self._load_vocab(user_id)
+            n_items, n_shoppers = len(vocab["items"]), len(vocab["shoppers"])
+
+            item_counts = np.zeros(n_items)
+            pairs: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+            ui: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+            n_baskets, used = 0.0, 0
+
+            for day in self.days(user_id):
+                age = (as_of - day).days
+                if age < 0 or (days is not None and age >= days):
+                    continue
+                weight = 0.5 ** (age / half_life_days) if half_life_days else 1.0
+                bucket = self._read(self._bucket_path(user_id, day))
+                n_baskets += weight * float(bucket["n_baskets"])
+                np.add.at(item_counts, bucket["items"], weight * bucket["item_counts"])
+                pairs.append((bucket["pair_a"], bucket["pair_b"], weight * bucket["pair_counts"]))
+                ui.append((bucket["ui_user"], bucket["ui_item"], weight * bucket["ui_counts"]))
+                used += 1
+
+        return WindowCounts(
+            item_ids=vocab["items"],
+            shopper_ids=vocab["shoppers"],
+            n_baskets=n_baskets,
+            item_counts=item_counts,
+            pair_counts=_sum_coo(pairs, (n_items, n_items)),
+            user_item=_sum_coo(ui, (n_shoppers, n_items)),
+            days=used,
+        )
+
+    def decayed_item_counts(
+        self,
+        user_id: str,
+        half_lives: List[float],
+        days: Optional[int] = None,
+        as_of: Optional[date] = None
+    ) -> Tuple[List[str], List[np.ndarray]]:
+        """
+        Item counts only, once per half-life, in a single pass over the buckets (pair and
+        shopper arrays are never loaded). Ages count from as_of, by default the newest bucket.
+        """
+        with self._writing(user_id):
+            vocab = self._load_vocab(user_id)
+            bucket_days = self.days(user_id)
+            as_of = as_of or (max(bucket_days) if bucket_days else datetime.now(timezone.utc).date())
+            totals = [np.zeros(len(vocab["items"])) for _ in half_lives]
+
+            for day in bucket_days:
+                age = (as_of - day).days
+                if age < 0 or (days is not None and age >= days):
+                    continue
+                with np.load(self._bucket_path(user_id, day)) as data:
+                    items, counts = data["items"], data["item_counts"]
+                for total, half_life in zip(totals, half_lives):
+                    np.add.at(total, items, 0.5 ** (age / half_life) * counts)
+        return vocab["items"], totals
+
+
+
+def _sum_coo(parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]], shape: Tuple[int, int]) -> sparse.csr_matrix:
+    if not parts:
+        return sparse.csr_matrix(shape)
+    rows, cols, values = (np.concatenate(p) for p in zip(*parts))
+    # COO -> CSR sums duplicate (row, col) entries across days
+    return sparse.coo_matrix((values, (rows, cols)), shape=shape).tocsr()
+
@@ -1,15 +1,19 @@
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+import logging
+import math
+from typing import List, Dict, Any, Optional, Tuple
 from bson import ObjectId
 from pymongo import UpdateOne
-from db import get_db  # ✅ Absolute import
+from config import TRAIN_REPORTS_KEEP
+from db import SERVING, TRAINING, get_db, scan_options  # ✅ Absolute import
 
-db = get_db()
+logger = logging.getLogger(__name__)
 
 # Collection names
 PRODUCTS_COL = "products"
 TRANSACTIONS_COL = "transactions"
 ASSOCIATION_RULES_COL = "associationrules"
+TRAINING_RUNS_COL = "trainingruns"
 # data/loader.py
 
 def get_product_map(user_id):
@@ -28,53 +32,192 @@ def _to_object_id(uid: Any) -> Optional[ObjectId]:
     except Exception:
         return None
 
-def load_transactions(user_id: str = None) -> List[Dict[str, Any]]:
+def load_transactions(user_id: str = None, since: Optional[datetime] = None, profile: str = TRAINING,
+                      inclusive: bool = False, shopper_id: str = None) -> List[Dict[str, Any]]:
     """
     Loads transactions with memory-efficient projection.
+    'since' restricts to transactions created after that instant (at or after it with 'inclusive'; incremental loads).
+    'shopper_id' restricts to one shopper's baskets (serving history).
+    'profile' picks the Mongo client: TRAINING scans (default) or SERVING for request-path reads.
     """
-    query = {"user": _to_object_id(user_id)} if user_id else {}
+    query = _transactions_query(user_id, since, inclusive, shopper_id)
     
-    # Only fetch fields required for Collaborative Filtering and MBA
-    projection = {"items": 1, "user": 1, "createdAt": 1}
+    # Only fetch fields required for Collaborative Filtering and MBA (item names, prices etc. stay in the DB)
+    projection = {"items.productId": 1, "user": 1, "shopperId": 1, "timestamp": 1, "createdAt": 1}
     
     try:
-        cursor = db[TRANSACTIONS_COL].find(query, projection)
-        
+        db = get_db(profile)
         transactions = []
-        for tx in cursor:
-            tx["_id"] = str(tx["_id"])
-            if "user" in tx:
-                tx["user"] = str(tx["user"])
-            transactions.append(tx)
+        # Training scans: large batches, closed explicitly (no_cursor_timeout)
+        options = scan_options() if profile == TRAINING else {}
+        with db[TRANSACTIONS_COL].find(query, projection, **options) as cursor:
+            for tx in cursor:
+                tx["_id"] = str(tx["_id"])
+                if "user" in tx:
+                    tx["user"] = str(tx["user"])
+                transactions.append(tx)
         return transactions
     except Exception as e:
         print(f"Error loading transactions: {e}")
         return []
 
-def load_products(user_id: str) -> List[Dict[str, Any]]:
-    """Loads all products for a specific retailer."""
+def _transactions_query(user_id: str = None, since: Optional[datetime] = None, inclusive: bool = False,
+                        shopper_id: str = None) -> Dict[str, Any]:
+    query = {"user": _to_object_id(user_id)} if user_id else {}
+    if shopper_id:
+        query["shopperId"] = shopper_id
+    if since is not None:
+        query["createdAt"] = {"$gte" if inclusive else "$gt": since}
+    return query
+
+# Distinct product ids of one transaction (counted once per basket, like preprocess_transactions)
+_BASKET_IDS = {"$setUnion": ["$items.productId", []]}
+
+def count_item_supports(user_id: str = None, since: Optional[datetime] = None) -> Tuple[Dict[str, int], int]:
+    """
+    Item support counts computed inside MongoDB ($unwind / $group), so only
+    one row per product leaves the database. Returns ({productId: baskets}, n_baskets).
+    """
+    query = _transactions_query(user_id, since)
+    db = get_db(TRAINING)
+    supports = {}
+    for row in db[TRANSACTIONS_COL].aggregate([
+        {"$match": query},
+        {"$project": {"_id": 0, "ids": _BASKET_IDS}},
+        {"$unwind": "$ids"},
+        {"$group": {"_id": "$ids", "n": {"$sum": 1}}},
+    ], allowDiskUse=True):
+        if row["_id"]:
+            supports[row["_id"]] = int(row["n"])
+
+    counted = list(db[TRANSACTIONS_COL].aggregate([
+        {"$match": query},
+        {"$project": {"_id": 0, "ids": _BASKET_IDS}},
+        {"$match": {"ids.0": {"$exists": True}}},
+        {"$count": "n"},
+    ]))
+    return supports, int(counted[0]["n"]) if counted else 0
+
+def load_frequent_baskets(user_id: str = None, min_support: float = 0.001, since: Optional[datetime] = None) -> Tuple[List[List[str]], int]:
+    """
+    MBA input with support filtering pushed down to MongoDB: item frequencies
+    are aggregated first, then baskets come back as bare productId lists
+    restricted to frequent items. Baskets with no frequent item are not sent.
+    Returns (baskets, n_baskets); n_baskets counts every non-empty basket and
+    is the denominator for supports.
+    """
+    try:
+        supports, n_baskets = count_item_supports(user_id, since)
+        min_count = max(1, int(math.ceil(min_support * n_baskets)))
+        frequent = [pid for pid, n in supports.items() if n >= min_count]
+        if len(frequent) < 2:
+            return [], n_baskets
+
+        cursor = get_db(TRAINING)[TRANSACTIONS_COL].aggregate([
+            {"$match": _transactions_query(user_id, since)},
+            {"$project": {"_id": 0, "ids": {"$filter": {
+                "input": _BASKET_IDS, "as": "pid", "cond": {"$in": ["$$pid", frequent]}
+            }}}},
+            {"$match": {"ids.0": {"$exists": True}}},
+        ], allowDiskUse=True, batchSize=scan_options()["batch_size"])
+        baskets = [[str(pid) for pid in row["ids"]] for row in cursor]
+        return baskets, n_baskets
+    except Exception as e:
+        # Training falls back to the full transaction list
+        logger.warning(f"[WARN] Could not load frequent baskets: {e}")
+        return [], 0
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else None
+
+def data_stamp(products: List[Dict[str, Any]], transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    What a training run saw: counts plus newest product updatedAt / transaction createdAt.
+    Same shape as the per-retailer entries of load_tenant_stats(), so equal stamps mean nothing changed.
+    """
+    updated = [p["updatedAt"] for p in products if isinstance(p.get("updatedAt"), datetime)]
+    created = [t["createdAt"] for t in transactions if isinstance(t.get("createdAt"), datetime)]
+    return {
+        "products": len(products),
+        "products_updated": _iso(max(updated)) if updated else None,
+        "transactions": len(transactions),
+        "last_transaction": _iso(max(created)) if created else None,
+    }
+
+def load_tenant_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Every retailer with products or transactions, as {user_id: data_stamp}.
+    Counted by two $group aggregations, so no documents leave MongoDB.
+    """
+    db = get_db(TRAINING)
+    stats: Dict[str, Dict[str, Any]] = {}
+    empty = {"products": 0, "products_updated": None, "transactions": 0, "last_transaction": None}
+    for row in db[PRODUCTS_COL].aggregate([
+        {"$group": {"_id": "$user", "n": {"$sum": 1}, "updated": {"$max": "$updatedAt"}}},
+    ], allowDiskUse=True):
+        if row["_id"]:
+            stats[str(row["_id"])] = {**empty, "products": int(row["n"]), "products_updated": _iso(row.get("updated"))}
+    for row in db[TRANSACTIONS_COL].aggregate([
+        {"$group": {"_id": "$user", "n": {"$sum": 1}, "last": {"$max": "$createdAt"}}},
+    ], allowDiskUse=True):
+        if row["_id"]:
+            entry = stats.setdefault(str(row["_id"]), dict(empty))
+            entry.update(transactions=int(row["n"]), last_transaction=_iso(row.get("last")))
+    return stats
+
+def _normalize_product(p: Dict[str, Any]) -> Dict[str, Any]:
+    p["_id"] = str(p["_id"])
+    # Fallback logic: Ensure every product has a unique productId string
+    if "productId" not in p:
+        p["productId"] = p["_id"]
+    return p
+
+def load_products(user_id: str, since: Optional[datetime] = None, ids: Optional[List[str]] = None,
+                  profile: str = SERVING, strict: bool = False) -> List[Dict[str, Any]]:
+    """
+    Loads all products for a specific retailer.
+    'since' keeps products updated at or after that instant; 'ids' keeps those _ids (catalog delta sync).
+    'profile' picks the Mongo client: SERVING (default, catalog syncs on the request path) or TRAINING.
+    'strict' re-raises load errors, so callers can tell a failed read from an empty catalog.
+    """
     uid = _to_object_id(user_id)
     if not uid: return []
 
+    query: Dict[str, Any] = {"user": uid}
+    if since is not None:
+        query["updatedAt"] = {"$gte": since}
+    if ids is not None:
+        query["_id"] = {"$in": [_to_object_id(i) for i in ids]}
+
     try:
-        cursor = db[PRODUCTS_COL].find({"user": uid})
-        products = []
-        for p in cursor:
-            p["_id"] = str(p["_id"])
-            # Fallback logic: Ensure every product has a unique productId string
-            if "productId" not in p:
-                p["productId"] = p["_id"]
-            products.append(p)
-        return products
+        db = get_db(profile)
+        cursor = db[PRODUCTS_COL].find(query)
+        return [_normalize_product(p) for p in cursor]
     except Exception as e:
-        print(f"Error loading products: {e}")
+        if strict:
+            raise
+        logger.warning(f"[WARN] Could not load products for {user_id}: {e}")
         return []
 
+def load_product_ids(user_id: str, profile: str = SERVING) -> Optional[List[str]]:
+    """All product _ids of a retailer (index-only read, used to detect deletes). None on error."""
+    uid = _to_object_id(user_id)
+    if not uid: return []
+
+    try:
+        return [str(p["_id"]) for p in get_db(profile)[PRODUCTS_COL].find({"user": uid}, {"_id": 1})]
+    except Exception as e:
+        # Reconcile is skipped this round rather than treating every product as deleted
+        logger.warning(f"[WARN] Could not load product ids for {user_id}: {e}")
+        return None
+
 def save_association_rules(user_id: str, rules: List[Dict[str, Any]]) -> None:
     """Stores MBA rules using a clean clear-and-insert strategy."""
     uid = _to_object_id(user_id)
     if not uid: return
 
+    db = get_db(TRAINING)
+
     # 1. Clean up old rules
     db[ASSOCIATION_RULES_COL].delete_many({"userId": uid})
 
@@ -99,17 +242,43 @@ def save_association_rules(user_id: str, rules: List[Dict[str, Any]]) -> None:
     if docs:
         db[ASSOCIATION_RULES_COL].insert_many(docs)
 
-def mark_products_expired(expired_ids: List[str]) -> None:
-    """Updates product status in bulk. Uses productId index."""
+def save_training_run(user_id: str, report: Dict[str, Any], keep: int = TRAIN_REPORTS_KEEP) -> None:
+    """Stores one training run report and drops the retailer's reports beyond the newest 'keep'."""
+    uid = _to_object_id(user_id) or user_id
+    db = get_db(TRAINING)
+    db[TRAINING_RUNS_COL].insert_one({**report, "userId": uid, "createdAt": datetime.now(timezone.utc)})
+    runs = db[TRAINING_RUNS_COL].find({"userId": uid}, {"_id": 1}).sort("createdAt", -1)
+    stale = [r["_id"] for r in runs][keep:]
+    if stale:
+        db[TRAINING_RUNS_COL].delete_many({"_id": {"$in": stale}})
+
+def load_training_runs(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """The retailer's newest training run reports first."""
+    uid = _to_object_id(user_id) or user_id
+    cursor = get_db(SERVING)[TRAINING_RUNS_COL].find({"userId": uid}).sort("createdAt", -1).limit(limit)
+    return [{k: v for k, v in run.items() if k not in ("_id", "userId", "createdAt")} for run in cursor]
+
+def mark_products_expired(expired_ids: List[str], user_id: str = None) -> int:
+    """
+    Updates product status in bulk. Uses productId index. Returns how many products were newly marked.
+    'user_id' scopes the update to one retailer (productIds are only unique per retailer).
+    """
     if not expired_ids:
-        return
+        return 0
+
+    query: Dict[str, Any] = {"productId": {"$in": expired_ids}, "status": {"$ne": "EXPIRED"}}
+    uid = _to_object_id(user_id)
+    if uid:
+        query["user"] = uid
 
-    # Using $set with isVisible: False ensures they don't appear in the Node.js API results
-    db[PRODUCTS_COL].update_many(
-        {"productId": {"$in": expired_ids}},
+    # Using $set with isVisible: False ensures they don't appear in the Node.js API results.
+    # Already-expired products are left alone so their updatedAt (and the data stamp) stays put.
+    result = get_db(TRAINING)[PRODUCTS_COL].update_many(
+        query,
         {"$set": {
             "status": "EXPIRED", 
             "isVisible": False,
             "updatedAt": datetime.now(timezone.utc)
         }}
-    )
\ No newline at end of file
+    )
+    return result.modified_count
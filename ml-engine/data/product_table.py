@@ -0,0 +1,204 @@
+import hashlib
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from algorithms.expiry import _parse_expiry, expiry_weight_array
+from algorithms.scoring_utils import ScoringUtils
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _expiry_label(value: Any) -> str:
+    # Same rendering as the old dict-based product summary; "" means no expiry
+    if isinstance(value, dict) and "$date" in value:
+        return str(value["$date"])
+    return str(value) if value else ""
+
+
+class TextColumn:
+    """Strings packed into one UTF-8 buffer plus offsets; a str is only built when a row is read."""
+
+    def __init__(self, values: Iterable[str]):
+        encoded = [v.encode("utf-8") for v in values]
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=self._offsets[1:])
+        self._buffer = b"".join(encoded)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self._buffer[self._offsets[row]:self._offsets[row + 1]].decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer) + self._offsets.nbytes
+
+
+# Document fields a table reads (besides _id); edits to any other field never change it
+FIELDS = ("productId", "name", "category", "price", "stock", "discount", "margin", "expiryDate", "image")
+
+
+class ProductTable:
+    """
+    Struct-of-arrays view of one retailer's catalog for the serving path.
+
+    Row i is product ids[i]. Categories are interned into integer codes.
+    Price, stock, discount, margin and expiry are NumPy columns. Display text
+    (name, image, expiry label) stays packed until a summary is built. Scores
+    keyed by productId are mapped onto rows with codes() / dense().
+
+    A table is rebuilt whenever the catalog changes, so the per-row boost
+    vectors are cached on it per day: each catalog / expiry version computes
+    them once, and every request reuses the same read-only arrays.
+    """
+
+    def __init__(self, products: Iterable[Dict[str, Any]] = ()):
+        rows: Dict[str, Dict[str, Any]] = {}
+        for p in products:
+            pid = str(p.get("productId") or p.get("_id") or "")
+            if pid:
+                rows[pid] = p
+
+        self.ids: List[str] = list(rows)
+        self.index: Dict[str, int] = {pid: i for i, pid in enumerate(self.ids)}
+        # Lookups by Mongo _id (rules or history stored with OIDs) resolve to the same row
+        self._aliases: Dict[str, int] = {}
+        for i, p in enumerate(rows.values()):
+            oid = str(p.get("_id", ""))
+            if oid and oid not in self.index:
+                self._aliases[oid] = i
+
+        category_codes: Dict[str, int] = {}
+        self.category_codes = np.fromiter(
+            (category_codes.setdefault(p.get("category") or "General", len(category_codes)) for p in rows.values()),
+            dtype=np.int32, count=len(rows)
+        )
+        self.categories: List[str] = list(category_codes)
+
+        self.price = np.fromiter((_number(p.get("price")) for p in rows.values()), dtype=np.float64, count=len(rows))
+        self.stock = np.fromiter((_number(p.get("stock")) for p in rows.values()), dtype=np.float64, count=len(rows))
+        self.discount = np.fromiter((_number(p.get("discount")) for p in rows.values()), dtype=np.float64, count=len(rows))
+        # Gross margin in percent; optional, products without one get a neutral boost
+        self.margin = np.fromiter((_number(p.get("margin")) for p in rows.values()), dtype=np.float64, count=len(rows))
+
+        expiry = []
+        for p in rows.values():
+            parsed = _parse_expiry(p.get("expiryDate"))
+            expiry.append(np.datetime64(parsed.date(), "D") if parsed else np.datetime64("NaT", "D"))
+        self.expiry = np.array(expiry, dtype="datetime64[D]")
+
+        self.oids = TextColumn(str(p.get("_id", "")) for p in rows.values())
+        self.names = TextColumn(str(p.get("name", "Unknown Product")) for p in rows.values())
+        self.images = TextColumn(str(p.get("image", "")) for p in rows.values())
+        self._expiry_labels = TextColumn(_expiry_label(p.get("expiryDate")) for p in rows.values())
+        self._fingerprint: Optional[str] = None
+        # (day, expiry weights, combined business boosts)
+        self._boosts: Optional[Tuple[date, np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def from_products(cls, products: Iterable[Dict[str, Any]]) -> "ProductTable":
+        return cls(products)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, pid: str) -> bool:
+        return self.row(pid) is not None
+
+    def row(self, pid: Any) -> Optional[int]:
+        key = str(pid)
+        row = self.index.get(key)
+        return row if row is not None else self._aliases.get(key)
+
+    def codes(self, pids: Iterable[Any]) -> np.ndarray:
+        """Row numbers for productIds (or _ids); -1 where unknown."""
+        rows = [self.row(pid) for pid in pids]
+        return np.array([-1 if r is None else r for r in rows], dtype=np.int64)
+
+    def dense(self, scores: Dict[str, float], default: float = 0.0) -> np.ndarray:
+        """Scores keyed by productId as one value per row."""
+        out = np.full(len(self), default, dtype=np.float64)
+        if scores:
+            rows = self.codes(scores.keys())
+            known = rows >= 0
+            out[rows[known]] = np.fromiter(scores.values(), dtype=np.float64, count=len(rows))[known]
+        return out
+
+    def category(self, row: int) -> str:
+        return self.categories[self.category_codes[row]]
+
+    def _daily_boosts(self, today: Optional[date]) -> Tuple[date, np.ndarray, np.ndarray]:
+        today = today or datetime.now(timezone.utc).date()
+        cached = self._boosts
+        if cached is not None and cached[0] == today:
+            return cached
+        expiry = expiry_weight_array(self.expiry, today)
+        combined = expiry * ScoringUtils.discount_boost_array(self.discount) * ScoringUtils.margin_boost_array(self.margin)
+        expiry.flags.writeable = False
+        combined.flags.writeable = False
+        # One tuple swap: concurrent readers see either the old day's arrays or the new ones
+        self._boosts = (today, expiry, combined)
+        return self._boosts
+
+    def expiry_weights(self, today: Optional[date] = None) -> np.ndarray:
+        """Per-row expiry boost (0.0 expired, up to 2.0 about to expire, 1.0 otherwise); read-only."""
+        return self._daily_boosts(today)[1]
+
+    def business_boosts(self, today: Optional[date] = None) -> np.ndarray:
+        """Per-row score multiplier: expiry * discount * margin boost (see ScoringUtils); read-only."""
+        return self._daily_boosts(today)[2]
+
+    def summary(self, row: int) -> Dict[str, Any]:
+        """The product card returned to the frontend."""
+        return {
+            "productId": self.ids[row],
+            "name": self.names[row],
+            "category": self.category(row),
+            "price": float(self.price[row]),
+            "image": self.images[row],
+            "expiryDate": self._expiry_labels[row] or None,
+            "stock": int(self.stock[row]),
+        }
+
+    def documents(self) -> Iterator[Dict[str, Any]]:
+        """
+        Rows back as product documents holding only the fields this table keeps;
+        ProductTable(table.documents()) rebuilds an equivalent table.
+        """
+        for row, pid in enumerate(self.ids):
+            doc = {
+                "_id": self.oids[row] or pid,
+                "productId": pid,
+                "name": self.names[row],
+                "category": self.category(row),
+                "price": float(self.price[row]),
+                "stock": float(self.stock[row]),
+                "discount": float(self.discount[row]),
+                "margin": float(self.margin[row]),
+                "image": self.images[row],
+            }
+            label = self._expiry_labels[row]
+            if label:
+                doc["expiryDate"] = label
+            yield doc
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the row order (ids), so clients can cache the row -> productId list across workers."""
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.blake2b("\n".join(self.ids).encode("utf-8"), digest_size=8).hexdigest()
+        return self._fingerprint
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.category_codes, self.price, self.stock, self.discount, self.margin, self.expiry)
+        texts = (self.oids, self.names, self.images, self._expiry_labels)
+        return sum(a.nbytes for a in arrays) + sum(t.nbytes for t in texts)
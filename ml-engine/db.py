@@ -1,8 +1,16 @@
 import os
-import sys
+import logging
+import threading
+import time
+from datetime import datetime, timezone
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, OperationFailure
 from dotenv import load_dotenv
+from monitoring.metrics import MongoCommandMetrics
+from config import (
+    MONGO_SERVING_POOL_SIZE, MONGO_SERVING_TIMEOUT_MS, MONGO_TRAINING_BATCH_SIZE, MONGO_TRAINING_COMPRESSORS,
+    MONGO_TRAINING_NO_CURSOR_TIMEOUT, MONGO_TRAINING_POOL_SIZE, MONGO_TRAINING_READ_PREFERENCE
+)
 
 # Load environment variables from .env
 load_dotenv()
@@ -10,81 +18,156 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME", "shopfusion")
 
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(RuntimeError):
+    """Raised when MongoDB is not configured; the app keeps running and reports it via /health."""
+
+
+# Client profiles (see config.py): request-path lookups vs. full-history training scans
+SERVING = "serving"
+TRAINING = "training"
+
+
+def _client_options(profile: str) -> dict:
+    if profile == TRAINING:
+        options = dict(
+            serverSelectionTimeoutMS=10000,
+            connectTimeoutMS=10000,
+            maxPoolSize=MONGO_TRAINING_POOL_SIZE,
+            readPreference=MONGO_TRAINING_READ_PREFERENCE,
+        )
+        if MONGO_TRAINING_COMPRESSORS:
+            options["compressors"] = MONGO_TRAINING_COMPRESSORS
+        return options
+    return dict(
+        serverSelectionTimeoutMS=MONGO_SERVING_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_SERVING_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SERVING_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_SERVING_TIMEOUT_MS,
+        maxPoolSize=MONGO_SERVING_POOL_SIZE,
+    )
+
+
 class Database:
     """
-    Singleton class to manage MongoDB connection.
-    Ensures only one connection pool is created.
+    One MongoDB client per profile, shared process-wide.
+    Ensures only one connection pool is created per profile.
+
+    The client is created lazily on first use and does not block on a ping:
+    PyMongo connects in the background, and reachability is tracked by the
+    readiness probe below instead of being checked at import time.
+    """
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, profile: str = SERVING):
+        if profile not in cls._instances:
+            with cls._lock:
+                if profile not in cls._instances:
+                    if not MONGO_URI:
+                        logger.error(
+                            "[ERROR] MONGO_URI not found in .env file. "
+                            "Please create ml-engine/.env with MONGO_URI=your_mongodb_connection_string "
+                            "and DB_NAME=shopfusion"
+                        )
+                        raise DatabaseUnavailable("MONGO_URI is not configured")
+
+                    logger.info(f"[*] Creating MongoDB {profile} client...")
+
+                    # Initialize MongoClient with this profile's pool, timeouts and read preference
+                    cls._instances[profile] = MongoClient(
+                        MONGO_URI,
+                        event_listeners=[MongoCommandMetrics(profile)],
+                        **_client_options(profile)
+                    )
+
+        return cls._instances[profile]
+
+# Injected database backend (e.g. loadtest.memory_db.MemoryDatabase); takes precedence over MongoDB
+_db_override = None
+
+def set_db(database):
+    """
+    Injects a database object used instead of MongoDB by every get_db() caller.
+    Pass None to go back to the MongoDB connection.
     """
-    _instance = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            try:
-                if not MONGO_URI:
-                    print("="*60)
-                    print("[ERROR] MONGO_URI not found in .env file")
-                    print("="*60)
-                    print("\nPlease create ml-engine/.env with:")
-                    print("MONGO_URI=your_mongodb_connection_string")
-                    print("DB_NAME=shopfusion")
-                    print("="*60 + "\n")
-                    sys.exit(1)
-                
-                print(f"[*] Connecting to MongoDB...")
-                
-                # Initialize MongoClient with connection pooling and timeouts
-                cls._instance = MongoClient(
-                    MONGO_URI,
-                    serverSelectionTimeoutMS=10000,
-                    connectTimeoutMS=10000,
-                    maxPoolSize=50
-                )
-                
-                # Force a connection check
-                cls._instance.admin.command('ping')
-                print(f"[OK] Successfully connected to MongoDB: {DB_NAME}\n")
-                
-            except OperationFailure as e:
-                print("="*60)
-                print("[ERROR] MongoDB Authentication Failed!")
-                print("="*60)
-                print(f"\nError: {e}")
-                print("\nPlease check:")
-                print("1. Username and password are correct in .env")
-                print("2. MongoDB Atlas credentials haven't expired")
-                print("3. Database user has proper permissions")
-                print("\nCurrent MONGO_URI (masked):")
-                if MONGO_URI:
-                    masked = MONGO_URI[:20] + "***" + MONGO_URI[-20:]
-                    print(f"   {masked}")
-                print("="*60 + "\n")
-                sys.exit(1)
-                
-            except ConnectionFailure as e:
-                print("="*60)
-                print("[ERROR] Could not connect to MongoDB!")
-                print("="*60)
-                print(f"\nError: {e}")
-                print("\nPlease check:")
-                print("1. MongoDB Atlas cluster is running")
-                print("2. Your IP is whitelisted in MongoDB Atlas")
-                print("3. Internet connection is stable")
-                print("4. MONGO_URI is correct in ml-engine/.env")
-                print("="*60 + "\n")
-                sys.exit(1)
-                
-            except Exception as e:
-                print("="*60)
-                print("[ERROR] Unexpected MongoDB Error!")
-                print("="*60)
-                print(f"\nError: {e}")
-                print("\nPlease check your MongoDB configuration.")
-                print("="*60 + "\n")
-                sys.exit(1)
-                
-        return cls._instance
-
-def get_db():
-    """Returns the database instance for the specified DB_NAME."""
-    client = Database()
+    global _db_override
+    _db_override = database
+
+def get_db(profile: str = SERVING):
+    """Returns the database instance for the specified DB_NAME, through the given client profile."""
+    if _db_override is not None:
+        return _db_override
+    client = Database(profile)
     return client[DB_NAME]
+
+def scan_options() -> dict:
+    """find() options for training scans on the TRAINING profile; close the cursor when done."""
+    return {"batch_size": MONGO_TRAINING_BATCH_SIZE, "no_cursor_timeout": MONGO_TRAINING_NO_CURSOR_TIMEOUT}
+
+
+# --- Readiness probe ---
+
+_status = {"state": "unknown", "error": None, "checked_at": None}
+_probe_thread = None
+
+def probe_database() -> dict:
+    """Pings the database once and records the outcome. Blocks for at most the server selection timeout."""
+    try:
+        get_db().command("ping")
+        state, error = "connected", None
+
+    except DatabaseUnavailable as e:
+        state, error = "misconfigured", str(e)
+
+    except OperationFailure as e:
+        masked = MONGO_URI[:20] + "***" + MONGO_URI[-20:] if MONGO_URI else ""
+        logger.error(
+            f"[ERROR] MongoDB Authentication Failed! Error: {e}. "
+            "Please check: 1. Username and password are correct in .env "
+            "2. MongoDB Atlas credentials haven't expired "
+            "3. Database user has proper permissions. "
+            f"Current MONGO_URI (masked): {masked}"
+        )
+        state, error = "auth_failed", str(e)
+
+    except ConnectionFailure as e:
+        logger.error(
+            f"[ERROR] Could not connect to MongoDB! Error: {e}. "
+            "Please check: 1. MongoDB Atlas cluster is running "
+            "2. Your IP is whitelisted in MongoDB Atlas "
+            "3. Internet connection is stable "
+            "4. MONGO_URI is correct in ml-engine/.env"
+        )
+        state, error = "unreachable", str(e)
+
+    except Exception as e:
+        logger.error(f"[ERROR] Unexpected MongoDB Error! Error: {e}. Please check your MongoDB configuration.")
+        state, error = "error", str(e)
+
+    if state == "connected" and _status["state"] != "connected":
+        logger.info(f"[OK] Successfully connected to MongoDB: {DB_NAME}")
+
+    _status.update(state=state, error=error, checked_at=datetime.now(timezone.utc).isoformat())
+    return dict(_status)
+
+def database_status() -> dict:
+    """Last known probe result; never touches the network."""
+    return dict(_status)
+
+def start_readiness_probe(interval_seconds: float = 30.0) -> None:
+    """Starts a daemon thread that keeps database_status() fresh."""
+    global _probe_thread
+    if _probe_thread is not None:
+        return
+
+    def _loop():
+        while True:
+            probe_database()
+            # Retry quickly while the cluster is unreachable, then settle into the interval
+            time.sleep(min(5.0, interval_seconds) if _status["state"] == "unreachable" else interval_seconds)
+
+    _probe_thread = threading.Thread(target=_loop, name="shopfusion-db-probe", daemon=True)
+    _probe_thread.start()
@@ -1,125 +1,207 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
+import numpy as np
 from algorithms.scoring_utils import ScoringUtils
+from data.product_table import ProductTable
+
+# Diversification: Ek category ke max 3 items
+MAX_PER_CATEGORY = 3
 
 class ShopFusionRecommender:
     def __init__(self):
         self.utils = ScoringUtils()
 
-    def _get_product_summary(self, pid: str, product_map: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
-        """Unified product summary fetcher with safety guards."""
+    @staticmethod
+    def _as_table(product_map: Union[ProductTable, Dict[str, Dict[str, Any]]]) -> ProductTable:
+        return product_map if isinstance(product_map, ProductTable) else ProductTable.from_products(product_map.values())
+
+    def _get_product_summary(self, pid: str, products: ProductTable) -> Optional[Dict[str, Any]]:
+        """Unified product summary fetcher with safety guards (productId or Mongo _id)."""
         if not pid or pid == "None":
             return None
-            
-        p = product_map.get(str(pid))
-        
-        # Fallback if map is indexed by a different ID type (SKU vs OID)
-        if not p:
-            p = next((v for v in product_map.values() 
-                     if str(v.get("productId")) == str(pid) or str(v.get("_id")) == str(pid)), None)
-            
-        if not p: return None
-
-        # Handle MongoDB $date structure safely
-        exp = p.get("expiryDate")
-        if isinstance(exp, dict) and "$date" in exp:
-            clean_exp = exp["$date"]
-        else:
-            clean_exp = str(exp) if exp else None
-
-        return {
-            "productId": p.get("productId") or str(p.get("_id")),
-            "name": p.get("name", "Unknown Product"),
-            "category": p.get("category", "General"),
-            "price": p.get("price", 0),
-            "image": p.get("image", ""),
-            "expiryDate": clean_exp,
-            "stock": p.get("stock", 0)
-        }
+        row = products.row(pid)
+        return products.summary(row) if row is not None else None
 
-    def generate_hybrid_recommendations(
+    @staticmethod
+    def _top_per_category(rows: np.ndarray, scores: np.ndarray, categories: np.ndarray, limit: int) -> np.ndarray:
+        """Positions into rows, best score first, keeping at most 'limit' per category."""
+        order = np.argsort(-scores, kind="stable")
+        cats = categories[rows[order]]
+        by_cat = np.argsort(cats, kind="stable")
+        sorted_cats = cats[by_cat]
+        starts = np.flatnonzero(np.r_[True, sorted_cats[1:] != sorted_cats[:-1]])
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[by_cat] = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        return order[rank < limit]
+
+    def rank(
         self,
         mba_rules: List[Dict[str, Any]],
         content_scores: Dict[str, float],
         collab_scores: Dict[str, float],
-        expiry_weights: Dict[str, float],
-        product_map: Dict[str, Dict[str, Any]],
-        max_recommendations: int = 20
-    ) -> Dict[str, Any]:
+        expiry_weights: Union[np.ndarray, Dict[str, float]],
+        product_map: Union[ProductTable, Dict[str, Dict[str, Any]]],
+        max_recommendations: int = 20,
+        collab_weight: float = 0.6,
+        content_weight: float = 0.4,
+        business_boosts: Optional[np.ndarray] = None
+    ) -> "RankedFeed":
         """
-        Single unified function to handle:
-        1. Near Expiry Extraction
-        2. Market Basket Analysis (Bundles)
-        3. Hybrid User Recommendations
+        The fusion itself: near-expiry rows, MBA bundles and hybrid individual
+        scores, ranked together as ProductTable rows. No product card is built.
+        business_boosts (ProductTable.business_boosts, one multiplier per row)
+        scales the scores; without it the expiry weights do. Urgency and the
+        near-expiry list always come from the expiry weights.
         """
-        
+        products = self._as_table(product_map)
+        weights = expiry_weights if isinstance(expiry_weights, np.ndarray) else products.dense(expiry_weights, default=1.0)
+        boosts = weights if business_boosts is None else business_boosts
+
         # --- 1. NEAR EXPIRY (For Dashboard 'Sell Now' Cards) ---
-        near_expiry_products = []
-        for pid, weight in expiry_weights.items():
-            if weight > 1.0: # 1.0 se zyada matlab expiry boost active hai
-                summary = self._get_product_summary(pid, product_map)
-                if summary:
-                    near_expiry_products.append(summary)
+        # 1.0 se zyada matlab expiry boost active hai
+        near_expiry_rows = np.flatnonzero(weights > 1.0)
 
         # --- 2. HYBRID FEED INITIALIZATION ---
-        final_feed = []
+        # (kind, score, urgent, rows, lift, confidence)
+        entries = []
         norm_collab = self.utils.normalize_scores(collab_scores)
         norm_content = self.utils.normalize_scores(content_scores)
 
         # --- 3. SMART BUNDLES (MBA) ---
+        seen_bundles = set()
         for rule in mba_rules:
             # antecedents + consequents merge karke unique IDs nikalna
             bundle_ids = list(dict.fromkeys(rule.get("ants", []) + rule.get("cons", [])))
-            bundle_products = [self._get_product_summary(pid, product_map) for pid in bundle_ids]
-            bundle_products = [p for p in bundle_products if p] # Remove Nones
 
-            if len(bundle_products) < 2: continue
+            # A->B aur B->A ek hi bundle hai: score once (rules trained before canonical bundles)
+            bundle_key = frozenset(bundle_ids)
+            if bundle_key in seen_bundles: continue
+            seen_bundles.add(bundle_key)
+            bundle_rows = [products.row(pid) if pid and pid != "None" else None for pid in bundle_ids]
+            found = [row for row in bundle_rows if row is not None]
+
+            if len(found) < 2: continue
 
             base_score = float(rule.get("confidence", 0) * rule.get("lift", 1))
             # Bundle ke kisi bhi item par boost hai toh bundle ko boost karo
-            bundle_boost = max([expiry_weights.get(str(pid), 1.0) for pid in bundle_ids], default=1.0)
-            
-            final_feed.append({
-                "type": "bundle",
-                "items": bundle_products,
-                "reason": "Frequently bought together",
-                "score": round(base_score * bundle_boost, 4),
-                "isUrgent": bundle_boost > 1.0,
-                "metadata": {"lift": rule.get("lift"), "confidence": rule.get("confidence")}
-            })
-
-        # --- 4. INDIVIDUAL PERSONALIZED FEED ---
-        all_pids = set(norm_collab.keys()) | set(norm_content.keys())
-        category_counts = {}
-
-        for pid in all_pids:
-            p_meta = product_map.get(str(pid))
-            if not p_meta: continue
-
-            # Hybrid Formula: 60% Behavior, 40% Content
-            h_score = (0.6 * norm_collab.get(pid, 0.0)) + (0.4 * norm_content.get(pid, 0.0))
-            boost = expiry_weights.get(str(pid), 1.0)
-            final_score = h_score * boost
-
-            # Diversification: Ek category ke max 3 items
-            cat = p_meta.get("category", "General")
-            category_counts[cat] = category_counts.get(cat, 0) + 1
-            
-            if final_score > 0.01 and category_counts[cat] <= 3:
+            bundle_boost = max([float(boosts[row]) if row is not None else 1.0 for row in bundle_rows], default=1.0)
+            urgent = max([float(weights[row]) if row is not None else 1.0 for row in bundle_rows], default=1.0) > 1.0
+            entries.append((
+                RankedFeed.BUNDLE, round(base_score * bundle_boost, 4), urgent, found,
+                rule.get("lift"), rule.get("confidence")
+            ))
+
+        # --- 4. INDIVIDUAL PERSONALIZED FEED (vectorized over table rows) ---
+        all_pids = list(norm_collab.keys() | norm_content.keys())
+        rows = products.codes(all_pids)
+        known = rows >= 0
+        rows = rows[known]
+        collab = np.array([norm_collab.get(pid, 0.0) for pid in all_pids])[known]
+        content = np.array([norm_content.get(pid, 0.0) for pid in all_pids])[known]
+
+        # Hybrid Formula: 60% Behavior, 40% Content (defaults; benchmarks.evaluate compares others)
+        # Business rules (expiry, discount, margin) cost one gather and one multiply
+        final_scores = (collab_weight * collab + content_weight * content) * boosts[rows]
+        eligible = final_scores > 0.01
+        rows, final_scores = rows[eligible], final_scores[eligible]
+
+        # Best MAX_PER_CATEGORY per category; nothing past max_recommendations can make the feed
+        picked = self._top_per_category(rows, final_scores, products.category_codes, MAX_PER_CATEGORY)[:max_recommendations]
+        for pos in picked:
+            entries.append((
+                RankedFeed.INDIVIDUAL, round(float(final_scores[pos]), 4), bool(weights[rows[pos]] > 1.0), [int(rows[pos])],
+                None, None
+            ))
+
+        # --- 5. SORT ---
+        entries.sort(key=lambda e: e[1], reverse=True)
+        return RankedFeed(products, entries[:max_recommendations], near_expiry_rows)
+
+    def generate_hybrid_recommendations(
+        self,
+        mba_rules: List[Dict[str, Any]],
+        content_scores: Dict[str, float],
+        collab_scores: Dict[str, float],
+        expiry_weights: Union[np.ndarray, Dict[str, float]],
+        product_map: Union[ProductTable, Dict[str, Dict[str, Any]]],
+        max_recommendations: int = 20,
+        business_boosts: Optional[np.ndarray] = None
+    ) -> Dict[str, Any]:
+        """
+        Single unified function to handle:
+        1. Near Expiry Extraction
+        2. Market Basket Analysis (Bundles)
+        3. Hybrid User Recommendations
+
+        product_map is a ProductTable (or a {productId: doc} dict, converted on
+        the fly); expiry_weights is one weight per table row (or a dict).
+        """
+        ranked = self.rank(mba_rules, content_scores, collab_scores, expiry_weights, product_map, max_recommendations,
+                           business_boosts=business_boosts)
+        return ranked.render()
+
+
+class RankedFeed:
+    """
+    Ranked fusion output as ProductTable rows, best first. Entry i covers
+    rows[offsets[i]:offsets[i + 1]] (a single row for individual items).
+    render() builds the public JSON feed; the arrays are what the internal
+    scoring API ships. reason labels individual items; fallback marks feeds
+    served from precomputed popularity after the live pipeline failed.
+    """
+
+    INDIVIDUAL, BUNDLE = 0, 1
+    reason = "Based on your interest"
+    fallback = False
+
+    def __init__(self, products: ProductTable, entries: List[tuple], near_expiry_rows: np.ndarray):
+        self.products = products
+        self.kinds = np.array([e[0] for e in entries], dtype=np.uint8)
+        self.scores = np.array([e[1] for e in entries], dtype=np.float64)
+        self.urgent = np.array([e[2] for e in entries], dtype=bool)
+        self.offsets = np.zeros(len(entries) + 1, dtype=np.int32)
+        np.cumsum([len(e[3]) for e in entries], out=self.offsets[1:])
+        self.rows = np.array([row for e in entries for row in e[3]], dtype=np.int32)
+        self.lift = np.array([np.nan if e[4] is None else e[4] for e in entries], dtype=np.float64)
+        self.confidence = np.array([np.nan if e[5] is None else e[5] for e in entries], dtype=np.float64)
+        self.near_expiry = near_expiry_rows.astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def render(self) -> Dict[str, Any]:
+        products = self.products
+        final_feed = []
+        for i in range(len(self)):
+            rows = self.rows[self.offsets[i]:self.offsets[i + 1]]
+            if self.kinds[i] == self.BUNDLE:
+                lift, confidence = self.lift[i], self.confidence[i]
+                final_feed.append({
+                    "type": "bundle",
+                    "items": [products.summary(row) for row in rows],
+                    "reason": "Frequently bought together",
+                    "score": float(self.scores[i]),
+                    "isUrgent": bool(self.urgent[i]),
+                    "metadata": {
+                        "lift": None if np.isnan(lift) else float(lift),
+                        "confidence": None if np.isnan(confidence) else float(confidence)
+                    }
+                })
+            else:
                 final_feed.append({
                     "type": "individual",
-                    "product": self._get_product_summary(pid, product_map),
-                    "reason": "Based on your interest",
-                    "score": round(final_score, 4),
-                    "isUrgent": boost > 1.0
+                    "product": products.summary(rows[0]),
+                    "reason": self.reason,
+                    "score": float(self.scores[i]),
+                    "isUrgent": bool(self.urgent[i])
                 })
 
-        # --- 5. SORT & RETURN ---
-        final_feed.sort(key=lambda x: x["score"], reverse=True)
-
-        return {
+        out = {
             "success": True,
-            "feed": final_feed[:max_recommendations],
-            "near_expiry": near_expiry_products, # React yahan se Paneer uthayega
+            "feed": final_feed,
+            "near_expiry": [products.summary(row) for row in self.near_expiry], # React yahan se Paneer uthayega
             "timestamp": datetime.now().isoformat()
-        }
\ No newline at end of file
+        }
+        if self.fallback:
+            out["fallback"] = True
+        return out
@@ -0,0 +1,488 @@
+"""
+In-process stand-in for the subset of the PyMongo API the ML engine uses.
+
+Not a general Mongo emulator: it supports equality / $in / $nin / $ne / range
+filters, include-style projections (dotted paths included), single-field hash
+indexes, the aggregation stages the loader pushes down ($match, $project,
+$unwind, $group with $sum / $max, $count, $sort, $limit) and the write calls made by
+data/loader.py. Install it with db.set_db(MemoryDatabase())
+before the app is imported.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+
+_MISSING = object()
+
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            value = value[int(part)] if int(part) < len(value) else _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$in":
+                if isinstance(value, list):
+                    if not any(v in arg for v in value):
+                        return False
+                elif value not in arg:
+                    return False
+            elif op == "$nin":
+                if value in arg:
+                    return False
+            elif op == "$ne":
+                if value == arg:
+                    return False
+            elif op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is _MISSING or value is None:
+                    return False
+                try:
+                    if op == "$gt" and not value > arg:
+                        return False
+                    if op == "$gte" and not value >= arg:
+                        return False
+                    if op == "$lt" and not value < arg:
+                        return False
+                    if op == "$lte" and not value <= arg:
+                        return False
+                except TypeError:
+                    return False
+            else:
+                raise NotImplementedError(f"MemoryCollection does not support operator {op}")
+        return True
+
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    if not query:
+        return True
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+            continue
+        if field == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+            continue
+        if not _match_condition(_get_path(doc, field), condition):
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return dict(doc)
+
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out: Dict[str, Any] = {}
+        for k in include:
+            _include_path(doc, k.split("."), out)
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+
+    exclude = {k for k, v in projection.items() if not v}
+    return {k: v for k, v in doc.items() if k not in exclude}
+
+
+def _include_path(doc: Dict[str, Any], parts: List[str], out: Dict[str, Any]) -> None:
+    """Copies one (possibly dotted) included field; arrays of subdocuments are projected element-wise."""
+    head = parts[0]
+    if head not in doc:
+        return
+    value = doc[head]
+    if len(parts) == 1:
+        out[head] = value
+    elif isinstance(value, dict):
+        _include_path(value, parts[1:], out.setdefault(head, {}))
+    elif isinstance(value, list):
+        projected = out.setdefault(head, [{} for _ in value])
+        for element, target in zip(value, projected):
+            if isinstance(element, dict):
+                _include_path(element, parts[1:], target)
+
+
+# --- aggregation (the subset used by the loader's pushdown pipelines) ---
+
+def _field(doc: Any, path: str) -> Any:
+    """Field path lookup with Mongo's array traversal: "items.productId" yields a list."""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [v.get(part) for v in value if isinstance(v, dict) and part in v]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _evaluate(expr: Any, doc: Dict[str, Any], variables: Dict[str, Any]) -> Any:
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, _, rest = expr[2:].partition(".")
+        value = variables.get(name, _MISSING)
+        return _field(value, rest) if rest else value
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _field(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_evaluate(e, doc, variables) for e in expr]
+    if isinstance(expr, dict) and len(expr) == 1 and next(iter(expr)).startswith("$"):
+        op, arg = next(iter(expr.items()))
+        if op == "$setUnion":
+            out = {}
+            for part in _evaluate(arg, doc, variables):
+                for v in (part if isinstance(part, list) else []):
+                    out.setdefault(_hashable(v), v)
+            return list(out.values())
+        if op == "$filter":
+            name = arg.get("as", "this")
+            items = _evaluate(arg["input"], doc, variables)
+            items = items if isinstance(items, list) else []
+            return [v for v in items if _evaluate(arg["cond"], doc, {**variables, name: v})]
+        if op == "$in":
+            value, array = (_evaluate(a, doc, variables) for a in arg)
+            return value in array
+        if op == "$size":
+            value = _evaluate(arg, doc, variables)
+            return len(value) if isinstance(value, list) else 0
+        if op == "$literal":
+            return arg
+        raise NotImplementedError(f"MemoryCollection.aggregate does not support operator {op}")
+    if isinstance(expr, dict):
+        return {k: _evaluate(v, doc, variables) for k, v in expr.items()}
+    return expr
+
+
+def _freeze_in(expr: Any) -> Any:
+    """Turns literal $in arrays into sets once, instead of re-evaluating them per document."""
+    if isinstance(expr, dict):
+        if set(expr) == {"$in"} and isinstance(expr["$in"], list) and isinstance(expr["$in"][1], list):
+            array = expr["$in"][1]
+            if not any(isinstance(v, str) and v.startswith("$") for v in array):
+                return {"$in": [_freeze_in(expr["$in"][0]), {"$literal": frozenset(_hashable(v) for v in array)}]}
+        return {k: _freeze_in(v) for k, v in expr.items()}
+    if isinstance(expr, list):
+        return [_freeze_in(v) for v in expr]
+    return expr
+
+
+def _aggregate(docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for stage in _freeze_in(pipeline):
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [d for d in docs if matches(d, spec)]
+        elif name == "$project":
+            flags = {k: v for k, v in spec.items() if isinstance(v, (bool, int))}
+            computed = {k: v for k, v in spec.items() if k not in flags}
+            out = []
+            for d in docs:
+                row: Dict[str, Any] = {}
+                for k in (k for k, v in flags.items() if v and k != "_id"):
+                    _include_path(d, k.split("."), row)
+                if flags.get("_id", 1) and "_id" in d:
+                    row["_id"] = d["_id"]
+                for k, expr in computed.items():
+                    value = _evaluate(expr, d, {})
+                    if value is not _MISSING:
+                        row[k] = value
+                out.append(row)
+            docs = out
+        elif name == "$unwind":
+            path = (spec["path"] if isinstance(spec, dict) else spec)[1:]
+            out = []
+            for d in docs:
+                values = _get_path(d, path)
+                for v in (values if isinstance(values, list) else []):
+                    out.append({**d, path: v})
+            docs = out
+        elif name == "$group":
+            groups: Dict[Any, Dict[str, Any]] = {}
+            for d in docs:
+                key = _evaluate(spec["_id"], d, {})
+                row = groups.setdefault(_hashable(key), {"_id": key})
+                for field, acc in spec.items():
+                    if field == "_id":
+                        continue
+                    (op, arg), = acc.items()
+                    value = _evaluate(arg, d, {})
+                    if op == "$sum":
+                        row[field] = row.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+                    elif op == "$max":
+                        # Missing / null values are ignored, as in MongoDB
+                        current = row.get(field)
+                        if value is not _MISSING and value is not None and (current is None or value > current):
+                            row[field] = value
+                        else:
+                            row.setdefault(field, current)
+                    else:
+                        raise NotImplementedError(f"MemoryCollection.aggregate does not support accumulator {op}")
+            docs = list(groups.values())
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == "$sort":
+            for k, direction in reversed(list(spec.items())):
+                docs.sort(key=lambda doc: (_get_path(doc, k) is _MISSING, _get_path(doc, k)), reverse=direction < 0)
+        elif name == "$limit":
+            docs = docs[:spec]
+        else:
+            raise NotImplementedError(f"MemoryCollection.aggregate does not support stage {name}")
+    return docs
+
+
+class MemoryCursor:
+    """Iterable result with the chainable cursor methods the code base calls."""
+
+    def __init__(self, docs: List[Dict[str, Any]], projection: Optional[Dict[str, Any]]):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        if isinstance(key, list):
+            for k, d in reversed(key):
+                self._docs.sort(key=lambda doc: (_get_path(doc, k) is _MISSING, _get_path(doc, k)), reverse=d < 0)
+        else:
+            self._docs.sort(key=lambda doc: (_get_path(doc, key) is _MISSING, _get_path(doc, key)), reverse=direction < 0)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        for doc in docs:
+            yield _project(doc, self._projection)
+
+
+class _UpdateResult:
+    def __init__(self, matched: int):
+        self.matched_count = matched
+        self.modified_count = matched
+
+
+class _DeleteResult:
+    def __init__(self, deleted: int):
+        self.deleted_count = deleted
+
+
+class _InsertManyResult:
+    def __init__(self, ids: List[Any]):
+        self.inserted_ids = ids
+
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: List[Dict[str, Any]] = []
+        self._indexes: Dict[str, Dict[Any, List[Dict[str, Any]]]] = {}
+        self._lock = threading.RLock()
+
+    # --- indexes ---
+
+    def create_index(self, keys, **kwargs) -> str:
+        field = keys if isinstance(keys, str) else keys[0][0]
+        with self._lock:
+            index = defaultdict(list)
+            for doc in self._docs:
+                index[_hashable(_get_path(doc, field))].append(doc)
+            self._indexes[field] = index
+        return f"{field}_1"
+
+    def _candidates(self, query: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Like the query planner: of the indexed equality / $in fields, scan the most selective
+        best = None
+        for field, condition in (query or {}).items():
+            index = self._indexes.get(field)
+            if index is None:
+                continue
+            if isinstance(condition, dict) and set(condition) == {"$in"}:
+                out = []
+                for value in condition["$in"]:
+                    out.extend(index.get(_hashable(value), ()))
+            elif not isinstance(condition, dict):
+                out = index.get(_hashable(condition), ())
+            else:
+                continue
+            if best is None or len(out) < len(best):
+                best = out
+        return list(self._docs) if best is None else list(best)
+
+    def _reindex(self) -> None:
+        for field in list(self._indexes):
+            self.create_index(field)
+
+    # --- reads ---
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs) -> MemoryCursor:
+        with self._lock:
+            docs = [d for d in self._candidates(query) if matches(d, query)]
+        return MemoryCursor(docs, projection)
+
+    def find_one(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs):
+        for doc in self.find(query, projection).limit(1):
+            return doc
+        return None
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            first = pipeline[0].get("$match") if pipeline else None
+            docs = [d for d in self._candidates(first) if matches(d, first)]
+        return iter(_aggregate(docs, pipeline[1:] if first is not None else pipeline))
+
+    def count_documents(self, query: Optional[Dict[str, Any]] = None, **kwargs) -> int:
+        with self._lock:
+            return sum(1 for d in self._candidates(query) if matches(d, query))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    def distinct(self, field: str, query: Optional[Dict[str, Any]] = None) -> List[Any]:
+        seen = {}
+        for doc in self.find(query):
+            value = _get_path(doc, field)
+            if value is not _MISSING:
+                for v in (value if isinstance(value, list) else [value]):
+                    seen.setdefault(_hashable(v), v)
+        return list(seen.values())
+
+    # --- writes ---
+
+    def insert_one(self, doc: Dict[str, Any]):
+        return self.insert_many([doc])
+
+    def insert_many(self, docs: Iterable[Dict[str, Any]], ordered: bool = True):
+        ids = []
+        with self._lock:
+            for doc in docs:
+                doc.setdefault("_id", ObjectId())
+                stored = dict(doc)
+                self._docs.append(stored)
+                for field, index in self._indexes.items():
+                    index[_hashable(_get_path(stored, field))].append(stored)
+                ids.append(doc["_id"])
+        return _InsertManyResult(ids)
+
+    def update_many(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        with self._lock:
+            targets = [d for d in self._candidates(query) if matches(d, query)]
+            for doc in targets:
+                self._apply_update(doc, update)
+            if targets and any(f in update.get("$set", {}) for f in self._indexes):
+                self._reindex()
+        return _UpdateResult(len(targets))
+
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        with self._lock:
+            target = next((d for d in self._candidates(query) if matches(d, query)), None)
+            if target is None:
+                if not upsert:
+                    return _UpdateResult(0)
+                target = {k: v for k, v in query.items() if not isinstance(v, dict)}
+                self._apply_update(target, update)
+                self.insert_many([target])
+                return _UpdateResult(0)
+            self._apply_update(target, update)
+            if any(f in update.get("$set", {}) for f in self._indexes):
+                self._reindex()
+        return _UpdateResult(1)
+
+    def replace_one(self, query: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False):
+        with self._lock:
+            target = next((d for d in self._candidates(query) if matches(d, query)), None)
+            if target is None:
+                if upsert:
+                    self.insert_many([dict(replacement)])
+                return _UpdateResult(0)
+            _id = target.get("_id")
+            target.clear()
+            target.update(replacement)
+            target["_id"] = _id
+            self._reindex()
+        return _UpdateResult(1)
+
+    def delete_many(self, query: Dict[str, Any]):
+        with self._lock:
+            before = len(self._docs)
+            self._docs = [d for d in self._docs if not matches(d, query)]
+            self._reindex()
+            return _DeleteResult(before - len(self._docs))
+
+    @staticmethod
+    def _apply_update(doc: Dict[str, Any], update: Dict[str, Any]) -> None:
+        for field, value in update.get("$set", {}).items():
+            doc[field] = value
+        for field, value in update.get("$setOnInsert", {}).items():
+            doc.setdefault(field, value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        for field, value in update.get("$push", {}).items():
+            doc.setdefault(field, []).append(value)
+
+
+class MemoryDatabase:
+    """Dict of MemoryCollections with the Database methods the engine calls."""
+
+    def __init__(self, name: str = "shopfusion"):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name)
+            return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def command(self, name: str, *args, **kwargs) -> Dict[str, Any]:
+        if name == "ping":
+            return {"ok": 1.0}
+        raise NotImplementedError(f"MemoryDatabase does not support command {name}")
@@ -0,0 +1,199 @@
+"""
+Tenant affinity across several local engine processes.
+
+Starts --pods uvicorn processes. Each holds the same seeded in-memory
+database and knows the others as peers. The script trains every tenant and
+sends recommend requests to random pods, then reports per pod how many
+retailers it holds and how requests were routed (local / forwarded). With
+--add-pod, one more pod joins afterwards, the peer list is updated on every
+pod, and the report shows how many retailers moved (about 1/(pods+1) with
+consistent hashing).
+
+    cd ml-engine
+    python -m loadtest.run_affinity --pods 3 --tenants 12 --requests 300
+    python -m loadtest.run_affinity --pods 2 --tenants 12 --add-pod --output affinity.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SIZES  # noqa: E402
+from loadtest.run_load import _free_port, _request  # noqa: E402
+from serving.affinity import PEER_TOKEN_HEADER  # noqa: E402
+
+# Shared by the pods of one run; also authorises the peer-list update
+_PEER_SECRET = secrets.token_hex(16)
+
+_AFFINITY_LINE = re.compile(r'^shopfusion_affinity_requests_total\{route="([^"]+)"\} ([0-9.eE+-]+)$')
+
+
+def serve(port: int, tenants: int, size: str, seed: int) -> None:
+    """Pod process: seeds its in-memory database and serves app:app until killed."""
+    import uvicorn
+    import db as db_module
+    from loadtest.memory_db import MemoryDatabase
+    from loadtest.run_load import seed_database
+
+    database = MemoryDatabase()
+    db_module.set_db(database)
+    seed_database(database, tenants, size, seed)
+    from app import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def start_pod(port: int, peers: List[str], args, work_dir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        AFFINITY_SELF=f"http://127.0.0.1:{port}",
+        AFFINITY_PEERS=",".join(peers),
+        MODEL_DIR=os.path.join(work_dir, f"models-{port}"),
+        COUNT_STORE_DIR=os.path.join(work_dir, f"counts-{port}"),
+        WARM_LOAD_MODELS="false",
+        AFFINITY_SECRET=_PEER_SECRET,
+        AFFINITY_PEERS_API="true",
+    )
+    cmd = [sys.executable, "-m", "loadtest.run_affinity", "--serve", str(port),
+           "--tenants", str(args.tenants), "--size", args.size, "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            stdout=subprocess.DEVNULL)
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if _request(("127.0.0.1", port), "GET", "/health")[0] == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"Pod on port {port} did not become healthy")
+
+
+def pod_state(port: int) -> Dict[str, Any]:
+    _, body = _request(("127.0.0.1", port), "GET", "/api/affinity")
+    state = json.loads(body)
+    _, metrics = _request(("127.0.0.1", port), "GET", "/metrics")
+    routes = {}
+    for line in metrics.decode().splitlines():
+        m = _AFFINITY_LINE.match(line)
+        if m:
+            routes[m.group(1)] = int(float(m.group(2)))
+    return {"served": state["served"], "routes": routes}
+
+
+def owners(ports: List[int], retailers: List[str]) -> Dict[str, str]:
+    """Owner of every retailer as seen by the first pod."""
+    out = {}
+    for r in retailers:
+        _, body = _request(("127.0.0.1", ports[0]), "GET", f"/api/affinity?user_id={r}")
+        out[r] = json.loads(body)["owner"]
+    return out
+
+
+def _put_json(port: int, path: str, payload: Dict[str, Any]) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("PUT", path, body=json.dumps(payload),
+                     headers={"Content-Type": "application/json", PEER_TOKEN_HEADER: _PEER_SECRET})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def drive(ports: List[int], tenants: List[Dict[str, Any]], requests: int, rng: random.Random) -> Dict[str, Any]:
+    """Recommend requests for random tenants, each sent to a random pod."""
+    errors = 0
+    for _ in range(requests):
+        tenant = rng.choice(tenants)
+        shopper = rng.choice(tenant["shoppers"])
+        status, _ = _request(("127.0.0.1", rng.choice(ports)), "GET", f"/api/recommend/{tenant['retailer']}?shopper_id={shopper}")
+        errors += status >= 400
+    return {"requests": requests, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tenant affinity test with several local engine processes.")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--pods", type=int, default=3)
+    parser.add_argument("--tenants", type=int, default=12)
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--add-pod", action="store_true", help="join one more pod after the first round")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.tenants, args.size, args.seed)
+        return
+
+    # Same seed as the pods: the tenant list matches what they hold
+    from loadtest.memory_db import MemoryDatabase
+    from loadtest.run_load import seed_database
+    tenants = seed_database(MemoryDatabase(), args.tenants, args.size, args.seed)
+    retailers = [t["retailer"] for t in tenants]
+    rng = random.Random(args.seed)
+
+    work_dir = tempfile.mkdtemp(prefix="shopfusion-affinity-")
+    ports = [_free_port() for _ in range(args.pods)]
+    peers = [f"http://127.0.0.1:{p}" for p in ports]
+    procs = [start_pod(p, peers, args, work_dir) for p in ports]
+    report: Dict[str, Any] = {"config": {k: v for k, v in vars(args).items() if k not in ("serve", "output")}}
+    try:
+        # Training requests go to random pods too; each is forwarded to the retailer's owner
+        for r in retailers:
+            status, body = _request(("127.0.0.1", rng.choice(ports)), "POST", f"/api/train/{r}")
+            if status >= 400:
+                raise RuntimeError(f"Training failed for {r}: {body[:200]!r}")
+
+        report["load"] = drive(ports, tenants, args.requests, rng)
+        before = owners(ports, retailers)
+        report["pods"] = {peers[i]: pod_state(p) for i, p in enumerate(ports)}
+
+        if args.add_pod:
+            port = _free_port()
+            ports.append(port)
+            peers.append(f"http://127.0.0.1:{port}")
+            procs.append(start_pod(port, peers, args, work_dir))
+            for p in ports[:-1]:
+                _put_json(p, "/api/affinity/peers", {"peers": peers})
+            after = owners(ports, retailers)
+            for r in retailers:
+                # Retailers that moved are trained on their new owner (reached through any pod)
+                if after[r] != before[r]:
+                    _request(("127.0.0.1", rng.choice(ports)), "POST", f"/api/train/{r}")
+            report["rebalance"] = {
+                "moved": sum(after[r] != before[r] for r in retailers),
+                "retailers": len(retailers),
+                "expected_share": round(1 / len(ports), 3),
+                "load": drive(ports, tenants, args.requests, rng),
+                "pods": {peers[i]: pod_state(p) for i, p in enumerate(ports)},
+            }
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=30)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
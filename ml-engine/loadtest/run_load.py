@@ -0,0 +1,263 @@
+"""
+End-to-end HTTP load test for the ML engine.
+
+Boots the FastAPI app under uvicorn in this process, backed by the in-memory
+Mongo stand-in seeded with synthetic tenants. It trains every tenant, then drives
+/api/recommend (and optionally /api/train) at a fixed concurrency.
+
+    cd ml-engine
+    python -m loadtest.run_load --tenants 4 --size medium --concurrency 16 --duration 30
+    python -m loadtest.run_load --train-ratio 0.05 --output load.json
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint, plus
+server-side per-stage timings taken from /metrics deltas.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+from benchmarks.synthetic import SIZES, generate_products, generate_transactions  # noqa: E402
+from loadtest.memory_db import MemoryDatabase  # noqa: E402
+
+_STAGE_SUM = re.compile(r'^shopfusion_stage_seconds_sum\{pipeline="([^"]+)",stage="([^"]+)"\} ([0-9.eE+-]+)$')
+_STAGE_COUNT = re.compile(r'^shopfusion_stage_seconds_count\{pipeline="([^"]+)",stage="([^"]+)"\} ([0-9.eE+-]+)$')
+
+
+def seed_database(db: MemoryDatabase, tenants: int, size: str, seed: int = 7) -> List[Dict[str, Any]]:
+    """Fills the stand-in with synthetic tenants. Returns [{retailer, shoppers, skus}]."""
+    from data.loader import PRODUCTS_COL, TRANSACTIONS_COL
+
+    db[PRODUCTS_COL].create_index("user")
+    db[PRODUCTS_COL].create_index("productId")
+    db[TRANSACTIONS_COL].create_index("user")
+    db[TRANSACTIONS_COL].create_index("shopperId")
+    db["associationrules"].create_index("userId")
+
+    params = SIZES[size]
+    # Ids derive from the seed, so separate processes seeded alike hold the same tenants
+    ids = random.Random(seed)
+    out = []
+    for t in range(tenants):
+        retailer = ObjectId(ids.randbytes(12))
+        products = generate_products(params["n_products"], retailer_id=retailer, seed=seed + t)
+        for p in products:
+            p["_id"] = ObjectId(ids.randbytes(12))
+        transactions = generate_transactions(
+            products,
+            params["n_shoppers"],
+            params["n_transactions"],
+            retailer_id=retailer,
+            seed=seed + 100 + t
+        )
+        for tx in transactions:
+            tx["_id"] = ObjectId(ids.randbytes(12))
+
+        db[PRODUCTS_COL].insert_many(products)
+        db[TRANSACTIONS_COL].insert_many(transactions)
+        out.append({
+            "retailer": str(retailer),
+            "shoppers": sorted({tx["shopperId"] for tx in transactions}),
+            "skus": [p["productId"] for p in products],
+        })
+        print(f"[SEED] tenant {retailer}: {len(products)} products, {len(transactions)} transactions")
+    return out
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int):
+    """Starts uvicorn serving app:app in a daemon thread and waits for /health."""
+    import uvicorn
+    from app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            status, _ = _request(("127.0.0.1", port), "GET", "/health")
+            if status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("ML engine did not become healthy within 30s")
+
+
+def _request(addr: Tuple[str, int], method: str, path: str, conn: http.client.HTTPConnection = None, timeout: float = 300.0):
+    own = conn is None
+    if own:
+        conn = http.client.HTTPConnection(*addr, timeout=timeout)
+    try:
+        conn.request(method, path)
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, body
+    finally:
+        if own:
+            conn.close()
+
+
+def scrape_stages(addr: Tuple[str, int]) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """Returns {(pipeline, stage): (sum_seconds, count)} from /metrics."""
+    _, body = _request(addr, "GET", "/metrics")
+    sums, counts = {}, {}
+    for line in body.decode().splitlines():
+        m = _STAGE_SUM.match(line)
+        if m:
+            sums[(m.group(1), m.group(2))] = float(m.group(3))
+            continue
+        m = _STAGE_COUNT.match(line)
+        if m:
+            counts[(m.group(1), m.group(2))] = float(m.group(3))
+    return {k: (sums.get(k, 0.0), counts.get(k, 0.0)) for k in set(sums) | set(counts)}
+
+
+def _summarize(latencies: List[float], errors: int, elapsed: float, shed: int = 0) -> Dict[str, Any]:
+    total = len(latencies) + errors + shed
+    arr = np.array(latencies) * 1000.0 if latencies else np.array([0.0])
+    return {
+        "requests": total,
+        "errors": errors,
+        "shed": shed,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+
+def drive_load(addr, tenants, concurrency: int, duration: float, train_ratio: float, cart_size: int, seed: int) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    # 503 from admission control: load shedding by design, not an error
+    shed: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def worker(worker_id: int):
+        rng = random.Random(seed + worker_id)
+        conn = http.client.HTTPConnection(*addr, timeout=300)
+        while time.time() < stop_at:
+            tenant = rng.choice(tenants)
+            if rng.random() < train_ratio:
+                endpoint, method = "train", "POST"
+                path = f"/api/train/{tenant['retailer']}"
+            else:
+                endpoint, method = "recommend", "GET"
+                shopper = rng.choice(tenant["shoppers"])
+                cart = ",".join(rng.sample(tenant["skus"], min(cart_size, len(tenant["skus"])))) if cart_size else ""
+                path = f"/api/recommend/{tenant['retailer']}?shopper_id={shopper}&cart_items={cart}"
+
+            start = time.perf_counter()
+            status = 0
+            try:
+                status, _ = _request(addr, method, path, conn=conn)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(*addr, timeout=300)
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                if ok:
+                    latencies[endpoint].append(elapsed)
+                elif status == 503:
+                    shed[endpoint] += 1
+                else:
+                    errors[endpoint] += 1
+        conn.close()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.time() - start
+
+    return {ep: _summarize(latencies[ep], errors[ep], elapsed, shed[ep]) for ep in set(latencies) | set(errors) | set(shed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test for the ShopFusion ML engine on an in-memory database.")
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--size", choices=sorted(SIZES), default="medium")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of steady-state load")
+    parser.add_argument("--train-ratio", type=float, default=0.0, help="share of requests that are /api/train")
+    parser.add_argument("--cart-size", type=int, default=2, help="random cart items per recommend request")
+    parser.add_argument("--cache-size", type=int, help="override RECOMMEND_CACHE_SIZE (0 disables caching)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    if args.cache_size is not None:
+        os.environ["RECOMMEND_CACHE_SIZE"] = str(args.cache_size)
+
+    import db as db_module
+    database = MemoryDatabase()
+    db_module.set_db(database)
+    tenants = seed_database(database, args.tenants, args.size, args.seed)
+
+    port = _free_port()
+    addr = ("127.0.0.1", port)
+    server = start_server(port)
+    print(f"[LOAD] Engine listening on {addr[0]}:{port}")
+
+    train_start = time.perf_counter()
+    for tenant in tenants:
+        status, body = _request(addr, "POST", f"/api/train/{tenant['retailer']}")
+        if status >= 400:
+            raise RuntimeError(f"Initial training failed for {tenant['retailer']}: {body[:200]!r}")
+    print(f"[LOAD] Trained {len(tenants)} tenants in {time.perf_counter() - train_start:.2f}s")
+
+    before = scrape_stages(addr)
+    endpoints = drive_load(addr, tenants, args.concurrency, args.duration, args.train_ratio, args.cart_size, args.seed)
+    after = scrape_stages(addr)
+
+    stages = {}
+    for key, (s_after, c_after) in sorted(after.items()):
+        s_before, c_before = before.get(key, (0.0, 0.0))
+        calls = c_after - c_before
+        if calls > 0:
+            stages[f"{key[0]}.{key[1]}"] = {"calls": int(calls), "mean_ms": round(1000.0 * (s_after - s_before) / calls, 3)}
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "endpoints": endpoints,
+        "server_stages": stages,
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+from monitoring.profiling import current_session
+from monitoring.training_runs import current_run
+
+# Default latency buckets (seconds): sub-millisecond cache hits up to multi-minute training runs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter; inc() is a dict update under a lock."""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Mirrors a monotonic count kept elsewhere (read by a collector at scrape time)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Point-in-time value per label set."""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def remove(self, **labels) -> None:
+        """Drops every series whose labels match the given subset."""
+        match = {self.labelnames.index(n): str(v) for n, v in labels.items() if n in self.labelnames}
+        with self._lock:
+            for key in [k for k in self._values if all(k[i] == v for i, v in match.items())]:
+                del self._values[key]
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram. observe() is a bisect plus three in-place
+    updates, so it is cheap enough for every request on the hot path.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[key] = state
+            state[0][idx] += 1
+            state[1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Registers a callback that refreshes gauges right before each scrape."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception:
+                pass
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "shopfusion_stage_seconds",
+    "Wall time spent in each pipeline stage.",
+    ("pipeline", "stage")
+)
+MODEL_VERSION = REGISTRY.gauge(
+    "shopfusion_model_published_timestamp_seconds",
+    "Unix time at which the served model version was published, per retailer.",
+    ("retailer", "version")
+)
+MODEL_SIZE = REGISTRY.gauge(
+    "shopfusion_model_size",
+    "Size of each fitted model component per retailer (rows/items).",
+    ("retailer", "component")
+)
+MODEL_BYTES = REGISTRY.gauge(
+    "shopfusion_model_bytes",
+    "Approximate in-memory size of each fitted model component per retailer.",
+    ("retailer", "component")
+)
+CACHE_EVENTS = REGISTRY.counter(
+    "shopfusion_cache_lookups_total",
+    "Response cache lookups by outcome (hits, misses, coalesced).",
+    ("cache", "result")
+)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "shopfusion_cache_hit_ratio",
+    "Share of response cache lookups served without running the pipeline.",
+    ("cache",)
+)
+AFFINITY_REQUESTS = REGISTRY.counter(
+    "shopfusion_affinity_requests_total",
+    "Retailer-scoped requests by how tenant affinity routed them (local, forwarded, redirected, fallback).",
+    ("route",)
+)
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "shopfusion_admission_total",
+    "Admission decisions by request class and outcome (admitted, queue_full, deadline, timeout).",
+    ("pipeline", "outcome")
+)
+DEGRADED_RESPONSES = REGISTRY.counter(
+    "shopfusion_degraded_responses_total",
+    "Storefront requests shed by admission control, by what they were served instead (cached, popularity, none).",
+    ("pipeline", "source")
+)
+ADMISSION_SLOTS = REGISTRY.gauge(
+    "shopfusion_admission_requests",
+    "Requests currently running or waiting for admission, by request class.",
+    ("pipeline", "state")
+)
+MONGO_COMMANDS = REGISTRY.counter(
+    "shopfusion_mongo_commands_total",
+    "MongoDB commands issued, by client profile, command name and outcome.",
+    ("client", "command", "status")
+)
+MONGO_COMMAND_SECONDS = REGISTRY.histogram(
+    "shopfusion_mongo_command_seconds",
+    "MongoDB command round-trip latency, by client profile (training / serving).",
+    ("client", "command")
+)
+
+
+@contextmanager
+def stage_timer(pipeline: str, stage: str):
+    """
+    Times a block into shopfusion_stage_seconds{pipeline, stage}, into the
+    request's ProfileSession when profiling is enabled for it, and into the
+    active TrainingRun (CPU time, peak memory) for training stages.
+    """
+    run = current_run() if pipeline == "train" else None
+    run_stage = run.enter(stage) if run is not None else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, pipeline=pipeline, stage=stage)
+        session = current_session()
+        if session is not None:
+            session.add_stage(stage, elapsed)
+        if run_stage is not None:
+            run.exit(run_stage)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """PyMongo command listener feeding Mongo operation counts and latencies for one client profile."""
+
+    def __init__(self, client: str = "serving"):
+        self.client = client
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.inc(client=self.client, command=event.command_name, status="ok")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, client=self.client, command=event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMANDS.inc(client=self.client, command=event.command_name, status="error")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, client=self.client, command=event.command_name)
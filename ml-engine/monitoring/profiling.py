@@ -0,0 +1,202 @@
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+# Modes accepted from the X-Profile header / ?profile= query flag
+STAGES = "stages"
+CPROFILE = "cprofile"
+SAMPLE = "sample"
+_MODE_ALIASES = {"1": STAGES, "true": STAGES, "yes": STAGES, STAGES: STAGES, CPROFILE: CPROFILE, SAMPLE: SAMPLE}
+
+TOP_FUNCTIONS = 25
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+# The interpreter allows only one active cProfile profiler at a time
+_cprofile_lock = threading.Lock()
+
+_current: ContextVar[Optional["ProfileSession"]] = ContextVar("shopfusion_profile", default=None)
+
+# Most recent reports, newest last (shared by all requests in this process)
+PROFILE_STORE: Deque[Dict[str, Any]] = deque(maxlen=200)
+
+
+def parse_mode(value: Optional[str]) -> str:
+    """Maps a header/query value to a profiling mode, or '' when profiling is off."""
+    if not value:
+        return ""
+    return _MODE_ALIASES.get(str(value).strip().lower(), "")
+
+
+def current_session() -> Optional["ProfileSession"]:
+    return _current.get()
+
+
+def record_event(name: str, count: int = 1) -> None:
+    """Counts a notable event (e.g. a slow-path fallback) on the active session, if any."""
+    session = _current.get()
+    if session is not None:
+        session.events[name] += count
+
+
+class _SamplingProfiler:
+    """Periodically samples one thread's stack; cheap enough to run on a live pod."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.self_samples: Counter = Counter()
+        self.total_samples: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="shopfusion-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_samples[_frame_label(frame)] += 1
+            seen = set()
+            while frame is not None:
+                label = _frame_label(frame)
+                if label not in seen:
+                    seen.add(label)
+                    self.total_samples[label] += 1
+                frame = frame.f_back
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "function": label,
+                "self_samples": count,
+                "total_samples": self.total_samples[label],
+                "self_pct": round(100.0 * count / self.samples, 2) if self.samples else 0.0
+            }
+            for label, count in self.self_samples.most_common(limit)
+        ]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class ProfileSession:
+    """Stage breakdown (and optional function profile) for a single request."""
+
+    def __init__(self, mode: str, pipeline: str, user_id: str):
+        self.mode = mode
+        self.pipeline = pipeline
+        self.user_id = user_id
+        self.stages: List[Dict[str, Any]] = []
+        self.events: Counter = Counter()
+        self.started_at = datetime.now(timezone.utc)
+        self._start = 0.0
+        self.total_seconds = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_SamplingProfiler] = None
+        self._report: Optional[Dict[str, Any]] = None
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages.append({"stage": name, "seconds": round(seconds, 6)})
+
+    def start(self) -> None:
+        if self.mode == CPROFILE:
+            if _cprofile_lock.acquire(blocking=False):
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            else:
+                self.events["cprofile_busy"] += 1
+        elif self.mode == SAMPLE:
+            self._sampler = _SamplingProfiler(threading.get_ident())
+            self._sampler.start()
+        self._start = time.perf_counter()
+
+    def stop(self) -> None:
+        self.total_seconds = time.perf_counter() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+            _cprofile_lock.release()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def report(self) -> Dict[str, Any]:
+        if self._report is not None:
+            return self._report
+
+        stage_totals: Dict[str, float] = {}
+        for s in self.stages:
+            stage_totals[s["stage"]] = stage_totals.get(s["stage"], 0.0) + s["seconds"]
+
+        report = {
+            "pipeline": self.pipeline,
+            "user_id": self.user_id,
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat(),
+            "total_seconds": round(self.total_seconds, 6),
+            "stages": {k: round(v, 6) for k, v in stage_totals.items()},
+            "events": dict(self.events)
+        }
+        if self._profiler is not None:
+            report["hot_functions"] = self._top_cprofile(TOP_FUNCTIONS)
+        if self._sampler is not None:
+            report["samples"] = self._sampler.samples
+            report["hot_functions"] = self._sampler.top(TOP_FUNCTIONS)
+
+        self._report = report
+        return report
+
+    def _top_cprofile(self, limit: int) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self._profiler)
+        rows = []
+        for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({func})",
+                "calls": nc,
+                "self_seconds": round(tt, 6),
+                "cumulative_seconds": round(ct, 6)
+            })
+        rows.sort(key=lambda r: r["self_seconds"], reverse=True)
+        return rows[:limit]
+
+
+@contextmanager
+def profiled(mode: str, pipeline: str, user_id: str):
+    """
+    Activates a ProfileSession for the enclosed block when mode is set.
+    Yields None (and costs nothing beyond one ContextVar lookup per stage) when off.
+    """
+    if not mode:
+        yield None
+        return
+
+    session = ProfileSession(mode, pipeline, user_id)
+    token = _current.set(session)
+    session.start()
+    try:
+        yield session
+    finally:
+        session.stop()
+        _current.reset(token)
+        PROFILE_STORE.append(session.report())
+
+
+def recent_profiles(user_id: str = "", limit: int = 20) -> List[Dict[str, Any]]:
+    """Newest-first list of stored reports, optionally for a single retailer."""
+    reports = [r for r in reversed(PROFILE_STORE) if not user_id or r["user_id"] == user_id]
+    return reports[:limit]
@@ -0,0 +1,257 @@
+import logging
+import os
+import re
+import resource
+import socket
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from config import TRAIN_REPORT_TRACEMALLOC
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["TrainingRun"]] = ContextVar("shopfusion_training_run", default=None)
+
+_MB = 1024 * 1024
+
+# Runs in progress in this process. The peak marks (VmHWM, the tracemalloc peak) and
+# tracemalloc itself are process-wide: a run resets the marks only while it is the only
+# active run, and tracemalloc runs while any run that asked for it is active.
+_active: Set["TrainingRun"] = set()
+_active_lock = threading.Lock()
+_tracers = 0
+_rss_resettable = False
+
+
+def _status_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            match = re.search(rf"^{field}:\s+(\d+) kB", f.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the kernel's peak-RSS mark (VmHWM) so the next read covers one stage only; Linux 4.0+."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> int:
+    kb = _status_kb("VmHWM")
+    # ru_maxrss (KiB on Linux) is the process-lifetime peak when /proc is unavailable
+    return (kb if kb is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+
+
+def _rss_bytes() -> int:
+    kb = _status_kb("VmRSS")
+    return kb * 1024 if kb is not None else 0
+
+
+def current_run() -> Optional["TrainingRun"]:
+    return _current.get()
+
+
+def note_inputs(**sizes: Any) -> None:
+    """Records input sizes (products, transactions, ...) on the active run, if any."""
+    run = _current.get()
+    if run is not None:
+        run.inputs.update(sizes)
+
+
+def note_outputs(**sizes: Any) -> None:
+    """Records output sizes (rules, model bytes, ...) on the active run, if any."""
+    run = _current.get()
+    if run is not None:
+        run.outputs.update(sizes)
+
+
+class _Stage:
+    def __init__(self, name: str, traced: bool):
+        self.name = name
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.rss = _rss_bytes()
+        self.traced = traced
+        # Peaks of nested stages and of this stage before a nested one reset the marks
+        self.peak_rss = 0
+        self.peak_traced = 0
+
+
+class TrainingRun:
+    """
+    Wall time, CPU time and peak memory of one training run, per stage.
+
+    Stages are the stage_timer("train", ...) blocks run while the run is
+    active. CPU time is process-wide (BLAS threads included, worker processes
+    of partitioned MBA not). Peak RSS is reset at each stage start where the
+    kernel allows it; otherwise it is the process peak so far
+    (rss_peak_scope "process"). Runs overlapping on the training executor
+    share the process, so no run resets the marks while another is active;
+    their reports say "concurrent": true and rss_peak_scope "process". With
+    TRAIN_REPORT_TRACEMALLOC, the Python allocation peak is recorded too, at
+    a sizeable slowdown.
+    """
+
+    def __init__(self, user_id: str, kind: str, trace: bool = TRAIN_REPORT_TRACEMALLOC):
+        self.user_id = user_id
+        self.kind = kind
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.model_version: Optional[str] = None
+        self.inputs: Dict[str, Any] = {}
+        self.outputs: Dict[str, Any] = {}
+        self.stages: List[Dict[str, Any]] = []
+        self.started_at = datetime.now(timezone.utc)
+        self.rss_resettable = False
+        self.concurrent = False
+        self._trace = trace
+        self._started_tracing = False
+        self._open: List[_Stage] = []
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._peak_rss = 0
+        self._peak_traced = 0
+
+    def start(self) -> None:
+        global _tracers, _rss_resettable
+        with _active_lock:
+            if _active:
+                self.concurrent = True
+                for other in _active:
+                    other.concurrent = True
+            _active.add(self)
+            # Tracing started outside any run (e.g. a profiler) is left alone
+            if self._trace and (_tracers or not tracemalloc.is_tracing()):
+                if not _tracers:
+                    tracemalloc.start()
+                _tracers += 1
+                self._started_tracing = True
+            if not self.concurrent:
+                _rss_resettable = _reset_peak_rss()
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+            self.rss_resettable = _rss_resettable
+
+    def _mark_peaks(self) -> None:
+        """Folds the peaks since the last reset into every open stage, then resets the marks if no other run is active."""
+        with _active_lock:
+            rss = _peak_rss_bytes()
+            traced = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+            for stage in self._open:
+                stage.peak_rss = max(stage.peak_rss, rss)
+                stage.peak_traced = max(stage.peak_traced, traced)
+            self._peak_rss = max(self._peak_rss, rss)
+            self._peak_traced = max(self._peak_traced, traced)
+            if len(_active) > 1:
+                return
+            if self.rss_resettable:
+                _reset_peak_rss()
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+
+    def enter(self, name: str) -> _Stage:
+        self._mark_peaks()
+        stage = _Stage(name, tracemalloc.is_tracing())
+        self._open.append(stage)
+        return stage
+
+    def exit(self, stage: _Stage) -> None:
+        self._mark_peaks()
+        self._open.remove(stage)
+        entry = {
+            "stage": stage.name,
+            "wall_seconds": round(time.perf_counter() - stage.wall, 4),
+            "cpu_seconds": round(time.process_time() - stage.cpu, 4),
+            "peak_rss_mb": round(stage.peak_rss / _MB, 1),
+            "rss_delta_mb": round((_rss_bytes() - stage.rss) / _MB, 1),
+        }
+        if stage.traced:
+            entry["traced_peak_mb"] = round(stage.peak_traced / _MB, 2)
+        self.stages.append(entry)
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        """Takes status and model version from a training result dict."""
+        if "error" in result:
+            self.status, self.error = "skipped", str(result["error"])
+        else:
+            self.status = "trained"
+            self.model_version = result.get("model_version")
+
+    def stop(self) -> None:
+        global _tracers
+        self._mark_peaks()
+        with _active_lock:
+            _active.discard(self)
+            if self._started_tracing:
+                _tracers -= 1
+                if not _tracers:
+                    tracemalloc.stop()
+
+    def report(self) -> Dict[str, Any]:
+        report = {
+            "user_id": self.user_id,
+            "kind": self.kind,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "wall_seconds": round(time.perf_counter() - self._wall, 4),
+            "cpu_seconds": round(time.process_time() - self._cpu, 4),
+            "peak_rss_mb": round(self._peak_rss / _MB, 1),
+            "rss_peak_scope": "stage" if self.rss_resettable and not self.concurrent else "process",
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "stages": self.stages,
+        }
+        if self.concurrent:
+            # Peaks (and CPU time) include the overlapping runs' work
+            report["concurrent"] = True
+        if self._trace:
+            report["traced_peak_mb"] = round(self._peak_traced / _MB, 2)
+        if self.model_version:
+            report["model_version"] = self.model_version
+        if self.error:
+            report["error"] = self.error
+        return report
+
+
+@contextmanager
+def training_run(user_id: str, kind: str):
+    """
+    Records the enclosed training as a TrainingRun and stores its report
+    (data.loader.save_training_run) when the block ends, failed runs included.
+    """
+    run = TrainingRun(user_id, kind)
+    token = _current.set(run)
+    run.start()
+    try:
+        yield run
+    except Exception as e:
+        run.status = "failed"
+        run.error = str(getattr(e, "detail", None) or e)
+        raise
+    finally:
+        run.stop()
+        _current.reset(token)
+        report = run.report()
+        logger.info(
+            f"[TRAIN-RUN] {user_id} {kind} {report['status']}: {report['wall_seconds']}s wall, "
+            f"{report['cpu_seconds']}s CPU, peak RSS {report['peak_rss_mb']} MB"
+        )
+        try:
+            from data.loader import save_training_run
+            save_training_run(user_id, report)
+        except Exception as e:
+            logger.warning(f"[WARN] Could not store training run report: {e}")
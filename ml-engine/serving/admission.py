@@ -0,0 +1,116 @@
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# Request header: milliseconds the caller is still willing to wait for the answer
+DEADLINE_HEADER = "x-request-deadline-ms"
+DEGRADED_HEADER = "x-shopfusion-degraded"
+
+# Rejection reasons (also the outcome label of shopfusion_admission_total)
+QUEUE_FULL = "queue_full"
+DEADLINE = "deadline"
+TIMEOUT = "timeout"
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limit plus a bounded FIFO wait queue for one request class,
+    enforced on the event loop before a worker thread is taken.
+
+    A request is rejected right away when the queue is full, or when its
+    expected queueing time plus the typical service time would overrun the
+    caller's deadline. A queued request that is still waiting after max_wait
+    (or its deadline) is rejected as well. limit 0 admits everything.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of the admitted requests' service time (seconds)
+        self.service_time = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        """Queueing time a request arriving now should expect."""
+        if self.active < self.limit and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) / self.limit * self.service_time
+
+    async def admit(self, remaining: Optional[float] = None) -> Optional[str]:
+        """
+        Takes a slot, waiting if needed; remaining is the caller's time budget in seconds.
+        Returns None when admitted, else the rejection reason.
+        """
+        if not self.limit:
+            return None
+        budget = self.max_wait if remaining is None else min(self.max_wait, remaining - self.service_time)
+        if self.active < self.limit and not self._waiters:
+            if budget < 0:
+                return DEADLINE
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.queue:
+            return QUEUE_FULL
+        if budget <= 0 or self.expected_wait() > budget:
+            return DEADLINE
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), budget)
+            return None
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(0.0)
+                    raise
+                return None
+            waiter.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return TIMEOUT
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, seconds: float) -> None:
+        """Frees the slot (handing it to the oldest waiter) and folds the service time into the average."""
+        if not self.limit:
+            return
+        if seconds > 0:
+            self.service_time = seconds if not self.service_time else 0.9 * self.service_time + 0.1 * seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "max_wait_seconds": self.max_wait,
+            "active": self.active,
+            "waiting": self.waiting,
+            "service_seconds": round(self.service_time, 4),
+        }
+
+
+def remaining_budget(headers: Any) -> Optional[float]:
+    """Seconds the caller allows (deadline header), or None when absent or malformed."""
+    value = headers.get(DEADLINE_HEADER)
+    if not value:
+        return None
+    try:
+        return float(value) / 1000.0
+    except ValueError:
+        return None
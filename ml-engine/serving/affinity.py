@@ -0,0 +1,232 @@
+import bisect
+import hashlib
+import hmac
+import http.client
+import logging
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from config import (
+    AFFINITY_MODE, AFFINITY_PEERS, AFFINITY_PEERS_DNS, AFFINITY_PORT, AFFINITY_REFRESH_INTERVAL,
+    AFFINITY_RETRY_AFTER, AFFINITY_SECRET, AFFINITY_SELF, AFFINITY_TIMEOUT, AFFINITY_VNODES
+)
+
+logger = logging.getLogger(__name__)
+
+# Set on forwarded requests: the receiving pod serves them itself, so a peer-list disagreement cannot loop
+FORWARDED_HEADER = "x-shopfusion-forwarded"
+# Shared secret proving a forwarded request (or a peer-list change) comes from a peer
+PEER_TOKEN_HEADER = "x-shopfusion-peer-token"
+SERVED_BY_HEADER = "x-shopfusion-served-by"
+
+# Hop-by-hop headers are not copied onto the forwarded request / relayed response
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "host", "content-length"}
+
+
+class PeerUnreachable(Exception):
+    """The owner could not be connected to; nothing was sent, so the request may be served locally."""
+
+
+def _peer_hosts(peers: Iterable[str]) -> Set[str]:
+    """Addresses of the peers (host names resolved where possible), to recognise their requests."""
+    hosts = set()
+    for peer in peers:
+        host = urlsplit(peer).hostname
+        if not host:
+            continue
+        hosts.add(host)
+        try:
+            hosts.update(info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM))
+        except OSError:
+            pass
+    return hosts
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing: every peer owns vnodes points on a 64-bit ring and a
+    key belongs to the first point at or after its hash. Adding or removing
+    one of n peers moves only about 1/n of the keys.
+    """
+
+    def __init__(self, peers: Iterable[str] = (), vnodes: int = AFFINITY_VNODES):
+        self.peers: List[str] = sorted(set(peers))
+        points = sorted((_hash(f"{peer}#{i}"), peer) for peer in self.peers for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [p for _, p in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        i = bisect.bisect_left(self._hashes, _hash(str(key)))
+        return self._owners[i % len(self._owners)]
+
+
+class TenantAffinity:
+    """
+    Which pod serves a retailer, and how requests reach it.
+
+    Off unless this pod's own URL is one of at least two peers. The owner of a
+    retailer serves it from its own registry, catalog and caches. Other pods
+    forward (or redirect) to it. An owner that cannot be reached is served
+    locally for retry_after seconds instead of failing the request. A request
+    marked as forwarded skips routing only when from_peer() accepts it.
+    """
+
+    def __init__(
+        self,
+        peers: Iterable[str] = AFFINITY_PEERS,
+        self_url: str = AFFINITY_SELF,
+        mode: str = AFFINITY_MODE,
+        dns_name: str = AFFINITY_PEERS_DNS,
+        port: int = AFFINITY_PORT,
+        refresh_interval: float = AFFINITY_REFRESH_INTERVAL,
+        timeout: float = AFFINITY_TIMEOUT,
+        retry_after: float = AFFINITY_RETRY_AFTER,
+        secret: str = AFFINITY_SECRET
+    ):
+        self.self_url = self_url
+        self.mode = mode
+        self.dns_name = dns_name
+        self.port = port
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.secret = secret
+        self.ring = HashRing(peers)
+        self._peer_hosts = _peer_hosts(self.ring.peers)
+        self._down: Dict[str, float] = {}
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and len(self.ring.peers) > 1 and self.self_url in self.ring.peers
+
+    def owner(self, user_id: str) -> Optional[str]:
+        """The peer that should serve this retailer, or None when this pod serves it itself."""
+        if not self.enabled:
+            return None
+        owner = self.ring.owner(str(user_id))
+        if owner == self.self_url or self._down.get(owner, 0.0) > time.monotonic():
+            return None
+        return owner
+
+    def owns(self, user_id: str) -> bool:
+        """Whether this pod keeps the retailer's models / catalog (an unreachable owner does not count)."""
+        return not self.enabled or self.ring.owner(str(user_id)) == self.self_url
+
+    def from_peer(self, headers: Any, client_host: Optional[str]) -> bool:
+        """Whether a request was sent by a peer: the shared secret when one is set, else a peer's address."""
+        if self.secret:
+            return hmac.compare_digest(headers.get(PEER_TOKEN_HEADER, "").encode(), self.secret.encode())
+        return bool(client_host) and client_host in self._peer_hosts
+
+    def mark_down(self, peer: str) -> None:
+        logger.warning(f"[AFFINITY] {peer} unreachable; serving its retailers locally for {self.retry_after:.0f}s")
+        self._down[peer] = time.monotonic() + self.retry_after
+
+    # --- peer list ---
+
+    def set_peers(self, peers: Iterable[str]) -> bool:
+        """Rebuilds the ring when the peer set changed; listeners then release retailers moved away."""
+        peers = sorted({p.rstrip("/") for p in peers})
+        if peers == self.ring.peers:
+            return False
+        hosts = _peer_hosts(peers)
+        with self._lock:
+            if peers == self.ring.peers:
+                return False
+            self.ring = HashRing(peers)
+            self._peer_hosts = hosts
+            listeners = list(self._listeners)
+        logger.info(f"[AFFINITY] Peers changed: {peers}")
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"[WARN] Affinity listener failed: {e}")
+        return True
+
+    def subscribe(self, listener: Callable[[], None]) -> None:
+        """Registers listener(), called after every peer-set change."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def resolve_peers(self) -> Optional[List[str]]:
+        """Pod IPs behind the headless Service (ready pods only), as base URLs. None on DNS errors."""
+        try:
+            infos = socket.getaddrinfo(self.dns_name, self.port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            logger.warning(f"[AFFINITY] Could not resolve {self.dns_name}: {e}")
+            return None
+        return sorted({f"http://{info[4][0]}:{self.port}" for info in infos})
+
+    def start_discovery(self) -> None:
+        """Follows the headless Service in a daemon thread so pods joining / leaving rebalance the ring."""
+        if not self.dns_name or self._thread is not None:
+            return
+
+        def _loop():
+            while True:
+                peers = self.resolve_peers()
+                if peers:
+                    self.set_peers(peers)
+                time.sleep(self.refresh_interval)
+
+        self._thread = threading.Thread(target=_loop, name="shopfusion-affinity", daemon=True)
+        self._thread.start()
+
+    # --- forwarding ---
+
+    def forward(
+        self,
+        peer: str,
+        method: str,
+        path: str,
+        headers: Iterable[Tuple[str, str]],
+        body: bytes = b"",
+        timeout: Optional[float] = None
+    ) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """
+        Sends the request to peer and returns (status, headers, body); timeout None waits indefinitely
+        for the answer. Raises PeerUnreachable when the connection fails; other errors propagate.
+        """
+        target = urlsplit(peer)
+        # Connecting is always bounded, even when the answer may take long (training)
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=self.timeout)
+        try:
+            try:
+                conn.connect()
+            except OSError as e:
+                raise PeerUnreachable(f"{peer}: {e}") from e
+            conn.sock.settimeout(timeout)
+            out_headers = {k: v for k, v in headers if k.lower() not in _HOP_HEADERS
+                           and k.lower() not in (FORWARDED_HEADER, PEER_TOKEN_HEADER)}
+            out_headers[FORWARDED_HEADER] = self.self_url
+            if self.secret:
+                out_headers[PEER_TOKEN_HEADER] = self.secret
+            conn.request(method, path, body=body or None, headers=out_headers)
+            response = conn.getresponse()
+            content = response.read()
+            relayed = [(k, v) for k, v in response.getheaders() if k.lower() not in _HOP_HEADERS]
+            return response.status, relayed, content
+        finally:
+            conn.close()
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "self": self.self_url,
+            "peers": self.ring.peers,
+            "down": sorted(p for p, until in self._down.items() if until > time.monotonic()),
+        }
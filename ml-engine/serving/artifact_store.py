@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import MODEL_DIR, MODEL_MMAP, MODEL_MMAP_MIN_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Older versions kept per retailer (for rollback / debugging)
+KEEP_VERSIONS = 2
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Writes large NumPy arrays (CSR components, CF matrices, ...) to .npy files instead of inline."""
+
+    def __init__(self, file, array_dir: str, min_bytes: int):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.array_dir = array_dir
+        self.min_bytes = min_bytes
+        self.count = 0
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < self.min_bytes:
+            return None
+        name = f"{self.count}.npy"
+        self.count += 1
+        np.save(os.path.join(self.array_dir, name), obj, allow_pickle=False)
+        return ("npy", name)
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    """Maps externalized arrays read-only: workers share one page-cache copy instead of each holding its own."""
+
+    def __init__(self, file, array_dir: str, mmap: bool):
+        super().__init__(file)
+        self.array_dir = array_dir
+        self.mmap = mmap
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != "npy":
+            raise pickle.UnpicklingError(f"unknown persistent id {pid!r}")
+        return np.load(os.path.join(self.array_dir, name), mmap_mode="r" if self.mmap else None, allow_pickle=False)
+
+
+class ArtifactStore:
+    """
+    Persists fitted engines per retailer so a restarted pod can serve
+    immediately instead of waiting for the next /api/train call.
+
+    Layout: <root>/<user_id>/<version>/models.pkl (and meta.json describing
+    the training data), plus a LATEST pointer file.
+    Arrays of at least min_bytes go to <version>/arrays/<n>.npy and are
+    memory-mapped on load when mmap is on, so every uvicorn worker serving
+    the retailer shares them zero-copy. Published versions are never
+    rewritten, and pruned files stay valid for workers that still map them.
+    """
+
+    def __init__(self, root: str = MODEL_DIR, mmap: bool = MODEL_MMAP, min_bytes: int = MODEL_MMAP_MIN_BYTES):
+        self.root = root
+        self.mmap = mmap
+        self.min_bytes = min_bytes
+
+    def _tenant_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, str(user_id))
+
+    def save(self, user_id: str, version: str, artifacts: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Writes artifacts (and optional JSON metadata) atomically and moves LATEST. Returns the directory, or None on failure."""
+        tenant_dir = self._tenant_dir(user_id)
+        version_dir = os.path.join(tenant_dir, version)
+        tmp_dir = version_dir + ".tmp"
+        try:
+            os.makedirs(os.path.join(tmp_dir, "arrays"), exist_ok=True)
+            with open(os.path.join(tmp_dir, "models.pkl"), "wb") as f:
+                _ArrayPickler(f, os.path.join(tmp_dir, "arrays"), self.min_bytes).dump(artifacts)
+            if meta is not None:
+                with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                    json.dump(meta, f)
+            os.replace(tmp_dir, version_dir)
+
+            pointer_tmp = os.path.join(tenant_dir, "LATEST.tmp")
+            with open(pointer_tmp, "w") as f:
+                f.write(version)
+            os.replace(pointer_tmp, os.path.join(tenant_dir, "LATEST"))
+
+            self._prune(user_id, keep=version)
+            return version_dir
+        except OSError as e:
+            # Read-only filesystems (e.g. serverless) simply run without persistence
+            logger.warning(f"[WARN] Could not persist models for {user_id}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+
+    def latest_version(self, user_id: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self._tenant_dir(user_id), "LATEST")) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def load(self, user_id: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        version = version or self.latest_version(user_id)
+        if not version:
+            return None
+        version_dir = os.path.join(self._tenant_dir(user_id), version)
+        try:
+            with open(os.path.join(version_dir, "models.pkl"), "rb") as f:
+                artifacts = _ArrayUnpickler(f, os.path.join(version_dir, "arrays"), self.mmap).load()
+            artifacts["version"] = version
+            return artifacts
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"[WARN] Could not load models for {user_id}@{version}: {e}")
+            return None
+
+    def meta(self, user_id: str, version: Optional[str] = None) -> Dict[str, Any]:
+        """Metadata saved with a version (the latest by default); {} when there is none."""
+        version = version or self.latest_version(user_id)
+        if not version:
+            return {}
+        try:
+            with open(os.path.join(self._tenant_dir(user_id), version, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def retailers(self) -> List[str]:
+        """Retailers that have at least one published version on disk."""
+        try:
+            return [d for d in os.listdir(self.root) if os.path.isfile(os.path.join(self.root, d, "LATEST"))]
+        except OSError:
+            return []
+
+    def _prune(self, user_id: str, keep: str) -> None:
+        tenant_dir = self._tenant_dir(user_id)
+        versions = sorted(
+            d for d in os.listdir(tenant_dir)
+            if os.path.isdir(os.path.join(tenant_dir, d)) and not d.endswith(".tmp")
+        )
+        for old in versions[:-KEEP_VERSIONS]:
+            if old != keep:
+                shutil.rmtree(os.path.join(tenant_dir, old), ignore_errors=True)
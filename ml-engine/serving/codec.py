@@ -0,0 +1,109 @@
+import json
+from typing import Any, Dict
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response
+
+# Optional fast encoders; plain json / JSON arrays are used when they are not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+SCORE_PROTOCOL_VERSION = 1
+
+# Little-endian wire dtypes of the scoring arrays (raw bytes in msgpack, lists in JSON)
+SCORE_ARRAYS = {
+    "kind": "u1",        # 0 individual, 1 bundle
+    "score": "<f4",
+    "urgent": "u1",
+    "offsets": "<i4",    # entry i covers rows[offsets[i]:offsets[i + 1]]
+    "rows": "<i4",       # row numbers into the catalog ids list
+    "lift": "<f4",       # NaN (JSON: null) for individual items
+    "confidence": "<f4",
+    "near_expiry": "<i4",
+}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """Serializes without FastAPI's jsonable_encoder pass (orjson when available)."""
+    if orjson is not None:
+        body = orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def wants_msgpack(request: Request, fmt: str = "") -> bool:
+    if fmt:
+        return fmt.lower() == "msgpack"
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _nan_to_none(values: np.ndarray) -> list:
+    return [None if v != v else v for v in values.tolist()]
+
+
+def binary_response(payload: Dict[str, Any], use_msgpack: bool) -> Response:
+    """
+    msgpack with SCORE_ARRAYS fields as raw little-endian bytes (zero-copy typed
+    arrays on the client), or JSON with plain lists when msgpack is not
+    requested or not installed. Clients tell them apart by Content-Type.
+    """
+    if use_msgpack and msgpack is not None:
+        body = {
+            k: np.ascontiguousarray(v, dtype=SCORE_ARRAYS[k]).tobytes() if k in SCORE_ARRAYS else v
+            for k, v in payload.items()
+        }
+        return Response(msgpack.packb(body, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE)
+
+    body = {}
+    for k, v in payload.items():
+        if k in SCORE_ARRAYS:
+            v = np.asarray(v, dtype=SCORE_ARRAYS[k])
+            v = _nan_to_none(v) if v.dtype.kind == "f" else v.tolist()
+        body[k] = v
+    return json_response(body)
+
+
+def score_payload(ranked: Any, model_version: str) -> Dict[str, Any]:
+    """Scoring API body for a fusion.recommender.RankedFeed."""
+    payload = {
+        "v": SCORE_PROTOCOL_VERSION,
+        "model_version": model_version,
+        "catalog": ranked.products.fingerprint,
+        "n": len(ranked),
+        "kind": ranked.kinds,
+        "score": ranked.scores,
+        "urgent": ranked.urgent,
+        "offsets": ranked.offsets,
+        "rows": ranked.rows,
+        "lift": ranked.lift,
+        "confidence": ranked.confidence,
+        "near_expiry": ranked.near_expiry,
+        # Shared reason of the individual items (bundles are "Frequently bought together")
+        "reason": ranked.reason,
+    }
+    if ranked.fallback:
+        payload["fallback"] = True
+    return payload
+
+
+def catalog_payload(products: Any) -> Dict[str, Any]:
+    """Row number -> productId list that scoring responses with the same fingerprint refer to."""
+    return {"v": SCORE_PROTOCOL_VERSION, "catalog": products.fingerprint, "ids": products.ids}
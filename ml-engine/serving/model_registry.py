@@ -0,0 +1,108 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TenantModels:
+    """Fitted engines for one retailer, tagged with the version they were published under."""
+
+    def __init__(self, user_id: str, version: str, content_engine: Any = None, collab_engine: Any = None, popularity: Any = None):
+        self.user_id = user_id
+        self.version = version
+        self.content_engine = content_engine
+        self.collab_engine = collab_engine
+        self.popularity = popularity
+        self.published_at = datetime.now(timezone.utc)
+
+
+class ModelRegistry:
+    """
+    Holds the currently served model version per retailer.
+    Publishing a new version notifies subscribers (e.g. the response cache)
+    so anything derived from the previous version can be dropped.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, TenantModels] = {}
+        self._listeners: List[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_version() -> str:
+        """Sortable, unique-enough version id (UTC timestamp with microseconds)."""
+        return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+
+    def get(self, user_id: str) -> Optional[TenantModels]:
+        return self._models.get(str(user_id))
+
+    def version(self, user_id: str) -> str:
+        models = self._models.get(str(user_id))
+        return models.version if models else ""
+
+    def publish(self, user_id: str, content_engine: Any = None, collab_engine: Any = None, popularity: Any = None) -> str:
+        """Swaps in freshly trained engines for a retailer and returns the new version."""
+        user_id = str(user_id)
+        with self._lock:
+            version = self.new_version()
+            previous = self._models.get(user_id)
+            if previous and version <= previous.version:
+                # Two publishes inside the same microsecond: keep versions strictly increasing
+                version = previous.version + "1"
+            self._models[user_id] = TenantModels(user_id, version, content_engine, collab_engine, popularity)
+            listeners = list(self._listeners)
+
+        self._notify(listeners, user_id, version)
+        return version
+
+    def install(self, user_id: str, version: str, content_engine: Any = None, collab_engine: Any = None, popularity: Any = None) -> bool:
+        """
+        Serves an already-versioned artifact (e.g. warm-loaded from disk).
+        Ignored if a newer version has been published meanwhile.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            current = self._models.get(user_id)
+            if current and current.version >= version:
+                return False
+            self._models[user_id] = TenantModels(user_id, version, content_engine, collab_engine, popularity)
+            listeners = list(self._listeners)
+
+        self._notify(listeners, user_id, version)
+        return True
+
+    def remap(self, user_id: str, version: str, content_engine: Any = None, collab_engine: Any = None, popularity: Any = None) -> bool:
+        """
+        Replaces the engines of the version being served with equivalent ones
+        (e.g. the persisted, memory-mapped copy). No-op if another version took over.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            current = self._models.get(user_id)
+            if current is None or current.version != version:
+                return False
+            self._models[user_id] = TenantModels(user_id, version, content_engine, collab_engine, popularity)
+        return True
+
+    def drop(self, user_id: str) -> bool:
+        """Stops serving a retailer from this process (e.g. it moved to another pod)."""
+        with self._lock:
+            return self._models.pop(str(user_id), None) is not None
+
+    def retailers(self) -> List[str]:
+        return list(self._models)
+
+    @staticmethod
+    def _notify(listeners, user_id: str, version: str) -> None:
+        for listener in listeners:
+            try:
+                listener(user_id, version)
+            except Exception as e:
+                logger.warning(f"[WARN] Model publish listener failed: {e}")
+
+    def subscribe(self, listener: Callable[[str, str], None]) -> None:
+        """Registers listener(user_id, new_version), called after every publish."""
+        with self._lock:
+            self._listeners.append(listener)
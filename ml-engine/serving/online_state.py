@@ -0,0 +1,297 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import ONLINE_COMPACT_EVERY, ONLINE_NEIGHBOURS
+
+logger = logging.getLogger(__name__)
+
+
+class OnlineState:
+    """
+    Real-time shopper-item and item co-occurrence counts for one retailer.
+
+    Compacted counts live in CSR matrices. Baskets that arrive between
+    compactions go into small dict deltas. Neighbour lists (cosine over
+    co-occurrence) are rebuilt for every item at compaction. Items touched
+    since then are recomputed on read from their base row plus the delta.
+    """
+
+    def __init__(
+        self,
+        item_ids: Optional[List[str]] = None,
+        item_counts: Optional[np.ndarray] = None,
+        pair_counts: Optional[sparse.spmatrix] = None,
+        shopper_ids: Optional[List[str]] = None,
+        user_item: Optional[sparse.spmatrix] = None,
+        n_baskets: float = 0.0,
+        neighbours: int = ONLINE_NEIGHBOURS,
+        compact_every: int = ONLINE_COMPACT_EVERY
+    ):
+        self.neighbours = neighbours
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+
+        self._item_ids: List[str] = list(item_ids or [])
+        self._item_index = {item: i for i, item in enumerate(self._item_ids)}
+        self._shopper_ids: List[str] = list(shopper_ids or [])
+        self._shopper_index = {s: i for i, s in enumerate(self._shopper_ids)}
+        n_items, n_shoppers = len(self._item_ids), len(self._shopper_ids)
+
+        self._item_counts = np.asarray(item_counts if item_counts is not None else np.zeros(n_items), dtype=np.float64)
+        pairs = sparse.csr_matrix(pair_counts) if pair_counts is not None else sparse.csr_matrix((n_items, n_items))
+        self._pairs = (pairs + pairs.T).tocsr()  # symmetric; input is upper-triangular
+        self._user_item = sparse.csr_matrix(user_item) if user_item is not None else sparse.csr_matrix((n_shoppers, n_items))
+        self.n_baskets = float(n_baskets)
+
+        self._delta_items: Counter = Counter()
+        self._delta_pairs: Dict[str, Counter] = defaultdict(Counter)
+        self._delta_user: Dict[str, Counter] = defaultdict(Counter)
+        self._delta_baskets = 0
+        self._dirty: set = set()
+        self._neighbour_lists: Dict[str, List[Tuple[str, float]]] = {}
+
+        self.events_since_compaction = 0
+        self.generation = 0
+        self._shopper_versions: Counter = Counter()
+        self._rebuild_neighbours()
+
+    # --- writes ---
+
+    def add_basket(self, shopper_id: str, items: Iterable[str]) -> None:
+        basket = sorted({str(i).strip() for i in items if i and str(i).strip()})
+        if not basket:
+            return
+        with self._lock:
+            self._delta_baskets += 1
+            for item in basket:
+                self._delta_items[item] += 1
+                if shopper_id:
+                    self._delta_user[shopper_id][item] += 1
+            for i, a in enumerate(basket):
+                for b in basket[i + 1:]:
+                    self._delta_pairs[a][b] += 1
+                    self._delta_pairs[b][a] += 1
+            self._dirty.update(basket)
+            if shopper_id:
+                self._shopper_versions[shopper_id] += 1
+            self.events_since_compaction += 1
+            if self.compact_every and self.events_since_compaction >= self.compact_every:
+                self.compact()
+
+    def compact(self) -> None:
+        """Folds deltas into the CSR base and rebuilds every neighbour list."""
+        with self._lock:
+            if not self.events_since_compaction:
+                return
+            for item in self._delta_items:
+                if item not in self._item_index:
+                    self._item_index[item] = len(self._item_ids)
+                    self._item_ids.append(item)
+            for shopper in self._delta_user:
+                if shopper not in self._shopper_index:
+                    self._shopper_index[shopper] = len(self._shopper_ids)
+                    self._shopper_ids.append(shopper)
+            n_items, n_shoppers = len(self._item_ids), len(self._shopper_ids)
+
+            counts = np.zeros(n_items)
+            counts[:len(self._item_counts)] = self._item_counts
+            for item, c in self._delta_items.items():
+                counts[self._item_index[item]] += c
+            self._item_counts = counts
+
+            self._pairs = _resize(self._pairs, (n_items, n_items)) + _delta_matrix(
+                self._delta_pairs, self._item_index, self._item_index, (n_items, n_items))
+            self._user_item = _resize(self._user_item, (n_shoppers, n_items)) + _delta_matrix(
+                self._delta_user, self._shopper_index, self._item_index, (n_shoppers, n_items))
+            self.n_baskets += self._delta_baskets
+
+            self._delta_items.clear()
+            self._delta_pairs.clear()
+            self._delta_user.clear()
+            self._delta_baskets = 0
+            self._dirty.clear()
+            self.events_since_compaction = 0
+            self.generation += 1
+            self._rebuild_neighbours()
+        logger.info(f"[ONLINE] Compacted: {n_items} items, {n_shoppers} shoppers, generation {self.generation}")
+
+    def _rebuild_neighbours(self) -> None:
+        self._neighbour_lists = {}
+        pairs = self._pairs.tocsr()
+        norms = np.sqrt(np.maximum(self._item_counts, 1.0))
+        for row, item in enumerate(self._item_ids):
+            start, end = pairs.indptr[row], pairs.indptr[row + 1]
+            if start == end:
+                continue
+            cols, values = pairs.indices[start:end], pairs.data[start:end] / (norms[row] * norms[pairs.indices[start:end]])
+            top = np.argsort(-values)[:self.neighbours]
+            self._neighbour_lists[item] = [(self._item_ids[cols[t]], float(values[t])) for t in top]
+
+    # --- reads ---
+
+    def version(self, shopper_id: str) -> str:
+        """Changes whenever this shopper's online state (or the compacted base) changes; part of cache keys."""
+        return f"{self.generation}.{self._shopper_versions.get(shopper_id, 0)}"
+
+    def shopper_items(self, shopper_id: str) -> Dict[str, float]:
+        with self._lock:
+            out: Dict[str, float] = {}
+            row = self._shopper_index.get(shopper_id)
+            if row is not None:
+                r = self._user_item.getrow(row)
+                out = {self._item_ids[c]: float(v) for c, v in zip(r.indices, r.data)}
+            for item, c in self._delta_user.get(shopper_id, {}).items():
+                out[item] = out.get(item, 0.0) + c
+            return out
+
+    def recent_items(self, shopper_id: str) -> List[str]:
+        """Items this shopper bought since the last compaction."""
+        with self._lock:
+            return list(self._delta_user.get(shopper_id, {}))
+
+    def _count(self, item: str) -> float:
+        idx = self._item_index.get(item)
+        return (self._item_counts[idx] if idx is not None and idx < len(self._item_counts) else 0.0) + self._delta_items.get(item, 0)
+
+    def neighbours_of(self, item: str) -> List[Tuple[str, float]]:
+        with self._lock:
+            if item not in self._dirty:
+                return self._neighbour_lists.get(item, [])
+            # Touched since compaction: merge base row and delta for this item only
+            co: Dict[str, float] = dict(self._delta_pairs.get(item, {}))
+            idx = self._item_index.get(item)
+            if idx is not None and idx < self._pairs.shape[0]:
+                start, end = self._pairs.indptr[idx], self._pairs.indptr[idx + 1]
+                for c, v in zip(self._pairs.indices[start:end], self._pairs.data[start:end]):
+                    other = self._item_ids[c]
+                    co[other] = co.get(other, 0.0) + float(v)
+            norm = np.sqrt(max(self._count(item), 1.0))
+            scored = sorted(
+                ((other, v / (norm * np.sqrt(max(self._count(other), 1.0)))) for other, v in co.items()),
+                key=lambda x: x[1], reverse=True
+            )[:self.neighbours]
+            self._neighbour_lists[item] = scored
+            self._dirty.discard(item)
+            return scored
+
+    def recommend(self, shopper_id: str, top_n: int = 10) -> Dict[str, float]:
+        """Item-to-item scores from the shopper's purchases (including ones made seconds ago)."""
+        owned = self.shopper_items(shopper_id)
+        scores: Dict[str, float] = defaultdict(float)
+        for item in owned:
+            for other, score in self.neighbours_of(item):
+                if other not in owned:
+                    scores[other] += score
+        top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        return {pid: round(float(score), 4) for pid, score in top}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items": len(self._item_ids),
+                "shoppers": len(self._shopper_ids),
+                "baskets": self.n_baskets + self._delta_baskets,
+                "pending_events": self.events_since_compaction,
+                "generation": self.generation,
+            }
+
+
+def _resize(matrix: sparse.spmatrix, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    m = matrix.tocsr().copy()
+    m.resize(shape)
+    return m
+
+
+def _delta_matrix(delta: Dict[str, Counter], row_index: Dict[str, int], col_index: Dict[str, int], shape: Tuple[int, int]) -> sparse.csr_matrix:
+    rows, cols, values = [], [], []
+    for key, counter in delta.items():
+        r = row_index[key]
+        for col, v in counter.items():
+            rows.append(r)
+            cols.append(col_index[col])
+            values.append(v)
+    return sparse.coo_matrix((values, (rows, cols)), shape=shape, dtype=np.float64).tocsr()
+
+
+class OnlineStore:
+    """
+    OnlineState per retailer, created on first event (optionally seeded from a loader).
+    Each retailer is seeded once: concurrent first events wait for the same seed.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, OnlineState] = {}
+        self._seeding: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+
+    def get(self, user_id: str) -> Optional[OnlineState]:
+        return self._states.get(str(user_id))
+
+    def get_or_create(self, user_id: str, seed: Optional[Callable[[], OnlineState]] = None) -> OnlineState:
+        user_id = str(user_id)
+        state = self._states.get(user_id)
+        if state is not None:
+            return state
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None:
+                return state
+            pending = self._seeding.get(user_id)
+            if pending is None:
+                pending = self._seeding[user_id] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+
+        # Seeding reads the count store: outside the store lock, other retailers are not held up
+        try:
+            fresh = seed() if seed else OnlineState()
+        except BaseException as e:
+            with self._lock:
+                self._seeding.pop(user_id, None)
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            if self._seeding.get(user_id) is pending:
+                self._states[user_id] = fresh
+                del self._seeding[user_id]
+        pending.set_result(fresh)
+        return fresh
+
+    def drop(self, user_id: str) -> None:
+        with self._lock:
+            self._states.pop(str(user_id), None)
+            self._seeding.pop(str(user_id), None)
+
+    def compact_all(self) -> None:
+        for user_id, state in list(self._states.items()):
+            try:
+                state.compact()
+            except Exception as e:
+                logger.warning(f"[ONLINE] Compaction failed for {user_id}: {e}")
+
+    def start_compaction(self, interval: float) -> None:
+        """
+        Compacts every retailer in a daemon thread each 'interval' seconds, so a quiet
+        retailer's events do not sit in deltas until compact_every of them arrive.
+        """
+        if interval <= 0 or self._compactor is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.compact_all()
+
+        self._compactor = threading.Thread(target=loop, name="shopfusion-online-compact", daemon=True)
+        self._compactor.start()
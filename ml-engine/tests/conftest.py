@@ -0,0 +1,80 @@
+"""
+Shared fixtures: the app against the in-memory database stand-in
+(loadtest/memory_db.py), with model and count stores in a temp directory.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_STORE = tempfile.mkdtemp(prefix="shopfusion-tests-")
+os.environ.setdefault("MODEL_DIR", os.path.join(_STORE, "models"))
+os.environ.setdefault("COUNT_STORE_DIR", os.path.join(_STORE, "counts"))
+
+
+@pytest.fixture(scope="session")
+def database():
+    import db as db_module
+    from data.loader import PRODUCTS_COL, TRANSACTIONS_COL
+    from loadtest.memory_db import MemoryDatabase
+
+    database = MemoryDatabase()
+    database[PRODUCTS_COL].create_index("user")
+    database[TRANSACTIONS_COL].create_index("user")
+    database[TRANSACTIONS_COL].create_index("shopperId")
+    database["associationrules"].create_index("userId")
+    db_module.set_db(database)
+    return database
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+def seed_retailer(database, skus, baskets):
+    """
+    Stores a new retailer with one product per SKU and one transaction per
+    (shopperId, [SKU, ...]) basket. Returns the retailer id.
+    """
+    from bson import ObjectId
+    from data.loader import PRODUCTS_COL, TRANSACTIONS_COL
+
+    retailer = ObjectId()
+    now = datetime.now(timezone.utc)
+    refs = {sku: ObjectId() for sku in skus}
+    database[PRODUCTS_COL].insert_many([{
+        "_id": refs[sku],
+        "user": retailer,
+        "productId": sku,
+        "name": f"Product {sku}",
+        "category": "Pantry",
+        "price": 5.0,
+        "description": f"Product {sku} from the pantry range",
+        "stock": 100,
+        "features": ["pantry"],
+        "expiryDate": None,
+        "status": "ACTIVE",
+        "discount": 0,
+        "createdAt": now - timedelta(days=30),
+        "updatedAt": now - timedelta(days=30),
+    } for sku in skus])
+    database[TRANSACTIONS_COL].insert_many([{
+        "_id": ObjectId(),
+        "transactionId": f"TXN{n:06d}",
+        "shopperId": shopper,
+        "items": [{"productId": sku, "productRef": refs[sku], "quantity": 1, "price": 5.0} for sku in basket],
+        "totalAmount": 5.0 * len(basket),
+        "timestamp": now - timedelta(hours=n + 1),
+        "createdAt": now - timedelta(hours=n + 1),
+        "user": retailer,
+    } for n, (shopper, basket) in enumerate(baskets)])
+    return str(retailer)
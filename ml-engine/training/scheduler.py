@@ -0,0 +1,206 @@
+"""
+Batch training for every retailer, sized by data volume.
+
+    cd ml-engine
+    python -m training.scheduler --workers 4 --memory-mb 8192 --output run.json
+    python -m training.scheduler --retailers <id> <id> --force
+
+Retailers are read from two $group aggregations (product and transaction
+counts with their newest timestamps). A retailer whose counts and timestamps
+match the data stamp saved with its latest model version is skipped. The others
+are ordered smallest first and packed onto a process pool: a job starts only
+while the estimated peak memory of the running jobs stays under the budget.
+Each job runs the same pipeline as /api/train in a fresh process and publishes
+to the artifact store, where serving workers pick it up (MODEL_SYNC_INTERVAL).
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TRAIN_SCHEDULER_MEMORY_MB, TRAIN_SCHEDULER_WORKERS  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Cost model for one full training run, linear in data volume. Calibrated on the
+# synthetic benchmark tenants (peak RSS of a fresh process, wall time on one core).
+BASE_MB = 200.0                  # interpreter + numpy / pandas / scikit-learn
+MB_PER_1K_TRANSACTIONS = 3.2     # transaction dicts, baskets, CF pivot
+MB_PER_1K_PRODUCTS = 4.0         # catalog dicts, TF-IDF matrix
+BASE_SECONDS = 2.5               # imports
+SECONDS_PER_1K_TRANSACTIONS = 0.16
+SECONDS_PER_1K_PRODUCTS = 0.05
+
+
+def estimate_cost(products: int, transactions: int) -> Tuple[float, float]:
+    """(peak MB, seconds) expected for training a retailer of this size."""
+    memory_mb = BASE_MB + MB_PER_1K_TRANSACTIONS * transactions / 1000 + MB_PER_1K_PRODUCTS * products / 1000
+    seconds = BASE_SECONDS + SECONDS_PER_1K_TRANSACTIONS * transactions / 1000 + SECONDS_PER_1K_PRODUCTS * products / 1000
+    return memory_mb, seconds
+
+
+class TenantJob:
+    """One retailer's training run: its data stamp, cost estimate and outcome."""
+
+    def __init__(self, user_id: str, stamp: Dict[str, Any]):
+        self.user_id = user_id
+        self.stamp = stamp
+        self.memory_mb, self.estimated_seconds = estimate_cost(stamp["products"], stamp["transactions"])
+        self.status = "pending"
+        self.reason: Optional[str] = None
+        self.result: Dict[str, Any] = {}
+
+    def report(self) -> Dict[str, Any]:
+        out = {
+            "user_id": self.user_id,
+            "status": self.status,
+            "products": self.stamp["products"],
+            "transactions": self.stamp["transactions"],
+            "estimated_mb": round(self.memory_mb, 1),
+            "estimated_seconds": round(self.estimated_seconds, 2),
+        }
+        if self.reason:
+            out["reason"] = self.reason
+        out.update(self.result)
+        return out
+
+
+def _train_tenant(user_id: str) -> Dict[str, Any]:
+    """Pool entry point: runs the /api/train pipeline for one retailer in this (fresh) process."""
+    import resource
+    from fastapi import HTTPException
+
+    start = time.perf_counter()
+    import app
+    try:
+        result = app._train_models(user_id)
+    except HTTPException as e:
+        return {"status": "failed", "error": str(e.detail), "seconds": round(time.perf_counter() - start, 2)}
+
+    out = {
+        "status": "failed" if "error" in result else "trained",
+        "seconds": round(time.perf_counter() - start, 2),
+        # ru_maxrss is in KiB on Linux; one task per process, so this is the job's own peak
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if "error" in result:
+        out["error"] = result["error"]
+    else:
+        out["model_version"] = result.get("model_version")
+        out["rules_generated"] = result.get("rules_generated")
+    return out
+
+
+class TrainingScheduler:
+    """Plans and runs one batch training pass over all (or the given) retailers."""
+
+    def __init__(self, workers: Optional[int] = TRAIN_SCHEDULER_WORKERS, memory_mb: float = TRAIN_SCHEDULER_MEMORY_MB, store=None):
+        from serving.artifact_store import ArtifactStore
+
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_mb = memory_mb
+        self.store = store or ArtifactStore()
+
+    def plan(self, stats: Dict[str, Dict[str, Any]], user_ids: Optional[Iterable[str]] = None, force: bool = False) -> List[TenantJob]:
+        """Every selected retailer as a job; skipped ones already carry their status and reason."""
+        selected = [str(u) for u in user_ids] if user_ids else sorted(stats)
+        empty = {"products": 0, "products_updated": None, "transactions": 0, "last_transaction": None}
+        jobs = []
+        for user_id in selected:
+            job = TenantJob(user_id, stats.get(user_id, empty))
+            if not job.stamp["products"] or not job.stamp["transactions"]:
+                job.status, job.reason = "skipped", "insufficient data"
+            elif not force and self.store.meta(user_id).get("data") == job.stamp:
+                job.status, job.reason = "skipped", "unchanged since last version"
+            jobs.append(job)
+        return jobs
+
+    def run(self, user_ids: Optional[Iterable[str]] = None, force: bool = False) -> Dict[str, Any]:
+        from data.loader import load_tenant_stats
+
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        jobs = self.plan(load_tenant_stats(), user_ids, force)
+        pending = [j for j in jobs if j.status == "pending"]
+        logger.info(f"[SCHEDULER] {len(pending)} of {len(jobs)} retailers to train on {self.workers} workers, {self.memory_mb:.0f} MB budget")
+
+        self._execute(pending)
+
+        counts = {status: sum(1 for j in jobs if j.status == status) for status in ("trained", "skipped", "failed")}
+        report = {
+            "started_at": started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "seconds": round(time.perf_counter() - start, 2),
+            "workers": self.workers,
+            "memory_budget_mb": self.memory_mb,
+            "tenants": len(jobs),
+            **counts,
+            # Small tenants first, in the order they were scheduled
+            "jobs": [j.report() for j in sorted(jobs, key=lambda j: (j.status == "skipped", j.memory_mb))],
+        }
+        logger.info(
+            f"[SCHEDULER] Run finished in {report['seconds']}s: {counts['trained']} trained, "
+            f"{counts['skipped']} skipped, {counts['failed']} failed"
+        )
+        return report
+
+    def _execute(self, jobs: List[TenantJob]) -> None:
+        pending = sorted(jobs, key=lambda j: (j.memory_mb, j.estimated_seconds))
+        if not pending:
+            return
+        running: Dict[Future, TenantJob] = {}
+        used_mb = 0.0
+        # spawn + one task per child: every job starts from a clean process and returns its memory when done
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"), max_tasks_per_child=1) as pool:
+            while pending or running:
+                # First fit, smallest first; a job larger than the whole budget runs alone
+                for job in list(pending):
+                    if len(running) >= self.workers:
+                        break
+                    if used_mb + job.memory_mb <= self.memory_mb or not running:
+                        pending.remove(job)
+                        job.status = "running"
+                        running[pool.submit(_train_tenant, job.user_id)] = job
+                        used_mb += job.memory_mb
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    used_mb -= job.memory_mb
+                    try:
+                        job.result = future.result()
+                        job.status = job.result.pop("status")
+                    except Exception as e:
+                        job.status, job.result = "failed", {"error": str(e)}
+                    logger.info(f"[SCHEDULER] {job.user_id}: {job.status} ({job.result.get('seconds', '?')}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=TRAIN_SCHEDULER_WORKERS, help="concurrent training processes (default: all cores)")
+    parser.add_argument("--memory-mb", type=float, default=TRAIN_SCHEDULER_MEMORY_MB, help="estimated peak memory allowed across running jobs")
+    parser.add_argument("--retailers", nargs="*", help="only these retailer ids")
+    parser.add_argument("--force", action="store_true", help="retrain even when the data is unchanged")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    report = TrainingScheduler(args.workers, args.memory_mb).run(args.retailers, args.force)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()